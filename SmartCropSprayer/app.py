@@ -1,54 +1,382 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, g, Response, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-from PIL import Image
+import time
+import uuid
+import hmac
+import gzip
 import io
-from datetime import datetime
-from disease_detection import DiseaseDetector
+import zlib
+from datetime import datetime, timedelta, timezone
+from disease_detection import DiseaseDetector, SimilarCases, DiseaseModelRegistry, ModelUnavailable, load_manifests
 from crop_prediction import CropPredictor
 from chatbot import FarmingAssistant
 from chatbot.offline_chatbot import OfflineFarmingChatbot
 from chatbot.enhanced_chatbot import EnhancedFarmingChatbot
-from database import FarmingHistoryManager
+from database import FarmingHistoryManager, ImageArchive, EmbeddingStore, ingest
+from monitoring import process_memory, format_memory, metrics, RequestProfiler, MemoryTracker
+from serving import AdmissionController, Rejected, parse_limits, ModelScheduler, default_classes, ModelReloader
+from serving import CloseConnection, CLOSE_CONNECTION
+from serving import UploadRejected, spooled_request_class, inspect_image, decode_image, json_stream
+from serving import ConditionalGet, StaticFingerprints, compress, IMMUTABLE_MAX_AGE
+from jobs import JobQueue, JOB_KINDS, start_worker_threads, use_models
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'smartcropsprayer-secret-key-2024'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
+# Keep every analysed image (deduplicated by content hash) under UPLOAD_FOLDER
+app.config['IMAGE_ARCHIVE_ENABLED'] = os.environ.get('IMAGE_ARCHIVE', '1') != '0'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+# Upload ingestion: images declaring more pixels are refused before decoding;
+# upload bodies beyond UPLOAD_SPOOL_KB go to a temp file (UPLOAD_SPOOL_DIR) instead of RAM
+app.config['UPLOAD_MAX_PIXELS'] = int(float(os.environ.get('UPLOAD_MAX_MEGAPIXELS', 25)) * 1e6)
+app.config['UPLOAD_MAX_SIDE'] = int(os.environ.get('UPLOAD_MAX_SIDE', 10000))
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_KB', 256)) * 1024
+app.config['UPLOAD_SPOOL_DIR'] = os.environ.get('UPLOAD_SPOOL_DIR')
+app.request_class = spooled_request_class(app.config['UPLOAD_SPOOL_BYTES'], app.config['UPLOAD_SPOOL_DIR'])
+# Lets a response end its keep-alive connection (shed uploads, see admit_request)
+app.wsgi_app = CloseConnection(app.wsgi_app)
+# Optional precomputed crop table, e.g. models/crop_lookup_8.npy (python -m crop_prediction.lookup_table)
+app.config['CROP_LOOKUP_TABLE'] = os.environ.get('CROP_LOOKUP_TABLE')
+app.config['HISTORY_DB'] = os.environ.get('HISTORY_DB', 'database/farming_history.db')
+# Largest ?limit= accepted by the history endpoints
+app.config['HISTORY_MAX_ROWS'] = int(os.environ.get('HISTORY_MAX_ROWS', 10000))
+# JSON/CSV responses of at least this size are gzip/br compressed (0 disables)
+app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+# Bulk sync from edge devices (POST /api/history/sync): lines per upload, rows per
+# transaction, and the token devices send in X-Sync-Token (no token: open like the other history APIs)
+app.config['SYNC_MAX_LINES'] = int(os.environ.get('SYNC_MAX_LINES', 100000))
+app.config['SYNC_CHUNK_SIZE'] = int(os.environ.get('SYNC_CHUNK_SIZE', 1000))
+app.config['SYNC_TOKEN'] = os.environ.get('SYNC_TOKEN')
+# Similar-case search: keep each detection's model embedding (float16) under EMBEDDINGS_DIR;
+# SIMILARITY_NPROBE is how many IVF lists a query scans once an index is built
+app.config['SIMILAR_CASES_ENABLED'] = os.environ.get('SIMILAR_CASES', '1') != '0'
+app.config['EMBEDDINGS_DIR'] = os.environ.get('EMBEDDINGS_DIR', 'database/embeddings')
+app.config['SIMILARITY_NPROBE'] = int(os.environ.get('SIMILARITY_NPROBE', 16))
+# Per-crop disease models: one JSON manifest per crop in DISEASE_MODELS_DIR, loaded on first
+# use; least recently used ones are dropped while their weights exceed DISEASE_MODEL_MEMORY_MB
+app.config['DISEASE_MODELS_DIR'] = os.environ.get('DISEASE_MODELS_DIR', os.path.join('models', 'disease'))
+app.config['DISEASE_MODEL_MEMORY_BYTES'] = int(float(os.environ.get('DISEASE_MODEL_MEMORY_MB', 256)) * 1024 * 1024)
+app.config['DEFAULT_DISEASE_CROP'] = os.environ.get('DEFAULT_DISEASE_CROP', 'apple')
+# Admin endpoints require this token in X-Admin-Token. Without one they are closed, unless
+# ADMIN_ALLOW_LOCALHOST=1 (development only: behind a reverse proxy every request looks local)
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+app.config['ADMIN_ALLOW_LOCALHOST'] = os.environ.get('ADMIN_ALLOW_LOCALHOST', '0') == '1'
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# Admission control per endpoint group as concurrency:queue, per worker process.
+# Keep disease slots + queue below WEB_THREADS so cheap routes always get a thread.
+app.config['ADMISSION_ENABLED'] = os.environ.get('ADMISSION_ENABLED', '1') != '0'
+app.config['ADMISSION_LIMITS'] = dict(parse_limits('disease=1:2,crop=8:8,chatbot=2:2,history=8:8,sync=1:4'),
+                                      **parse_limits(os.environ.get('ADMISSION_LIMITS')))
+app.config['ADMISSION_QUEUE_TIMEOUT'] = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 5))
+# Disease queue depth that switches detection to rule-based (default: the whole queue is in use)
+app.config['ADMISSION_DEGRADE_QUEUE'] = int(os.environ.get('ADMISSION_DEGRADE_QUEUE', 0)) or None
+# Seconds the queue must stay that deep before degrading, and degraded mode lasts after it drains
+app.config['ADMISSION_DEGRADE_AFTER'] = float(os.environ.get('ADMISSION_DEGRADE_AFTER', 1))
+app.config['ADMISSION_DEGRADE_HOLD'] = float(os.environ.get('ADMISSION_DEGRADE_HOLD', 10))
+# Bulk jobs (python -m jobs.worker): inputs must live under JOBS_INPUT_ROOT
+app.config['JOBS_DB'] = os.environ.get('JOBS_DB', 'database/jobs.db')
+app.config['JOBS_RESULTS_DIR'] = os.environ.get('JOBS_RESULTS_DIR', 'job_results')
+app.config['JOBS_INPUT_ROOT'] = os.path.abspath(os.environ.get('JOBS_INPUT_ROOT', '.'))
+# Job worker threads inside each web worker, sharing its models (0 = use python -m jobs.worker)
+app.config['JOBS_IN_PROCESS'] = int(os.environ.get('JOBS_IN_PROCESS', 0))
+# Concurrent model calls per web worker, shared by interactive requests and in-process jobs
+app.config['MODEL_SLOTS'] = {'disease': int(os.environ.get('MODEL_SLOTS_DISEASE', 1)),
+                             'crop': int(os.environ.get('MODEL_SLOTS_CROP', 2))}
+app.config['INTERACTIVE_SLO'] = float(os.environ.get('INTERACTIVE_SLO', 0.5))
+# Seconds between checks for new model files (0 = reload only via POST /admin/models/reload)
+app.config['MODEL_WATCH_INTERVAL'] = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
 
 # Create necessary directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize modules
 detector = DiseaseDetector()
-crop_predictor = CropPredictor()
-history_manager = FarmingHistoryManager()
+crop_predictor = CropPredictor(lookup_table_path=app.config['CROP_LOOKUP_TABLE'])
+history_manager = FarmingHistoryManager(app.config['HISTORY_DB'])
+image_archive = ImageArchive(app.config['UPLOAD_FOLDER'])
+job_queue = JobQueue(app.config['JOBS_DB'], app.config['JOBS_RESULTS_DIR'])
+embedding_store = EmbeddingStore(app.config['EMBEDDINGS_DIR'])
+similar_cases = SimilarCases(embedding_store, nprobe=app.config['SIMILARITY_NPROBE'])
+# The built-in apple detector stays loaded as the default crop; others load on demand
+disease_models = DiseaseModelRegistry(load_manifests(app.config['DISEASE_MODELS_DIR']), detector,
+                                      default_crop=app.config['DEFAULT_DISEASE_CROP'],
+                                      memory_cap=app.config['DISEASE_MODEL_MEMORY_BYTES'])
+
+# Interactive requests and bulk jobs share the models through these schedulers
+schedulers = {}
+for model_name, slots in app.config['MODEL_SLOTS'].items():
+    classes = default_classes(slots)
+    classes['interactive']['slo'] = app.config['INTERACTIVE_SLO']
+    schedulers[model_name] = ModelScheduler(model_name, slots, classes)
+use_models(detector=detector, crop_predictor=crop_predictor, schedulers=schedulers)
+job_threads_pid = None
+# Hot reload: new artifacts are validated, then swapped in without a restart
+model_reloader = ModelReloader({'disease': detector, 'crop': crop_predictor},
+                               watch_interval=app.config['MODEL_WATCH_INTERVAL'])
+profiler = RequestProfiler(app.config['PROFILE_DIR'],
+                           enabled=os.environ.get('PROFILE_ENABLED', '0') == '1',
+                           sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')))
 
 # Initialize chatbot (online if API key available, enhanced offline otherwise)
 try:
-    chatbot = FarmingAssistant()
+    # Falls back to the enhanced offline chatbot when the upstream API fails
+    chatbot = FarmingAssistant(fallback_factory=lambda: EnhancedFarmingChatbot(crop_predictor, detector))
     use_offline_chatbot = False
 except ValueError:
     # Use enhanced chatbot with SmartCropSprayer knowledge integration
-    chatbot = EnhancedFarmingChatbot()
+    chatbot = EnhancedFarmingChatbot(crop_predictor, detector)
     use_offline_chatbot = True
 
+# Memory accounting (GET /admin/memory). MEMORY_TRACE=1 adds tracemalloc
+# allocation sites; MEMORY_RSS_LIMIT_MB recycles a worker that grows past it.
+memory_tracker = MemoryTracker(
+    interval=float(os.environ.get('MEMORY_SAMPLE_INTERVAL', 300)),
+    trace=os.environ.get('MEMORY_TRACE', '0') == '1',
+    trace_frames=int(os.environ.get('MEMORY_TRACE_FRAMES', 1)),
+    rss_limit=int(float(os.environ['MEMORY_RSS_LIMIT_MB']) * 1024 * 1024) if os.environ.get('MEMORY_RSS_LIMIT_MB') else None
+)
+memory_tracker.register('disease_detector', lambda: detector)
+memory_tracker.register('disease_models', lambda: disease_models.loaded_detectors()[1:])
+memory_tracker.register('crop_predictor', lambda: crop_predictor)
+memory_tracker.register('chatbot_history', lambda: chatbot.conversation_history)
+memory_tracker.register('chatbot', lambda: chatbot)
+memory_tracker.register('metrics', lambda: metrics.registry)
+
+# Admission control: each endpoint group has a concurrency limit and a bounded
+# wait queue; overflow is rejected quickly with 429/503 and Retry-After.
+admission = AdmissionController()
+admission_groups = {
+    'disease': ['predict_disease'],
+    'crop': ['predict_crop'],
+    'chatbot': ['chatbot_api'],
+    'history': ['get_crop_history', 'get_disease_history', 'get_chatbot_history', 'export_history',
+                'get_history_trends', 'get_similar_cases'],
+    # One upload writes at a time per worker; the others wait instead of contending for the SQLite lock
+    'sync': ['sync_history']
+}
+for group, endpoints in admission_groups.items():
+    concurrency, queue = app.config['ADMISSION_LIMITS'][group]
+    admission.add_group(group, endpoints, concurrency, queue,
+                        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+                        degrade_after=app.config['ADMISSION_DEGRADE_AFTER'],
+                        degrade_hold=app.config['ADMISSION_DEGRADE_HOLD'],
+                        # Disease detection drops to rule-based while its queue is backed up
+                        degrade_queue=max(1, app.config['ADMISSION_DEGRADE_QUEUE'] or queue) if group == 'disease' else None)
+disease_admission = admission.groups['disease']
+
+# Request metrics (exported on /metrics). With METRICS_ENABLED=0 no hooks are
+# registered and metrics.stage() is a shared no-op.
+if metrics.registry.enabled:
+    request_seconds = metrics.registry.histogram(
+        'scs_request_duration_seconds', 'HTTP request latency by route', ['route', 'method', 'status'])
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+    
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('request_start')
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_seconds.observe(time.perf_counter() - start, route=route,
+                                    method=request.method, status=response.status_code)
+        metrics.registry.flush()
+        return response
+    
+    metrics.registry.gauge(
+        'scs_process_memory_bytes', 'Memory of this worker process', ['kind'],
+        callback=lambda: {(kind,): value for kind, value in process_memory().items()})
+    metrics.registry.gauge(
+        'scs_component_memory_bytes', 'Approximate size of long-lived app components (last sample)', ['component'],
+        callback=lambda: {(name,): size for name, size in memory_tracker.component_sizes().items()})
+    metrics.registry.gauge(
+        'scs_admission_state', 'Admission control in-flight/queued requests and degraded flag', ['group', 'state'],
+        callback=lambda: {(group, state): stats[state] for group, stats in admission.stats().items()
+                          for state in ('in_flight', 'queued', 'degraded')})
+    metrics.registry.gauge(
+        'scs_model_load_seconds', 'Time taken to load each model', ['model'],
+        callback=lambda: {('disease',): detector.load_stats.get('load_seconds')})
+    metrics.registry.gauge(
+        'scs_disease_models_loaded_bytes', 'Weights of the on-demand crop disease models currently loaded', [],
+        callback=lambda: {(): disease_models.loaded_bytes()})
+    metrics.registry.gauge(
+        'scs_model_info', 'Active model version (value is always 1)', ['model', 'version'],
+        callback=lambda: {(name, status['version']): 1 for name, status in model_reloader.status().items()})
+    if not use_offline_chatbot:
+        metrics.registry.gauge(
+            'scs_chatbot_upstream', 'Online chatbot client counters and latency (seconds)', ['stat'],
+            callback=lambda: {(key,): value for key, value in chatbot.get_stats().items()
+                              if isinstance(value, (int, float))})
+
+def is_admin_request():
+    """True if the request carries the admin token (or, with no token set and ADMIN_ALLOW_LOCALHOST, comes from localhost)."""
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return app.config['ADMIN_ALLOW_LOCALHOST'] and request.remote_addr in ('127.0.0.1', '::1')
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+# On-demand profiling: a sampled fraction of requests, or admin requests sending
+# the X-Profile header, are recorded with cProfile while profiling is enabled.
+@app.before_request
+def start_background_workers():
+    # Started lazily so each gunicorn worker runs its own threads after fork
+    global job_threads_pid
+    memory_tracker.ensure_started()
+    model_reloader.ensure_started()
+    image_archive.ensure_started()
+    if app.config['JOBS_IN_PROCESS'] and job_threads_pid != os.getpid():
+        job_threads_pid = os.getpid()
+        start_worker_threads(job_queue, app.config['JOBS_IN_PROCESS'])
+
+@app.before_request
+def start_request_profile():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    triggered = profiler.header in request.headers and is_admin_request()
+    if profiler.should_profile(triggered):
+        g.profile = profiler.start()
+
+def request_profile_id():
+    return profiler.profile_id(request.url_rule.rule if request.url_rule else 'unmatched', g.request_id)
+
+@app.after_request
+def save_request_profile(response):
+    # Stopped when the server closes the response, so a streamed body's
+    # serialization is part of the profile
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile_id = request_profile_id()
+        response.headers['X-Profile-Id'] = profile_id
+        response.call_on_close(lambda: profiler.stop(profile, profile_id))
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def stop_request_profile(exc):
+    # A request that never reached after_request (an exception in another hook)
+    # must still release the profiler, or no later request could be profiled
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile, request_profile_id())
+
+# Conditional GET: read endpoints get an ETag from what their response depends on
+# (history table write versions, templates and static files), checked before
+# admission so an unchanged poll is answered 304 without a slot or SQLite.
+conditional_get = ConditionalGet()
+static_fingerprints = StaticFingerprints(app.static_folder)
+site_fingerprint = None
+
+def page_fingerprint():
+    global site_fingerprint
+    if site_fingerprint is None or app.debug:
+        site_fingerprint = static_fingerprints.site_fingerprint(app.template_folder, app.static_folder)
+    return site_fingerprint
+
+def history_versions(*tables):
+    return history_manager.versions.token, history_manager.versions.get(*tables)
+
+conditional_get.add('get_crop_history', lambda: history_versions('crop_recommendations'))
+conditional_get.add('get_disease_history', lambda: history_versions('disease_detections'))
+conditional_get.add('get_chatbot_history', lambda: history_versions('chatbot_queries'))
+# Default date ranges end today, so the day is part of the key
+conditional_get.add('get_history_trends', lambda: (history_versions('crop_recommendations', 'disease_detections'),
+                                                   datetime.now(timezone.utc).date()))
+conditional_get.add('export_history', lambda: history_versions())
+conditional_get.add('history_page', lambda: (history_versions(), page_fingerprint()))
+for page in ('index', 'crop_prediction_page'):
+    conditional_get.add(page, page_fingerprint)
+# The crop selector marks crops whose weights are missing
+conditional_get.add('disease_detection_page', lambda: (page_fingerprint(), disease_crops()))
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    # url_for('static', filename=...) -> /static/...?v=<content hash>
+    if endpoint == 'static' and 'v' not in values:
+        fingerprint = static_fingerprints.fingerprint(values.get('filename', ''))
+        if fingerprint:
+            values['v'] = fingerprint
+
+@app.before_request
+def check_not_modified():
+    g.etag, not_modified = conditional_get.check(request)
+    return not_modified
+
+@app.after_request
+def add_cache_headers(response):
+    etag = g.pop('etag', None)
+    if etag is not None:
+        conditional_get.tag(response, etag)
+    elif request.endpoint == 'static' and response.status_code in (200, 304) and request.args.get('v'):
+        if request.args['v'] == static_fingerprints.fingerprint(request.view_args['filename']):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+    if app.config['COMPRESS_MIN_BYTES']:
+        compress(response, request.accept_encodings, app.config['COMPRESS_MIN_BYTES'])
+    return response
+
+# Admission hooks run after the request id is assigned, so rejections carry it too
+if app.config['ADMISSION_ENABLED']:
+    @app.before_request
+    def admit_request():
+        limiter = admission.limiter_for(request.endpoint)
+        if limiter is None:
+            return None
+        try:
+            g.admission = (limiter, limiter.acquire())
+        except Rejected as e:
+            message = 'Server busy, please retry shortly' if e.status == 503 else 'Too many requests, please retry shortly'
+            response = jsonify({'error': message, 'reason': e.reason, 'retry_after': e.retry_after})
+            response.status_code = e.status
+            response.headers['Retry-After'] = str(e.retry_after)
+            # Drain the unread upload (read and discarded, not parsed) so the client
+            # gets this response and the keep-alive connection stays usable. Closing
+            # without reading breaks clients that are still sending: they see a reset
+            # instead of the 429/503. Bodies of unknown or over-limit length cannot be
+            # drained safely, so those connections are closed (see CloseConnection)
+            length = request.content_length
+            if length is not None and length <= app.config['MAX_CONTENT_LENGTH']:
+                for _ in iter(lambda: request.stream.read(65536), b''):
+                    pass
+            elif length or request.headers.get('Transfer-Encoding'):
+                request.environ[CLOSE_CONNECTION] = True
+            return response
+    
+    @app.teardown_request
+    def release_admission(exc):
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            limiter, started = admitted
+            limiter.release(started)
+
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+@app.errorhandler(413)
+def request_too_large(e):
+    """Body over MAX_CONTENT_LENGTH; refused while streaming, before it is stored."""
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'error': f'Upload too large (limit {limit_mb} MB)', 'reason': 'too_large'}), 413
+
 # Routes
 @app.route('/')
 def index():
     """Homepage."""
     return render_template('index.html')
 
+def disease_crops():
+    return tuple((crop, disease_models.available(crop)) for crop in disease_models.crops())
+
 @app.route('/disease-detection')
 def disease_detection_page():
     """Disease detection page."""
-    return render_template('disease_detection.html')
+    crops = [{'name': crop, 'available': available} for crop, available in disease_crops()]
+    return render_template('disease_detection.html', crops=crops, default_crop=disease_models.default_crop)
 
 @app.route('/crop-prediction')
 def crop_prediction_page():
@@ -92,24 +420,56 @@ def predict_disease():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or JPEG'}), 400
     
+    crop = (request.form.get('crop') or request.args.get('crop') or disease_models.default_crop).lower()
+    if crop not in disease_models.crops():
+        return jsonify({'error': f"crop must be one of: {', '.join(disease_models.crops())}"}), 400
+    
     try:
-        # Read and process image
-        image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes))
+        # Check format and declared size from the header before decoding from the spooled upload
+        with metrics.stage('disease.inspect'):
+            image = inspect_image(file.stream, app.config['UPLOAD_MAX_PIXELS'], app.config['UPLOAD_MAX_SIDE'])
+        with metrics.stage('disease.decode'):
+            decode_image(image)
+        image_sha256 = None
+        if app.config['IMAGE_ARCHIVE_ENABLED']:
+            with metrics.stage('disease.archive'):
+                image_sha256, _ = image_archive.store(file.stream, image.format)
         
-        # Run disease detection
-        result = detector.detect_disease(image)
+        # Loads the crop's model on first use
+        with metrics.stage('disease.model_load'):
+            crop_detector = disease_models.get(crop)
         
-        # Log to history
+        # Run disease detection (rule-based while the endpoint is overloaded; only apple has rules)
+        degraded = disease_admission.degraded and crop_detector.rule_based_fallback
+        if degraded:
+            disease_admission.mark_degraded()
+        with schedulers['disease'].slot('interactive'):
+            detect_start = time.perf_counter()
+            result = crop_detector.detect_disease(image, use_model=not degraded,
+                                                  return_embedding=app.config['SIMILAR_CASES_ENABLED'])
+            disease_models.observe(crop, time.perf_counter() - detect_start)
+        
+        # Log to history. Degraded (rule-based) answers are not recorded: history,
+        # rollups and similar cases would otherwise mix them with model detections
         image_name = secure_filename(file.filename)
-        history_manager.log_disease_detection(
-            image_name=image_name,
-            detected_disease=result['disease'],
-            confidence=result['confidence'],
-            pesticide=result['pesticide'],
-            is_healthy=result['is_healthy'],
-            all_predictions=result.get('all_predictions', [])
-        )
+        detection_id = None
+        embedding = result.pop('embedding', None)
+        if not degraded:
+            with metrics.stage('disease.history_log'):
+                detection_id = history_manager.log_disease_detection(
+                    image_name=image_name,
+                    detected_disease=result['disease'],
+                    confidence=result['confidence'],
+                    pesticide=result['pesticide'],
+                    is_healthy=result['is_healthy'],
+                    all_predictions=result.get('all_predictions', []),
+                    image_sha256=image_sha256
+                )
+                if embedding is not None:
+                    try:
+                        embedding_store.append(result['model_version'], detection_id, embedding)
+                    except (OSError, ValueError) as e:
+                        print(f"Warning: Could not store embedding for detection {detection_id}: {e}")
         
         # Return prediction result
         return jsonify({
@@ -119,13 +479,36 @@ def predict_disease():
             'is_healthy': result['is_healthy'],
             'pesticide': result['pesticide'],
             'pesticide_details': result['pesticide_details'],
-            'description': detector.get_disease_description(result['disease']),
-            'all_predictions': result.get('all_predictions', [])
+            'description': crop_detector.get_disease_description(result['disease']),
+            'all_predictions': result.get('all_predictions', []),
+            'degraded': degraded,
+            'crop': crop,
+            'model_version': result['model_version'],
+            'image_sha256': image_sha256,
+            'detection_id': detection_id
         })
     
+    except UploadRejected as e:
+        return jsonify({'error': str(e), 'reason': e.reason}), e.status
+    except ModelUnavailable as e:
+        return jsonify({'error': str(e), 'reason': 'model_unavailable', 'crop': e.crop}), 503
     except Exception as e:
         return jsonify({'error': f'Error processing image: {str(e)}'}), 500
 
+@app.route('/api/disease-models', methods=['GET'])
+def list_disease_models():
+    """Crops accepted by /api/predict-disease, their classes and whether their model is installed."""
+    crops = []
+    for crop, available in disease_crops():
+        manifest = disease_models.manifests.get(crop)
+        crops.append({
+            'crop': crop,
+            'available': available,
+            'default': crop == disease_models.default_crop,
+            'classes': list(manifest['classes']) if manifest else detector.display_classes()
+        })
+    return jsonify({'crops': crops})
+
 @app.route('/api/predict-crop', methods=['POST'])
 def predict_crop():
     """Handle crop prediction API request."""
@@ -141,29 +524,33 @@ def predict_crop():
         rainfall = float(data.get('rainfall', 0))
         
         # Get top 3 recommendations
-        recommendations = crop_predictor.get_top_recommendations(
-            nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, top_n=3
-        )
+        with metrics.stage('crop.predict'), schedulers['crop'].slot('interactive'):
+            recommendations = crop_predictor.get_top_recommendations(
+                nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, top_n=3
+            )
+            model_version = crop_predictor.model_version
         
         # Log to history (top recommendation)
         if recommendations:
             top_crop = recommendations[0]
-            history_manager.log_crop_recommendation(
-                nitrogen=nitrogen,
-                phosphorus=phosphorus,
-                potassium=potassium,
-                temperature=temperature,
-                humidity=humidity,
-                ph=ph,
-                rainfall=rainfall,
-                recommended_crop=top_crop['crop'],
-                confidence=top_crop['confidence'],
-                crop_info=top_crop['info']
-            )
+            with metrics.stage('crop.history_log'):
+                history_manager.log_crop_recommendation(
+                    nitrogen=nitrogen,
+                    phosphorus=phosphorus,
+                    potassium=potassium,
+                    temperature=temperature,
+                    humidity=humidity,
+                    ph=ph,
+                    rainfall=rainfall,
+                    recommended_crop=top_crop['crop'],
+                    confidence=top_crop['confidence'],
+                    crop_info=top_crop['info']
+                )
         
         return jsonify({
             'success': True,
-            'recommendations': recommendations
+            'recommendations': recommendations,
+            'model_version': model_version
         })
     
     except Exception as e:
@@ -180,13 +567,13 @@ def chatbot_api():
             return jsonify({'error': 'Message cannot be empty'}), 400
         
         # Get response from chatbot - this should be fast
-        if use_offline_chatbot:
-            # Enhanced chatbot uses generate_reply method with SmartCropSprayer knowledge
-            response = chatbot.generate_reply(user_query)
-            chatbot_type = 'offline_enhanced'
-        else:
-            response = chatbot.chat(user_query)
-            chatbot_type = 'online'
+        with metrics.stage('chatbot.reply'):
+            if use_offline_chatbot:
+                # Enhanced chatbot uses generate_reply method with SmartCropSprayer knowledge
+                response = chatbot.generate_reply(user_query)
+                chatbot_type = 'offline_enhanced'
+            else:
+                response, chatbot_type = chatbot.reply(user_query)
         
         # Return response immediately for instant display
         result = jsonify({
@@ -207,7 +594,8 @@ def chatbot_api():
             })
             
             # Log to database (this is fast but happens after response sent)
-            history_manager.log_chatbot_query(user_query, response, chatbot_type)
+            with metrics.stage('chatbot.history_log'):
+                history_manager.log_chatbot_query(user_query, response, chatbot_type)
         except Exception as db_error:
             # Don't fail if logging has issues
             print(f"Warning: Could not log chat to database: {db_error}")
@@ -217,38 +605,226 @@ def chatbot_api():
     except Exception as e:
         return jsonify({'error': f'Error processing chat: {str(e)}'}), 500
 
-@app.route('/api/history/crops', methods=['GET'])
-def get_crop_history():
-    """Get crop recommendation history."""
+@app.route('/api/chatbot/stats', methods=['GET'])
+def chatbot_stats():
+    """Upstream chat client metrics (online mode only)."""
+    if use_offline_chatbot:
+        return jsonify({'success': True, 'type': 'offline_enhanced', 'stats': {}})
+    return jsonify({'success': True, 'type': 'online', 'stats': chatbot.get_stats()})
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a bulk job: {"kind": "disease"|"crop", "input_path": ..., "chunk_size": 64}.
+
+    {"kind": "rescore"} re-scores every image in the archive (no input_path).
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    if kind not in JOB_KINDS:
+        return jsonify({'error': f"kind must be one of: {', '.join(JOB_KINDS)}"}), 400
+    
+    options = {}
+    if kind == 'rescore':
+        input_path = os.path.abspath(image_archive.objects_dir)
+        options['runner'] = {'history_db': os.path.abspath(app.config['HISTORY_DB'])}
+    else:
+        root = app.config['JOBS_INPUT_ROOT']
+        input_path = os.path.abspath(os.path.join(root, data.get('input_path') or ''))
+        if os.path.commonpath([root, input_path]) != root or input_path == root:
+            return jsonify({'error': 'input_path must be inside the jobs input directory'}), 400
+        if kind == 'disease' and not os.path.isdir(input_path):
+            return jsonify({'error': 'input_path must be a directory of images'}), 400
+        if kind == 'crop' and not os.path.isfile(input_path):
+            return jsonify({'error': 'input_path must be a CSV file'}), 400
+    
+    if data.get('chunk_size'):
+        try:
+            options['chunk_size'] = max(1, int(data['chunk_size']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'chunk_size must be an integer'}), 400
+    job = job_queue.submit(kind, input_path, **options)
+    return jsonify({'success': True, 'job': job}), 202
+
+@app.route('/api/images/<digest>', methods=['GET'])
+def archived_image(digest):
+    """Original upload by content hash (as in history image_sha256)."""
+    path = image_archive.path_for(digest)
+    if path is None:
+        return jsonify({'error': 'Image not found'}), 404
+    return send_file(os.path.abspath(path), max_age=31536000)
+
+@app.route('/api/images/<digest>/thumbnail', methods=['GET'])
+def archived_thumbnail(digest):
+    path = image_archive.thumbnail_path(digest)
+    if path is None:
+        return jsonify({'error': 'Image not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=31536000)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Most recent jobs, optionally ?status=queued|running|completed|failed|cancelled."""
+    return jsonify({'success': True, 'jobs': job_queue.list_jobs(request.args.get('status'),
+                                                                 request.args.get('limit', 50, type=int))})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Stream the NDJSON results checkpointed so far (complete once the job has completed)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not os.path.exists(job['output_path']):
+        return Response('', mimetype='application/x-ndjson')
+    
+    def generate(path, length):
+        with open(path, 'rb') as f:
+            while length > 0:
+                block = f.read(min(length, 1 << 16))
+                if not block:
+                    break
+                length -= len(block)
+                yield block
+    
+    return Response(generate(job['output_path'], job['output_bytes']), mimetype='application/x-ndjson',
+                    headers={'X-Job-Status': job['status'], 'Content-Length': str(job['output_bytes'])})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Job has already finished'}), 409
+    return jsonify({'success': True, 'job': job_queue.get(job_id)})
+
+def history_response(history_type):
+    """Stream history rows from SQLite into JSON (records, or ?layout=columns).
+    
+    ?limit= sets the number of rows, newest first (default 100, at most
+    HISTORY_MAX_ROWS).
+    """
+    limit = request.args.get('limit', 100, type=int)
+    if limit < 1 or limit > app.config['HISTORY_MAX_ROWS']:
+        return jsonify({'error': f"limit must be between 1 and {app.config['HISTORY_MAX_ROWS']}"}), 400
+    layout = request.args.get('layout', 'records')
+    if layout not in ('records', 'columns'):
+        return jsonify({'error': 'layout must be records or columns'}), 400
     try:
-        df = history_manager.get_crop_recommendations()
-        return jsonify({
-            'success': True,
-            'data': df.to_dict('records')
-        })
+        with metrics.stage('history.query'):
+            batches = history_manager.iter_history(history_type, limit)
+            names = next(batches)
+        if layout == 'columns':
+            body = json_stream.columns(names, batches)
+        elif json_stream.compact(app):
+            body = json_stream.records(names, batches)
+        else:
+            # Debug mode pretty-prints; keep jsonify's exact output there
+            return jsonify({'success': True, 'data': [dict(zip(names, row)) for rows in batches for row in rows]})
+        return Response(stream_with_context(body), mimetype=app.json.mimetype)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/history/crops', methods=['GET'])
+def get_crop_history():
+    """Get crop recommendation history."""
+    return history_response('crops')
+
 @app.route('/api/history/diseases', methods=['GET'])
 def get_disease_history():
     """Get disease detection history."""
+    return history_response('diseases')
+
+@app.route('/api/history/chatbot', methods=['GET'])
+def get_chatbot_history():
+    """Get chatbot query history."""
+    return history_response('chatbot')
+
+@app.route('/api/history/trends', methods=['GET'])
+def get_history_trends():
+    """Daily or weekly counts and average confidence per disease or crop.
+    
+    Query: kind=disease|crop, period=day|week, start/end=YYYY-MM-DD (UTC,
+    default the last 30 days or 12 weeks), label=... (repeatable).
+    """
+    kind = request.args.get('kind', 'disease')
+    period = request.args.get('period', 'day')
+    if kind not in ('disease', 'crop'):
+        return jsonify({'error': 'kind must be disease or crop'}), 400
+    if period not in ('day', 'week'):
+        return jsonify({'error': 'period must be day or week'}), 400
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args \
+            else datetime.now(timezone.utc).date()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args \
+            else end - (timedelta(days=29) if period == 'day' else timedelta(weeks=11))
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
     try:
-        df = history_manager.get_disease_detections()
+        with metrics.stage('history.query'):
+            rows = history_manager.get_trends(kind, period, start, end, request.args.getlist('label'))
+        series = {}
+        for row in rows:
+            series.setdefault(row['label'], []).append(
+                {'bucket': row['bucket'], 'count': row['count'], 'avg_confidence': row['avg_confidence']})
+        totals = {label: {'count': sum(p['count'] for p in points),
+                          'avg_confidence': sum(p['count'] * p['avg_confidence'] for p in points)
+                          / sum(p['count'] for p in points)}
+                  for label, points in series.items()}
         return jsonify({
             'success': True,
-            'data': df.to_dict('records')
+            'kind': kind,
+            'period': period,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': series,
+            'totals': totals
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/history/chatbot', methods=['GET'])
-def get_chatbot_history():
-    """Get chatbot query history."""
+@app.route('/api/history/diseases/<int:detection_id>/similar', methods=['GET'])
+def get_similar_cases(detection_id):
+    """Past detections whose images look most like this one, by model embedding.
+    
+    ?k= number of cases (1-50, default 5), ?nprobe= inverted lists to scan
+    when an index is built (more is slower but more exact).
+    """
+    k = request.args.get('k', 5, type=int)
+    nprobe = request.args.get('nprobe', app.config['SIMILARITY_NPROBE'], type=int)
+    if not 1 <= k <= 50:
+        return jsonify({'error': 'k must be between 1 and 50'}), 400
+    if nprobe < 1:
+        return jsonify({'error': 'nprobe must be positive'}), 400
     try:
-        df = history_manager.get_chatbot_queries()
+        version, row = embedding_store.find(detection_id)
+        if version is None:
+            return jsonify({'error': 'No embedding stored for this detection (rule-based or unknown id)'}), 404
+        _, vectors = embedding_store.load(version)
+        start = time.perf_counter()
+        with metrics.stage('history.similar'):
+            # A few spare candidates in case retention dropped some of the rows
+            cases, searched = similar_cases.search(version, vectors[row], k + 10, nprobe, exclude_ids={detection_id})
+            details = history_manager.get_detections_by_id([case_id for case_id, _ in cases])
+        results = []
+        for case_id, similarity in cases:
+            if case_id in details and len(results) < k:
+                case = dict(details[case_id], similarity=round(similarity, 4))
+                if case['image_sha256']:
+                    case['thumbnail_url'] = f"/api/images/{case['image_sha256']}/thumbnail"
+                results.append(case)
         return jsonify({
             'success': True,
-            'data': df.to_dict('records')
+            'detection_id': detection_id,
+            'model_version': version,
+            'cases': results,
+            'searched': dict(searched, seconds=round(time.perf_counter() - start, 4))
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -257,9 +833,6 @@ def get_chatbot_history():
 def export_history(history_type):
     """Export history data as CSV."""
     try:
-        import pandas as pd
-        from flask import Response
-        
         if history_type == 'crops':
             df = history_manager.get_crop_recommendations(limit=10000)
         elif history_type == 'diseases':
@@ -278,12 +851,45 @@ def export_history(history_type):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/history/sync', methods=['POST'])
+def sync_history():
+    """Bulk upload of detections and recommendations logged offline by an edge device.
+    
+    The body is NDJSON, one record per line (see database/ingest.py), plain or
+    with Content-Encoding: gzip. Records already uploaded (same idempotency_key)
+    are skipped, so a failed upload can simply be sent again.
+    """
+    token = app.config['SYNC_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('X-Sync-Token', ''), token):
+        return jsonify({'error': 'Invalid sync token'}), 403
+    encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding not in ('identity', 'gzip', 'x-gzip'):
+        return jsonify({'error': 'Content-Encoding must be gzip or identity'}), 415
+    # Buffered: readline() directly on the request stream is about 40x slower
+    stream = io.BufferedReader(request.stream, 65536) if encoding == 'identity' \
+        else gzip.GzipFile(fileobj=request.stream, mode='rb')
+    
+    lines = ingest.parse_lines(stream, app.config['SYNC_MAX_LINES'])
+    stats = ingest.BatchStats()
+    try:
+        with metrics.stage('history.ingest'):
+            stats = history_manager.ingest(lines, app.config['SYNC_CHUNK_SIZE'], stats=stats)
+    except OverflowError as e:
+        # Chunks committed before the limit stay; resending the whole file skips them
+        return jsonify(dict(stats.as_dict(), error=str(e))), 413
+    except (OSError, EOFError, zlib.error) as e:
+        return jsonify(dict(stats.as_dict(), error=f'Invalid gzip body: {e}')), 400
+    except Exception as e:
+        return jsonify(dict(stats.as_dict(), error=str(e))), 500
+    return jsonify(dict(stats.as_dict(), success=True))
+
 @app.route('/api/history/clear', methods=['POST'])
 def clear_all_history():
     """Clear all history from database."""
     try:
         success = history_manager.clear_all_history()
         if success:
+            embedding_store.clear()
             return jsonify({
                 'success': True,
                 'message': 'All history has been cleared successfully.'
@@ -293,6 +899,94 @@ def clear_all_history():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics."""
+    if not metrics.registry.enabled:
+        return Response('# metrics disabled\n', mimetype='text/plain')
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/admission', methods=['GET'])
+def admission_stats():
+    """Concurrency, queue, shed and degraded counts per endpoint group (this worker)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'enabled': app.config['ADMISSION_ENABLED'], 'groups': admission.stats()})
+
+@app.route('/admin/scheduler', methods=['GET'])
+def scheduler_stats():
+    """Queued/running/served calls and SLO misses per model and priority class (this worker)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({name: scheduler.stats() for name, scheduler in schedulers.items()})
+
+@app.route('/admin/models', methods=['GET'])
+def model_status():
+    """Active version and last reload result per model (this worker)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'watch_interval': model_reloader.watch_interval, 'models': model_reloader.status(),
+                    'disease_models': disease_models.stats()})
+
+@app.route('/admin/models/reload', methods=['POST'])
+def reload_model():
+    """Reload, validate and swap in a model from disk, e.g. {"model": "disease"}.
+
+    Returns 202 at once; poll GET /admin/models for the result.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    name = (request.get_json(silent=True) or {}).get('model')
+    if name not in model_reloader.targets:
+        return jsonify({'error': f"model must be one of: {', '.join(model_reloader.targets)}"}), 400
+    if not model_reloader.reload(name):
+        return jsonify({'error': f'{name} reload already in progress'}), 409
+    return jsonify({'model': name, 'state': 'reloading'}), 202
+
+@app.route('/admin/memory', methods=['GET'])
+def memory_report():
+    """Process memory, component sizes and top allocation sites of this worker.
+
+    ?refresh=1 takes a new sample first; ?top=N limits each allocation list.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.args.get('refresh') == '1':
+        memory_tracker.sample()
+    return jsonify(memory_tracker.report(top=request.args.get('top', type=int),
+                                         key_type='traceback' if request.args.get('traceback') == '1' else 'lineno'))
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Show or change profiling settings, e.g. {"enabled": true, "sample_rate": 0.01}."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            return jsonify(profiler.configure(enabled=data.get('enabled'), sample_rate=data.get('sample_rate')))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sample_rate must be a number between 0 and 1'}), 400
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Saved profiles, newest first."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'profiles': profiler.list_profiles()})
+
+@app.route('/admin/profiles/<path:profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download one gzip-compressed pstats file."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    path = profiler.path_for(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/gzip', as_attachment=True,
+                     download_name=os.path.basename(path))
+
 def safe_print(message):
     """Print message safely, handling Unicode errors."""
     try:
@@ -321,9 +1015,11 @@ if __name__ == '__main__':
         safe_print(f"Model Path: {os.path.abspath(detector.model_path)}")
         safe_print(f"Model Format: PyTorch (.pth)")
         safe_print(f"Device: {detector.device}")
+        safe_print(f"Weights memory-mapped: {'Yes' if detector.load_stats.get('mmap') else 'No'}")
     else:
         safe_print(f"Disease Detection Model: Using rule-based fallback")
         safe_print(f"Tip: Place model.pth in the models/ directory for AI detection")
+    safe_print(f"Process memory: {format_memory(process_memory())}")
     safe_print(f"Chatbot Mode: {'Online (GPT-5)' if not use_offline_chatbot else 'Offline (Local)'}")
     safe_print(f"\nServer is ready! Open http://127.0.0.1:{port} in your browser\n")
     
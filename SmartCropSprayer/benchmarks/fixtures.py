@@ -0,0 +1,82 @@
+"""Request fixtures built from test_samples/ and data/crop_recommendation.csv."""
+import csv
+import json
+import os
+import random
+import uuid
+
+SAMPLES_DIR = 'test_samples'
+CROP_CSV = os.path.join('data', 'crop_recommendation.csv')
+
+CHAT_MESSAGES = [
+    'How do I treat apple scab?',
+    'What pesticide should I use for powdery mildew?',
+    'Which crop for N=50, P=40, K=60, pH=6.5, temp=25, humidity=70, rainfall=150?',
+    'How much water does rice need?',
+    'What fertilizer is best for maize?',
+    'How do I control aphids organically?',
+    'What is the best soil pH for coffee?',
+    'hello'
+]
+
+
+def load_images(samples_dir=SAMPLES_DIR):
+    images = []
+    for name in sorted(os.listdir(samples_dir)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(samples_dir, name), 'rb') as f:
+                images.append((name, f.read()))
+    return images
+
+
+def load_soil_rows(csv_path=CROP_CSV):
+    rows = []
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append({
+                'nitrogen': float(row['N']),
+                'phosphorus': float(row['P']),
+                'potassium': float(row['K']),
+                'temperature': float(row['temperature']),
+                'humidity': float(row['humidity']),
+                'ph': float(row['ph']),
+                'rainfall': float(row['rainfall'])
+            })
+    return rows
+
+
+def multipart_body(field, filename, content, content_type='image/jpeg'):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class RequestFactory:
+    """Builds (method, path, body, headers) tuples for each load-tested endpoint."""
+
+    ENDPOINTS = ['disease', 'crop', 'chatbot', 'history']
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.images = load_images()
+        self.soil_rows = load_soil_rows()
+
+    def build(self, endpoint):
+        if endpoint == 'disease':
+            name, content = self.random.choice(self.images)
+            body, content_type = multipart_body('image', name, content)
+            return 'POST', '/api/predict-disease', body, {'Content-Type': content_type}
+        if endpoint == 'crop':
+            body = json.dumps(self.random.choice(self.soil_rows)).encode('utf-8')
+            return 'POST', '/api/predict-crop', body, {'Content-Type': 'application/json'}
+        if endpoint == 'chatbot':
+            body = json.dumps({'message': self.random.choice(CHAT_MESSAGES)}).encode('utf-8')
+            return 'POST', '/api/chatbot', body, {'Content-Type': 'application/json'}
+        if endpoint == 'history':
+            path = self.random.choice(['/api/history/crops', '/api/history/diseases', '/api/history/chatbot'])
+            return 'GET', path, None, {}
+        raise ValueError(f"Unknown endpoint: {endpoint}")
@@ -0,0 +1,164 @@
+"""History endpoint serialization: pandas path versus streaming from the cursor.
+
+For each row count, fills a history database with that many rows per
+table and produces the response body of /api/history/<type>?limit=N
+three ways:
+
+  pandas   read_sql_query(parse_dates) -> to_dict('records') -> jsonify
+           (the handlers before serving.json_stream)
+  stream   FarmingHistoryManager.iter_history -> json_stream.records
+  columns  the same rows in the columnar layout
+
+and reports best-of time and tracemalloc peak per request (streamed bodies
+are consumed chunk by chunk, as the server sends them). pandas and stream
+bodies are checked to be byte-identical up to 100k rows.
+
+    python -m benchmarks.history_json --rows 100 10000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, jsonify
+
+from database import FarmingHistoryManager
+from database.compact import Interner, pack_predictions
+from database import partitions
+from serving import json_stream
+
+from .fixtures import CHAT_MESSAGES, load_soil_rows
+from .history_size import DISEASES
+
+TYPES = {
+    'crops': 'get_crop_recommendations',
+    'diseases': 'get_disease_detections',
+    'chatbot': 'get_chatbot_queries'
+}
+
+
+def fill(db_path, rows, seed):
+    from chatbot.enhanced_chatbot import EnhancedFarmingChatbot
+    from crop_prediction import CropPredictor
+
+    rng = random.Random(seed)
+    history = FarmingHistoryManager(db_path)
+    crop_info = CropPredictor().crop_info
+    chatbot = EnhancedFarmingChatbot()
+    answers = [(message, chatbot.generate_reply(message)) for message in CHAT_MESSAGES]
+    soil_rows = load_soil_rows()
+    now = datetime.now(timezone.utc)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    interner = Interner()
+    crop_ids = {crop: interner.text_id(cursor, info) for crop, info in crop_info.items()}
+    answer_ids = [(message, interner.text_id(cursor, answer)) for message, answer in answers]
+    labels, scores = pack_predictions([{'disease': name, 'confidence': 100.0 / len(DISEASES)} for name, _ in DISEASES])
+    label_set_id = interner.label_set_id(cursor, labels)
+    for offset in range(0, rows, 50000):
+        batch = range(offset, min(rows, offset + 50000))
+        crops, detections, chats = [], [], []
+        for i in batch:
+            # One row per second, so ORDER BY timestamp has no ties
+            ts = (now - timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S')
+            crop = rng.choice(list(crop_ids))
+            crops.append((ts,) + tuple(rng.choice(soil_rows).values()) + (crop, rng.uniform(40, 100), crop_ids[crop]))
+            disease, pesticide = rng.choice(DISEASES)
+            detections.append((ts, f'leaf_{i}.jpg', disease, rng.uniform(40, 100), pesticide, False, label_set_id,
+                               scores, f'{i:064x}'))
+            message, answer_id = rng.choice(answer_ids)
+            chats.append((ts, message, answer_id, 'offline_enhanced'))
+        insert(cursor, history, crops, detections, chats)
+    conn.commit()
+    conn.close()
+    return history
+
+
+def insert(cursor, history, crops, detections, chats):
+    """Insert rows (newest first) into their monthly partitions."""
+    for month in sorted({partitions.month_of(row[0]) for row in crops}, reverse=True):
+        rows = {table: [row for row in batch if partitions.month_of(row[0]) == month]
+                for table, batch in (('crop_recommendations', crops), ('disease_detections', detections),
+                                     ('chatbot_queries', chats))}
+        cursor.connection.commit()  # _partition() may need the write lock
+        tables = {table: history._partition(table, rows[table][0][0]) for table in rows}
+        cursor.executemany(f'''INSERT INTO {tables['crop_recommendations']} (timestamp, nitrogen, phosphorus, potassium,
+                               temperature, humidity, ph, rainfall, recommended_crop, confidence, crop_info_id)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows['crop_recommendations'])
+        cursor.executemany(f'''INSERT INTO {tables['disease_detections']} (timestamp, image_name, detected_disease,
+                               confidence, pesticide, is_healthy, label_set_id, prediction_scores, image_sha256)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows['disease_detections'])
+        cursor.executemany(f'''INSERT INTO {tables['chatbot_queries']} (timestamp, user_query, bot_response_id,
+                               chatbot_type) VALUES (?, ?, ?, ?)''', rows['chatbot_queries'])
+
+
+def pandas_body(app, history, history_type, limit):
+    df = getattr(history, TYPES[history_type])(limit)
+    with app.app_context():
+        return jsonify({'success': True, 'data': df.to_dict('records')}).get_data()
+
+
+def stream_body(history, history_type, limit, layout=json_stream.records):
+    batches = history.iter_history(history_type, limit)
+    return layout(next(batches), batches)
+
+
+def send(chunks):
+    """Consume a streamed body as the server would, chunk by chunk; returns its size."""
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(fn, repeat):
+    """(best seconds, tracemalloc peak bytes, result)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def import_seconds(module):
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time history JSON serialization with and without pandas')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 10000, 1000000])
+    parser.add_argument('--types', nargs='+', default=list(TYPES), choices=list(TYPES))
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (1 above 100k rows)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print(f"import pandas: {import_seconds('pandas'):.2f}s per worker on the old path\n")
+    print(f"{'case':<20} {'bytes':>12} {'pandas ms':>10} {'stream ms':>10} {'columns ms':>11}"
+          f" {'pandas peak':>12} {'stream peak':>12} {'columns peak':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            history = fill(os.path.join(tmp, f'history_{rows}.db'), rows, args.seed)
+            repeat = args.repeat if rows <= 100000 else 1
+            for history_type in args.types:
+                old_s, old_peak, old = measure(lambda: len(pandas_body(app, history, history_type, rows)), repeat)
+                new_s, new_peak, new = measure(lambda: send(stream_body(history, history_type, rows)), repeat)
+                col_s, col_peak, _ = measure(
+                    lambda: send(stream_body(history, history_type, rows, json_stream.columns)), repeat)
+                if rows <= 100000:
+                    assert b''.join(stream_body(history, history_type, rows)) == \
+                        pandas_body(app, history, history_type, rows), f'{history_type}: bodies differ'
+                print(f"{history_type + ' x ' + str(rows):<20} {new:>12,} {old_s * 1000:>10.1f} "
+                      f"{new_s * 1000:>10.1f} {col_s * 1000:>11.1f} {old_peak / 2**20:>10.1f}MB "
+                      f"{new_peak / 2**20:>10.1f}MB {col_peak / 2**20:>11.1f}MB")
@@ -0,0 +1,129 @@
+"""Size and read-time effect of the compact history schema.
+
+Fills a database in the original layout with realistic rows (crop_info
+paragraphs from CropPredictor, answers from EnhancedFarmingChatbot for the
+load-test chat messages, 3-class model predictions), migrates a copy with
+database.compact and compares per-table size and the time to fetch rows.
+
+    python -m benchmarks.history_size --rows 20000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from database import FarmingHistoryManager
+from database.compact import LEGACY_SCHEMA, format_size_report, migrate_file
+
+from .fixtures import CHAT_MESSAGES, load_soil_rows
+
+DISEASES = [('Apple Black Rot', 'Captan'), ('Apple Scab', 'Mancozeb'), ('Powdery Mildew', 'Sulfur')]
+
+
+def fill_legacy(db_path, rows, seed):
+    from chatbot.enhanced_chatbot import EnhancedFarmingChatbot
+    from crop_prediction import CropPredictor
+
+    rng = random.Random(seed)
+    crop_info = CropPredictor().crop_info
+    chatbot = EnhancedFarmingChatbot()
+    answers = [(message, chatbot.generate_reply(message)) for message in CHAT_MESSAGES]
+    soil_rows = load_soil_rows()
+
+    conn = sqlite3.connect(db_path)
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    crops, detections, chats = [], [], []
+    for i in range(rows):
+        soil = rng.choice(soil_rows)
+        crop = rng.choice(list(crop_info))
+        crops.append(tuple(soil.values()) + (crop, rng.uniform(40, 100), crop_info[crop]))
+
+        weights = [rng.random() for _ in DISEASES]
+        total = sum(weights)
+        predictions = sorted(({'disease': name, 'confidence': w / total * 100} for (name, _), w in zip(DISEASES, weights)),
+                             key=lambda p: p['confidence'], reverse=True)
+        pesticide = dict(DISEASES)[predictions[0]['disease']]
+        detections.append((f'leaf_{i}.jpg', predictions[0]['disease'], predictions[0]['confidence'], pesticide,
+                           False, json.dumps(predictions)))
+
+        message, answer = rng.choice(answers)
+        chats.append((message, answer, 'offline_enhanced'))
+    conn.executemany('''INSERT INTO crop_recommendations (nitrogen, phosphorus, potassium, temperature, humidity,
+                        ph, rainfall, recommended_crop, confidence, crop_info) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     crops)
+    conn.executemany('''INSERT INTO disease_detections (image_name, detected_disease, confidence, pesticide,
+                        is_healthy, all_predictions) VALUES (?, ?, ?, ?, ?, ?)''', detections)
+    conn.executemany('INSERT INTO chatbot_queries (user_query, bot_response, chatbot_type) VALUES (?, ?, ?)', chats)
+    conn.commit()
+    conn.close()
+
+
+READS = {
+    'crops': ('SELECT * FROM crop_recommendations ORDER BY timestamp DESC LIMIT ?',
+              '''SELECT c.*, t.body FROM crop_recommendations c LEFT JOIN texts t ON t.id = c.crop_info_id
+                 ORDER BY c.timestamp DESC LIMIT ?'''),
+    'chatbot': ('SELECT * FROM chatbot_queries ORDER BY timestamp DESC LIMIT ?',
+                '''SELECT q.*, t.body FROM chatbot_queries q LEFT JOIN texts t ON t.id = q.bot_response_id
+                   ORDER BY q.timestamp DESC LIMIT ?'''),
+    'diseases': ('SELECT * FROM disease_detections ORDER BY timestamp DESC LIMIT ?',
+                 'SELECT * FROM disease_detections ORDER BY timestamp DESC LIMIT ?')
+}
+
+
+def time_reads(db_path, which, limit, repeat=5):
+    """Best-of-repeat ms to fetch limit rows (with their text) from each table."""
+    timings = {}
+    conn = sqlite3.connect(db_path)
+    for name, queries in READS.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(queries[which], (limit,)).fetchall()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    conn.close()
+    return timings
+
+
+def check_rehydration(legacy_path, compact_path, limit=1000):
+    """The compact readers must return the same text as the legacy columns."""
+    conn = sqlite3.connect(legacy_path)
+    crop_info = [row[0] for row in conn.execute(
+        'SELECT crop_info FROM crop_recommendations ORDER BY timestamp DESC, id LIMIT ?', (limit,))]
+    answers = [row[0] for row in conn.execute(
+        'SELECT bot_response FROM chatbot_queries ORDER BY timestamp DESC, id LIMIT ?', (limit,))]
+    conn.close()
+    history = FarmingHistoryManager(compact_path)
+    assert sorted(history.get_crop_recommendations(limit)['crop_info']) == sorted(crop_info)
+    assert sorted(history.get_chatbot_queries(limit)['bot_response']) == sorted(answers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare history size before and after the compact schema')
+    parser.add_argument('--rows', type=int, default=20000, help='Rows per table')
+    parser.add_argument('--read-limit', type=int, default=10000, help='Rows fetched by each timed read')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        compact_path = os.path.join(tmp, 'compact.db')
+        fill_legacy(legacy_path, args.rows, args.seed)
+        shutil.copy(legacy_path, compact_path)
+
+        start = time.perf_counter()
+        migrated, before, after = migrate_file(compact_path)
+        print(f"{args.rows} rows per table; migrated {migrated} rows in {time.perf_counter() - start:.2f}s\n")
+        print(format_size_report(before, after))
+
+        legacy_reads = time_reads(legacy_path, 0, args.read_limit)
+        compact_reads = time_reads(compact_path, 1, args.read_limit)
+        print(f"\nfetch {args.read_limit} rows (best of 5): "
+              + ', '.join(f"{name} {legacy_reads[name]:.1f} -> {compact_reads[name]:.1f} ms" for name in READS))
+        check_rehydration(legacy_path, compact_path)
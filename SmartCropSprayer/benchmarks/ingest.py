@@ -0,0 +1,117 @@
+"""Edge-device sync: one log call per record versus bulk NDJSON ingestion.
+
+Generates --records disease detections and crop recommendations (as an
+offline rig would log them over --days days) and loads them into a fresh
+history database three ways:
+
+  per-record  FarmingHistoryManager.log_* for each record (one connection
+              and one transaction each, as the live endpoints do)
+  bulk        the gzip NDJSON body through ingest.parse_lines and
+              FarmingHistoryManager.ingest (--chunk-size rows per transaction)
+  resend      the same body again, which must insert nothing
+
+and reports records per second. Bulk row counts and rollups are checked
+against the per-record load.
+
+    python -m benchmarks.ingest --records 20000 --chunk-size 1000
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from database import FarmingHistoryManager, ingest
+
+from .fixtures import load_soil_rows
+from .history_size import DISEASES
+
+
+def make_records(count, days, seed):
+    rng = random.Random(seed)
+    soil_rows = load_soil_rows()
+    now = datetime.now(timezone.utc)
+    records = []
+    for i in range(count):
+        timestamp = (now - timedelta(seconds=rng.uniform(0, days * 86400))).strftime('%Y-%m-%dT%H:%M:%SZ')
+        record = {'idempotency_key': f'rig1-{i:08d}', 'timestamp': timestamp, 'confidence': rng.uniform(40, 100)}
+        if i % 2:
+            disease, pesticide = rng.choice(DISEASES)
+            record.update(type='disease', detected_disease=disease, pesticide=pesticide, image_name=f'leaf_{i}.jpg',
+                          is_healthy=disease == 'Healthy',
+                          all_predictions=[{'disease': name, 'confidence': 100.0 / len(DISEASES)}
+                                           for name, _ in DISEASES])
+        else:
+            soil = rng.choice(soil_rows)
+            record.update(type='crop', recommended_crop=rng.choice(['rice', 'maize', 'chickpea', 'cotton']),
+                          crop_info=None, **{field: float(soil[field]) for field in ingest.SOIL_FIELDS})
+        records.append(record)
+    return records
+
+
+def per_record(db_path, records):
+    history = FarmingHistoryManager(db_path)
+    start = time.perf_counter()
+    for record in records:
+        clean = ingest.validate(record)
+        # log_* stamp the current time; give them the record's own
+        with mock.patch('database.partitions.utc_now', return_value=clean['timestamp']):
+            if clean['type'] == 'disease':
+                history.log_disease_detection(clean['image_name'], clean['detected_disease'], clean['confidence'],
+                                              clean['pesticide'], clean['is_healthy'], clean['all_predictions'])
+            else:
+                history.log_crop_recommendation(*(clean[field] for field in ingest.SOIL_FIELDS),
+                                                clean['recommended_crop'], clean['confidence'], clean['crop_info'])
+    return time.perf_counter() - start
+
+
+def bulk(db_path, body, chunk_size, max_lines):
+    history = FarmingHistoryManager(db_path)
+    start = time.perf_counter()
+    stream = gzip.GzipFile(fileobj=io.BytesIO(body), mode='rb')
+    stats = history.ingest(ingest.parse_lines(stream, max_lines), chunk_size)
+    return time.perf_counter() - start, stats
+
+
+def summary(db_path):
+    conn = sqlite3.connect(db_path)
+    result = tuple(conn.execute(sql).fetchall() for sql in (
+        'SELECT COUNT(*) FROM disease_detections', 'SELECT COUNT(*) FROM crop_recommendations',
+        'SELECT kind, period, bucket, label, count FROM history_rollups ORDER BY 1, 2, 3, 4'))
+    conn.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time per-record logging against bulk NDJSON sync')
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=90, help='Spread records over this many past days')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Records per bulk transaction')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    records = make_records(args.records, args.days, args.seed)
+    raw = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+    body = gzip.compress(raw)
+    print(f"{args.records} records over {args.days} days: {len(raw) / 2**20:.1f} MB NDJSON, "
+          f"{len(body) / 2**20:.1f} MB gzip\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        one_s = per_record(os.path.join(tmp, 'per_record.db'), records)
+        bulk_path = os.path.join(tmp, 'bulk.db')
+        bulk_s, stats = bulk(bulk_path, body, args.chunk_size, args.records)
+        resend_s, resent = bulk(bulk_path, body, args.chunk_size, args.records)
+        assert sum(stats.inserted.values()) == args.records and not stats.rejected
+        assert resent.duplicates == args.records and not any(resent.inserted.values())
+        assert summary(bulk_path) == summary(os.path.join(tmp, 'per_record.db')), 'bulk and per-record loads differ'
+
+        print(f"{'load':<12} {'seconds':>8} {'records/s':>10} {'transactions':>13}")
+        print(f"{'per-record':<12} {one_s:>8.2f} {args.records / one_s:>10,.0f} {args.records:>13}")
+        print(f"{'bulk':<12} {bulk_s:>8.2f} {args.records / bulk_s:>10,.0f} {stats.chunks:>13}")
+        print(f"{'resend':<12} {resend_s:>8.2f} {args.records / resend_s:>10,.0f} {resent.chunks:>13}")
@@ -0,0 +1,227 @@
+"""End-to-end load generator for the Flask API.
+
+Replays a weighted mix of disease, crop, chatbot and history requests built
+from test_samples/ and data/crop_recommendation.csv, then reports throughput,
+latency percentiles, histograms and error rates per endpoint.
+
+    # start a local server with a throwaway database and drive it
+    python -m benchmarks.loadtest run --mix disease=2,crop=5,chatbot=2,history=1 \\
+        --concurrency 16 --duration 30 --output results/today.json
+
+    # or target an already running server
+    python -m benchmarks.loadtest run --url http://127.0.0.1:5000 ...
+
+    # flag regressions between two runs
+    python -m benchmarks.loadtest compare results/baseline.json results/today.json --threshold 10
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from .fixtures import RequestFactory
+from .server import LocalServer
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def parse_mix(text):
+    """'disease=2,crop=5' -> {'disease': 2.0, 'crop': 5.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in RequestFactory.ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'; choose from {', '.join(RequestFactory.ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def histogram(latencies_ms):
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for value in latencies_ms:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+    return dict(zip(labels, counts))
+
+
+def summarize(samples, elapsed):
+    """samples: {endpoint: [(latency_ms, ok, status), ...]}"""
+    report = {}
+    for endpoint, rows in sorted(samples.items()):
+        latencies = sorted(latency for latency, _, _ in rows)
+        errors = sum(1 for _, ok, _ in rows if not ok)
+        statuses = {}
+        for _, _, status in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[endpoint] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows) if rows else 0.0,
+            'throughput': len(rows) / elapsed if elapsed else 0.0,
+            'latency_ms': {
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else None
+            },
+            'histogram': histogram(latencies),
+            'status_codes': statuses
+        }
+    return report
+
+
+def run_load(host, port, mix, concurrency=8, duration=30.0, seed=0):
+    """Closed-loop load: each client sends its next request as soon as the last returns."""
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    samples = {endpoint: [] for endpoint in endpoints}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(client_id):
+        chooser = random.Random(seed * 1000 + client_id)
+        factory = RequestFactory(seed=seed * 1000 + client_id)
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        local = {endpoint: [] for endpoint in endpoints}
+        while time.monotonic() < stop_at:
+            endpoint = chooser.choices(endpoints, weights)[0]
+            method, path, body, headers = factory.build(endpoint)
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                status = 0
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+            latency_ms = (time.perf_counter() - start) * 1000
+            local[endpoint].append((latency_ms, 0 < status < 400, status))
+        conn.close()
+        with lock:
+            for endpoint, rows in local.items():
+                samples[endpoint].extend(rows)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    return summarize(samples, elapsed), elapsed
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    meta = {
+        'timestamp': datetime.now().isoformat(),
+        'mix': mix,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'seed': args.seed,
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version()
+    }
+
+    if args.url:
+        target = urlparse(args.url)
+        meta['target'] = args.url
+        endpoints, elapsed = run_load(target.hostname, target.port or 80, mix,
+                                      args.concurrency, args.duration, args.seed)
+    else:
+        meta['target'] = 'local'
+        with LocalServer(port=args.port) as server:
+            endpoints, elapsed = run_load(server.host, server.port, mix,
+                                          args.concurrency, args.duration, args.seed)
+    meta['elapsed'] = elapsed
+
+    print(f"{'endpoint':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, stats in endpoints.items():
+        latency = stats['latency_ms']
+        if not stats['requests']:
+            print(f"{endpoint:<10} {'-':>8}")
+            continue
+        print(f"{endpoint:<10} {stats['throughput']:>8.1f} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+              f"{latency['p99']:>8.1f} {stats['error_rate'] * 100:>6.2f}%")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'endpoints': endpoints}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+def compare(baseline, current, threshold):
+    """Return a list of regression messages (throughput drop or p95 increase above threshold %)."""
+    regressions = []
+    for endpoint, old in baseline['endpoints'].items():
+        new = current['endpoints'].get(endpoint)
+        if not new or not old['requests'] or not new['requests']:
+            continue
+        if old['throughput'] and (old['throughput'] - new['throughput']) / old['throughput'] * 100 > threshold:
+            regressions.append(f"{endpoint}: throughput {old['throughput']:.1f} -> {new['throughput']:.1f} req/s")
+        old_p95, new_p95 = old['latency_ms']['p95'], new['latency_ms']['p95']
+        if old_p95 and (new_p95 - old_p95) / old_p95 * 100 > threshold:
+            regressions.append(f"{endpoint}: p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+        if new['error_rate'] > old['error_rate'] + threshold / 100:
+            regressions.append(f"{endpoint}: error rate {old['error_rate']:.2%} -> {new['error_rate']:.2%}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SmartCropSprayer load generator')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Drive the API and report per-endpoint latency')
+    run_parser.add_argument('--url', help='Target server; omit to start a local one')
+    run_parser.add_argument('--port', type=int, default=5099, help='Port for the local server')
+    run_parser.add_argument('--mix', default='disease=2,crop=5,chatbot=2,history=1',
+                            help='Weighted traffic mix, e.g. disease=2,crop=5')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30.0, help='Seconds')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help='Write JSON results here')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='Allowed regression in percent')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0f}%")
+        raise SystemExit(1 if regressions else 0)
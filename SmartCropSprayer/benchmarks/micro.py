@@ -0,0 +1,379 @@
+"""Micro-benchmarks for the model and storage hot paths.
+
+Each benchmark is timed in isolation: the process is pinned to one CPU
+(where the OS allows it), torch uses a single thread, the GC is disabled
+while timing, every case gets warm-up calls, and the per-call time is taken
+from several repetitions of an auto-calibrated inner loop. Peak memory per
+call is measured separately with tracemalloc so it does not skew timings.
+
+    python -m benchmarks.micro run                        # print results
+    python -m benchmarks.micro run --output current.json
+    python -m benchmarks.micro run --save-baseline        # refresh benchmarks/baseline.json
+    python -m benchmarks.micro compare benchmarks/baseline.json current.json --threshold 15
+    python -m benchmarks.micro run --compare benchmarks/baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+
+_benchmarks = {}
+
+
+def benchmark(name):
+    """Register fn(ctx) -> callable; the returned callable is what gets timed."""
+    def register(fn):
+        _benchmarks[name] = fn
+        return fn
+    return register
+
+
+class Context:
+    """Lazily built, shared fixtures so each model is loaded once per run."""
+
+    def __init__(self):
+        self._cache = {}
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def get(self, key, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def detector(self):
+        from disease_detection import DiseaseDetector
+        return self.get('detector', DiseaseDetector)
+
+    @property
+    def crop_predictor(self):
+        from crop_prediction import CropPredictor
+        return self.get('crop_predictor', CropPredictor)
+
+    @property
+    def image(self):
+        def load():
+            from PIL import Image
+            from .fixtures import load_images
+            import io
+            name, content = load_images()[0]
+            image = Image.open(io.BytesIO(content))
+            image.load()
+            return image
+        return self.get('image', load)
+
+    @property
+    def soil_rows(self):
+        from .fixtures import load_soil_rows
+        return self.get('soil_rows', lambda: load_soil_rows()[:200])
+
+    @property
+    def history(self):
+        def build():
+            from database import FarmingHistoryManager
+            manager = FarmingHistoryManager(os.path.join(self._tmp.name, 'history.db'))
+            # Realistic table sizes for the read benchmarks
+            for i in range(1000):
+                manager.log_crop_recommendation(90, 42, 43, 20.8, 82.0, 6.5, 202.9, 'rice', 55.0,
+                                                'Rice grows best in warm, humid climates.')
+                manager.log_disease_detection(f'leaf_{i}.jpg', 'Apple Scab', 87.5, 'Mancozeb', False,
+                                              [{'disease': 'Apple Scab', 'confidence': 87.5}])
+                manager.log_chatbot_query('How do I treat apple scab?', 'Apply Mancozeb.', 'offline_enhanced')
+            return manager
+        return self.get('history', build)
+
+    def close(self):
+        self._tmp.cleanup()
+
+
+def _cycle(items):
+    state = {'i': 0}
+
+    def next_item():
+        item = items[state['i'] % len(items)]
+        state['i'] += 1
+        return item
+    return next_item
+
+
+@benchmark('disease.preprocess_image')
+def _(ctx):
+    detector, image = ctx.detector, ctx.image
+    return lambda: detector.preprocess_image(image)
+
+
+@benchmark('disease.forward')
+def _(ctx):
+    import torch
+    detector = ctx.detector
+    if detector.model is None:
+        return None
+    tensor = detector.preprocess_image(ctx.image)
+
+    def forward():
+        with torch.no_grad():
+            detector.model(tensor)
+    return forward
+
+
+@benchmark('disease.rule_based_detection')
+def _(ctx):
+    detector, image = ctx.detector, ctx.image
+    return lambda: detector._rule_based_detection(image)
+
+
+@benchmark('crop.predict')
+def _(ctx):
+    predictor, next_row = ctx.crop_predictor, _cycle(ctx.soil_rows)
+    return lambda: predictor.predict(**next_row())
+
+
+@benchmark('crop.rule_based_prediction')
+def _(ctx):
+    predictor, next_row = ctx.crop_predictor, _cycle(ctx.soil_rows)
+    return lambda: predictor._get_rule_based_prediction(**next_row())
+
+
+@benchmark('chatbot.enhanced.generate_reply')
+def _(ctx):
+    from chatbot.enhanced_chatbot import EnhancedFarmingChatbot
+    from .fixtures import CHAT_MESSAGES
+    bot, next_message = ctx.get('enhanced_chatbot', EnhancedFarmingChatbot), _cycle(CHAT_MESSAGES)
+    return lambda: bot.generate_reply(next_message())
+
+
+@benchmark('chatbot.offline.generate_reply')
+def _(ctx):
+    from chatbot.offline_chatbot import OfflineFarmingChatbot
+    from .fixtures import CHAT_MESSAGES
+    bot, next_message = ctx.get('offline_chatbot', OfflineFarmingChatbot), _cycle(CHAT_MESSAGES)
+
+    def reply():
+        bot.generate_reply(next_message())
+        # Keep the history from growing across millions of calls
+        bot.conversation_history.clear()
+    return reply
+
+
+@benchmark('history.log_crop_recommendation')
+def _(ctx):
+    history = ctx.history
+    return lambda: history.log_crop_recommendation(90, 42, 43, 20.8, 82.0, 6.5, 202.9, 'rice', 55.0,
+                                                   'Rice grows best in warm, humid climates.')
+
+
+@benchmark('history.log_disease_detection')
+def _(ctx):
+    history = ctx.history
+    predictions = [{'disease': 'Apple Scab', 'confidence': 87.5}, {'disease': 'Healthy', 'confidence': 12.5}]
+    return lambda: history.log_disease_detection('leaf.jpg', 'Apple Scab', 87.5, 'Mancozeb', False, predictions)
+
+
+@benchmark('history.log_chatbot_query')
+def _(ctx):
+    history = ctx.history
+    return lambda: history.log_chatbot_query('How do I treat apple scab?', 'Apply Mancozeb.', 'offline_enhanced')
+
+
+@benchmark('history.get_crop_recommendations')
+def _(ctx):
+    history = ctx.history
+    return lambda: history.get_crop_recommendations(limit=100)
+
+
+@benchmark('history.get_disease_detections')
+def _(ctx):
+    history = ctx.history
+    return lambda: history.get_disease_detections(limit=100)
+
+
+@benchmark('history.get_chatbot_queries')
+def _(ctx):
+    history = ctx.history
+    return lambda: history.get_chatbot_queries(limit=100)
+
+
+@benchmark('history.get_statistics')
+def _(ctx):
+    history = ctx.history
+    return history.get_statistics
+
+
+def pin_cpu(cpu):
+    """Pin this process to one CPU; returns the CPU used or None if unsupported."""
+    if cpu is None or not hasattr(os, 'sched_setaffinity'):
+        return None
+    try:
+        os.sched_setaffinity(0, {cpu})
+        return cpu
+    except OSError:
+        return None
+
+
+def time_call(fn, warmup=3, repeats=7, min_time=0.2):
+    """Per-call seconds for each repeat, with an inner loop sized to run >= min_time."""
+    for _ in range(warmup):
+        fn()
+
+    # Calibrate the inner loop so timer resolution is negligible
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            timings.append((time.perf_counter() - start) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return timings, loops
+
+
+def peak_memory(fn):
+    """Peak bytes allocated by Python during one call."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def run(names=None, warmup=3, repeats=7, min_time=0.2, cpu=0):
+    pinned = pin_cpu(cpu)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    ctx = Context()
+    results = {}
+    try:
+        for name, factory in _benchmarks.items():
+            if names and not any(pattern in name for pattern in names):
+                continue
+            fn = factory(ctx)
+            if fn is None:
+                print(f"{name:<36} skipped (not available)")
+                continue
+            timings, loops = time_call(fn, warmup, repeats, min_time)
+            timings_sorted = sorted(timings)
+            quartile = max(1, len(timings_sorted) // 4)
+            results[name] = {
+                'median_us': statistics.median(timings) * 1e6,
+                'min_us': timings_sorted[0] * 1e6,
+                'mean_us': statistics.fmean(timings) * 1e6,
+                'stdev_us': (statistics.stdev(timings) if len(timings) > 1 else 0.0) * 1e6,
+                'iqr_us': (timings_sorted[-quartile - 1] - timings_sorted[quartile]) * 1e6,
+                'loops': loops,
+                'repeats': repeats,
+                'peak_memory_bytes': peak_memory(fn)
+            }
+            r = results[name]
+            print(f"{name:<36} {r['median_us']:>12.1f} us  (min {r['min_us']:.1f}, "
+                  f"stdev {r['stdev_us']:.1f})  peak {r['peak_memory_bytes'] / 1024:.1f} KiB")
+    finally:
+        ctx.close()
+
+    meta = {
+        'timestamp': datetime.now().isoformat(),
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'pinned_cpu': pinned,
+        'warmup': warmup,
+        'min_time': min_time
+    }
+    return {'meta': meta, 'benchmarks': results}
+
+
+def compare(baseline, current, threshold):
+    """Return regression messages where median time or peak memory grew beyond threshold %."""
+    regressions = []
+    print(f"{'benchmark':<36} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name, new in current['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            print(f"{name:<36} {'-':>12} {new['median_us']:>12.1f}      new")
+            continue
+        change = (new['median_us'] - old['median_us']) / old['median_us'] * 100
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(f"{name}: {old['median_us']:.1f} -> {new['median_us']:.1f} us ({change:+.1f}%)")
+        print(f"{name:<36} {old['median_us']:>12.1f} {new['median_us']:>12.1f} {change:>+7.1f}%{flag}")
+
+        old_mem, new_mem = old.get('peak_memory_bytes'), new.get('peak_memory_bytes')
+        # Ignore tiny allocations where a few objects swing the percentage
+        if old_mem and new_mem and new_mem > 64 * 1024 and (new_mem - old_mem) / old_mem * 100 > threshold:
+            regressions.append(f"{name}: peak memory {old_mem} -> {new_mem} bytes")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SmartCropSprayer micro-benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run benchmarks')
+    run_parser.add_argument('--filter', nargs='+', help='Only run benchmarks whose name contains one of these')
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--repeats', type=int, default=7)
+    run_parser.add_argument('--min-time', type=float, default=0.2, help='Seconds per repetition')
+    run_parser.add_argument('--cpu', type=int, default=0, help='CPU to pin to (-1 to disable)')
+    run_parser.add_argument('--output', help='Write JSON results here')
+    run_parser.add_argument('--save-baseline', action='store_true', help=f'Write results to {BASELINE_PATH}')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='Compare against a baseline file after running')
+    run_parser.add_argument('--threshold', type=float, default=15.0, help='Allowed slowdown in percent')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=15.0, help='Allowed slowdown in percent')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        current = run(args.filter, args.warmup, args.repeats, args.min_time, None if args.cpu < 0 else args.cpu)
+        for path in filter(None, [args.output, BASELINE_PATH if args.save_baseline else None]):
+            with open(path, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"Results written to {path}")
+        if not args.compare:
+            raise SystemExit(0)
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0f}%")
+    raise SystemExit(1 if regressions else 0)
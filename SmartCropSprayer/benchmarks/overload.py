@@ -0,0 +1,72 @@
+"""Overload check for admission control.
+
+Starts a local server twice, once with admission control off and once with
+it on, and drives both with the same disease-heavy mix well above what one
+worker can serve. For each run it reports per-endpoint throughput, p95 of
+successful requests, shed responses (429/503) and the shed/degraded
+counters scraped from /metrics.
+
+    python -m benchmarks.overload --concurrency 24 --duration 20
+
+Admission control is working when crop and history keep a low p95 in the
+"on" run while disease requests are shed or degraded instead of queueing.
+"""
+import argparse
+import http.client
+import json
+import os
+
+from .loadtest import parse_mix, run_load
+from .server import LocalServer
+
+
+def scrape_admission_counters(host, port):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('GET', '/metrics')
+    text = conn.getresponse().read().decode('utf-8')
+    conn.close()
+    return [line for line in text.splitlines()
+            if line.startswith(('scs_admission_shed_total', 'scs_admission_degraded_total'))]
+
+
+def run_phase(label, args, env):
+    mix = parse_mix(args.mix)
+    with LocalServer(port=args.port, WEB_WORKERS=1, WEB_THREADS=args.threads, **env) as server:
+        report, elapsed = run_load(server.host, server.port, mix, args.concurrency, args.duration, args.seed)
+        counters = scrape_admission_counters(server.host, server.port)
+
+    print(f"\nadmission {label} ({elapsed:.1f}s)")
+    print(f"{'endpoint':<10} {'req/s':>8} {'p95 ms':>10} {'429':>6} {'503':>6} {'other err':>10}")
+    for endpoint, stats in report.items():
+        statuses = stats['status_codes']
+        shed_429 = statuses.get('429', 0)
+        shed_503 = statuses.get('503', 0)
+        other = stats['errors'] - shed_429 - shed_503
+        p95 = stats['latency_ms']['p95']
+        print(f"{endpoint:<10} {stats['throughput']:>8.1f} {p95 if p95 is not None else 0:>10.1f} "
+              f"{shed_429:>6} {shed_503:>6} {other:>10}")
+    for line in counters:
+        print(f"  {line}")
+    return {'elapsed': elapsed, 'endpoints': report, 'counters': counters}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare behaviour under overload with and without admission control')
+    parser.add_argument('--mix', default='disease=6,crop=2,history=2')
+    parser.add_argument('--concurrency', type=int, default=24)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--threads', type=int, default=8, help='WEB_THREADS of the single worker')
+    parser.add_argument('--limits', default='disease=1:2', help='ADMISSION_LIMITS for the "on" run')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write both runs as JSON')
+    args = parser.parse_args()
+
+    results = {
+        'off': run_phase('off', args, {'ADMISSION_ENABLED': '0'}),
+        'on': run_phase('on', args, {'ADMISSION_ENABLED': '1', 'ADMISSION_LIMITS': args.limits})
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
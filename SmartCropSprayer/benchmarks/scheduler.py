@@ -0,0 +1,134 @@
+"""Interactive latency under a concurrent bulk job, with and without the scheduler.
+
+Runs in one process, like a web worker with JOBS_IN_PROCESS set:
+
+  1. interactive only: single-image detections arriving at random intervals;
+  2. + bulk job, unscheduled: in-process job workers score a large image
+     folder with the same DiseaseDetector, competing freely;
+  3. + bulk job, scheduled: the same, with every call going through
+     ModelScheduler (interactive vs bulk classes).
+
+    python -m benchmarks.scheduler --duration 20 --bulk-threads 2
+
+Exits non-zero when the scheduled interactive p95 is more than
+--tolerance times the interactive-only p95 (plus one bulk service time,
+the unavoidable wait for a call already running).
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from jobs import JobQueue, start_worker_threads, use_models
+from serving import ModelScheduler
+
+from .fixtures import load_images
+from .loadtest import percentile
+
+
+def make_bulk_folder(directory, copies):
+    """Fill directory with `copies` links to every sample image."""
+    sources = [os.path.abspath(os.path.join('test_samples', name)) for name in sorted(os.listdir('test_samples'))]
+    for i in range(copies):
+        for source in sources:
+            os.symlink(source, os.path.join(directory, f'{i:05d}_{os.path.basename(source)}'))
+
+
+def interactive_load(detector, scheduler, images, duration, mean_gap, seed):
+    rng = random.Random(seed)
+    latencies = []
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        time.sleep(rng.expovariate(1.0 / mean_gap))
+        image = Image.open(io.BytesIO(images[rng.randrange(len(images))]))
+        image.load()
+        start = time.perf_counter()
+        if scheduler is not None:
+            with scheduler.slot('interactive'):
+                detector.detect_disease(image)
+        else:
+            detector.detect_disease(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies)
+
+
+def run_phase(label, detector, images, args, bulk_folder=None, scheduled=False):
+    scheduler = ModelScheduler('disease', slots=1) if scheduled else None
+    # None removes any scheduler left over from the previous phase
+    use_models(detector=detector, schedulers={'disease': scheduler})
+
+    queue = job = workers = None
+    tmp = tempfile.TemporaryDirectory()
+    if bulk_folder:
+        queue = JobQueue(os.path.join(tmp.name, 'jobs.db'), os.path.join(tmp.name, 'results'))
+        job = queue.submit('disease', bulk_folder, chunk_size=8)
+        workers = start_worker_threads(queue, args.bulk_threads, poll_interval=0.1)
+        time.sleep(1.0)  # let the job get going
+
+    latencies = interactive_load(detector, scheduler, images, args.duration, args.gap / 1000, args.seed)
+
+    bulk_rate = None
+    if bulk_folder:
+        processed = queue.get(job['id'])['processed']
+        for worker in workers:
+            worker.stop()
+        queue.cancel(job['id'])
+        bulk_rate = processed / (args.duration + 1.0)
+        time.sleep(0.5)
+    tmp.cleanup()
+
+    p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+    bulk = f"{bulk_rate:8.1f}" if bulk_rate is not None else f"{'-':>8}"
+    print(f"{label:<24} {len(latencies):>6} {p50:>9.1f} {p95:>9.1f} {bulk}")
+    return p95, scheduler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Interactive p95 with a concurrent bulk job')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per phase')
+    parser.add_argument('--gap', type=float, default=200, help='Mean ms between interactive requests')
+    parser.add_argument('--bulk-threads', type=int, default=2)
+    parser.add_argument('--copies', type=int, default=500, help='Copies of test_samples in the bulk folder')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Without models/model.pth, time an untrained ResNet18 instead of the rule-based fallback')
+    args = parser.parse_args()
+
+    import torch
+    from disease_detection import DiseaseDetector
+    torch.set_num_threads(int(os.environ.get('TORCH_THREADS', 1)))
+    detector = DiseaseDetector()
+    if detector.model is None and args.random_weights:
+        from torchvision import models
+        detector.model = models.resnet18(weights=None)
+        detector.model.fc = torch.nn.Linear(detector.model.fc.in_features, len(detector.class_names))
+        detector.model.eval()
+    images = [data for _, data in load_images()]
+
+    # Service time of one detection, for the pass criterion
+    sample = Image.open(io.BytesIO(images[0]))
+    sample.load()
+    start = time.perf_counter()
+    for _ in range(10):
+        detector.detect_disease(sample)
+    service_ms = (time.perf_counter() - start) * 100
+
+    with tempfile.TemporaryDirectory() as bulk_folder:
+        make_bulk_folder(bulk_folder, args.copies)
+        print(f"one detection: {service_ms:.1f} ms, bulk threads: {args.bulk_threads}\n")
+        print(f"{'phase':<24} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'bulk/s':>8}")
+        alone, _ = run_phase('interactive only', detector, images, args)
+        unscheduled, _ = run_phase('+ bulk, unscheduled', detector, images, args, bulk_folder)
+        scheduled, scheduler = run_phase('+ bulk, scheduled', detector, images, args, bulk_folder, scheduled=True)
+
+    print(f"\nscheduler: {scheduler.stats()}")
+    limit = alone * args.tolerance + service_ms
+    verdict = 'PASS' if scheduled <= limit else 'FAIL'
+    print(f"{verdict}: scheduled p95 {scheduled:.1f} ms (limit {limit:.1f} ms, unscheduled {unscheduled:.1f} ms)")
+    sys.exit(0 if verdict == 'PASS' else 1)
@@ -0,0 +1,74 @@
+"""Start the app locally (gunicorn, or waitress on Windows) for benchmarks."""
+import http.client
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def wait_until_ready(host, port, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+class LocalServer:
+    """Context manager running the production entry point on 127.0.0.1:port.
+
+    Everything the server writes (history, jobs, archived uploads,
+    embeddings, profiles, metric snapshots) goes to a temporary directory,
+    so benchmark traffic never lands in the real database/, uploads/ or
+    profiles/. Extra environment variables (e.g. WEB_WORKERS) are passed
+    through to the server.
+    """
+
+    def __init__(self, port=5099, **env):
+        self.host = '127.0.0.1'
+        self.port = port
+        self.env = {key: str(value) for key, value in env.items()}
+        self.process = None
+        self._tmp = None
+
+    def __enter__(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = self._tmp.name
+        env = dict(os.environ, WEB_HOST=self.host, WEB_PORT=str(self.port), WEB_LOG_LEVEL='warning',
+                   HISTORY_DB=os.path.join(tmp, 'history.db'),
+                   JOBS_DB=os.path.join(tmp, 'jobs.db'),
+                   JOBS_RESULTS_DIR=os.path.join(tmp, 'job_results'),
+                   UPLOAD_FOLDER=os.path.join(tmp, 'uploads'),
+                   EMBEDDINGS_DIR=os.path.join(tmp, 'embeddings'),
+                   PROFILE_DIR=os.path.join(tmp, 'profiles'),
+                   METRICS_DIR=os.path.join(tmp, 'metrics'))
+        env.update(self.env)
+        if importlib.util.find_spec('gunicorn') is not None:
+            command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+        else:
+            command = [sys.executable, 'wsgi.py']
+        self.process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+        if not wait_until_ready(self.host, self.port):
+            self.__exit__(None, None, None)
+            raise RuntimeError(f"Server did not start on port {self.port}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.process is not None and self.process.poll() is None:
+            # SIGTERM = graceful drain under gunicorn
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+        return False
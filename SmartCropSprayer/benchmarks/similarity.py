@@ -0,0 +1,75 @@
+"""Similar-case search: exact float16 scan versus the IVF-PQ index.
+
+Fills an embedding store with --vectors synthetic 512-d embeddings (unit
+vectors around --clusters centres, like leaf images of a few diseases seen
+under varying conditions), builds the IVF-PQ index and times top-k queries
+both ways. Recall is the share of the exact top k that the index returns.
+
+    python -m benchmarks.similarity --vectors 100000 1000000 --nprobe 8 16 32
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from database.embeddings import EmbeddingStore
+from disease_detection.similarity import SimilarCases, search_exact
+
+VERSION = 'bench'
+
+
+def fill(store, count, dim, clusters, seed, batch=100000):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        # Spread within clusters comparable to the spread between them
+        vectors = centres[rng.integers(0, clusters, size)] + rng.standard_normal((size, dim)).astype(np.float32)
+        store.append_many(VERSION, np.arange(offset, offset + size), vectors)
+    return centres
+
+
+def timed(fn, queries):
+    """(median ms, p95 ms, results)."""
+    times, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times)), float(np.percentile(times, 95)), results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time exact and IVF-PQ similarity search')
+    parser.add_argument('--vectors', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9} {'mode':<12} {'median ms':>10} {'p95 ms':>8} {'recall@' + str(args.k):>10}")
+    for count in args.vectors:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = EmbeddingStore(tmp)
+            fill(store, count, args.dim, args.clusters, args.seed)
+            similar = SimilarCases(store)
+            ids, vectors = store.load(VERSION)
+            rng = np.random.default_rng(args.seed + 1)
+            queries = [np.asarray(vectors[row], dtype=np.float32) for row in rng.integers(0, count, args.queries)]
+
+            exact_ms, exact_p95, exact = timed(lambda q: search_exact(vectors, q, args.k)[0], queries)
+            print(f"{count:>9,} {'exact':<12} {exact_ms:>10.1f} {exact_p95:>8.1f} {1:>10.3f}")
+
+            start = time.perf_counter()
+            index = similar.build(VERSION)
+            print(f"{'':>9} build: {len(index.centroids)} lists, {index.codes.shape[1]} B/vector, "
+                  f"{time.perf_counter() - start:.1f}s")
+            for nprobe in args.nprobe:
+                ms, p95, found = timed(lambda q: similar.search(VERSION, q, args.k, nprobe=nprobe)[0], queries)
+                recall = np.mean([len(set(ids[want]) & {case for case, _ in got}) / args.k
+                                  for want, got in zip(exact, found)])
+                print(f"{'':>9} {'ivfpq/' + str(nprobe):<12} {ms:>10.1f} {p95:>8.1f} {recall:>10.3f}")
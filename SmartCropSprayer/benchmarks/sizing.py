@@ -0,0 +1,54 @@
+"""Worker sizing benchmark for the gunicorn deployment.
+
+Starts gunicorn once per worker count, drives each endpoint on its own with
+a fixed number of keep-alive client connections and reports requests/sec:
+
+    python -m benchmarks.sizing --workers 1 2 4 8 --concurrency 16 --duration 20
+
+History writes go to a throwaway database, never database/farming_history.db.
+"""
+import argparse
+import json
+import os
+
+from .fixtures import RequestFactory
+from .loadtest import run_load
+from .server import LocalServer
+
+
+def run(worker_counts, endpoints, concurrency, duration, threads, port):
+    results = []
+    for workers in worker_counts:
+        with LocalServer(port=port, WEB_WORKERS=workers, WEB_THREADS=threads) as server:
+            row = {'workers': workers, 'threads': threads}
+            for endpoint in endpoints:
+                report, _ = run_load(server.host, server.port, {endpoint: 1}, concurrency, duration)
+                stats = report[endpoint]
+                row[endpoint] = round(stats['throughput'], 1)
+                row[f'{endpoint}_errors'] = stats['errors']
+                row[f'{endpoint}_p95_ms'] = stats['latency_ms']['p95']
+                print(f"workers={workers} {endpoint}: {stats['throughput']:.1f} req/s ({stats['errors']} errors)")
+            results.append(row)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Requests/sec per endpoint as gunicorn workers scale')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='Threads per worker')
+    parser.add_argument('--endpoints', nargs='+', default=RequestFactory.ENDPOINTS)
+    parser.add_argument('--concurrency', type=int, default=16, help='Client connections')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per endpoint')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.workers, args.endpoints, args.concurrency, args.duration, args.threads, args.port)
+
+    print('\nworkers | ' + ' | '.join(f'{e:>8}' for e in args.endpoints))
+    for row in results:
+        print(f"{row['workers']:>7} | " + ' | '.join(f"{row[e]:>8.1f}" for e in args.endpoints))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'concurrency': args.concurrency,
+                       'duration': args.duration, 'results': results}, f, indent=2)
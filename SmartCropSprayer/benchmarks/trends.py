@@ -0,0 +1,93 @@
+"""Trend queries from the rollups versus aggregating the raw history.
+
+Fills a partitioned history database with disease detections spread over
+the last --days days, backfills the rollups (database.rollups) and times a
+daily and a weekly trend over 30 days and over the whole range: once from
+history_rollups and once the old way, reading the rows with pandas and
+grouping them.
+
+    python -m benchmarks.trends --rows 200000 --days 365
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from database import FarmingHistoryManager
+from database import partitions, rollups
+
+from .history_size import DISEASES
+
+
+def fill(db_path, rows, days, seed):
+    rng = random.Random(seed)
+    FarmingHistoryManager(db_path)
+    now = datetime.now(timezone.utc)
+    detections = {}
+    for i in range(rows):
+        timestamp = (now - timedelta(seconds=rng.uniform(0, days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+        disease, pesticide = rng.choice(DISEASES)
+        detections.setdefault(partitions.month_of(timestamp), []).append(
+            (timestamp, f'leaf_{i}.jpg', disease, rng.uniform(40, 100), pesticide, False))
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    for month, batch in sorted(detections.items()):
+        name = partitions.create_partition(cursor, 'disease_detections', month)
+        cursor.executemany(f'''INSERT INTO {name} (timestamp, image_name, detected_disease, confidence, pesticide,
+                               is_healthy) VALUES (?, ?, ?, ?, ?, ?)''', batch)
+    cursor.execute('COMMIT')
+    start = time.perf_counter()
+    rollups.backfill(conn)
+    conn.close()
+    return time.perf_counter() - start
+
+
+def pandas_trend(db_path, period, start, end):
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query('SELECT timestamp, detected_disease, confidence FROM disease_detections', conn,
+                           parse_dates=['timestamp'])
+    conn.close()
+    day = df['timestamp'].dt.normalize()
+    df['bucket'] = day - pd.to_timedelta(day.dt.weekday, unit='D') if period == 'week' else day
+    df = df[(df['bucket'] >= pd.Timestamp(rollups.bucket_start(start, period))) & (df['bucket'] <= pd.Timestamp(end))]
+    return df.groupby(['bucket', 'detected_disease'])['confidence'].agg(['count', 'mean'])
+
+
+def best_ms(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time trend queries from rollups and from raw rows')
+    parser.add_argument('--rows', type=int, default=200000, help='Disease detections to generate')
+    parser.add_argument('--days', type=int, default=365, help='Spread rows over this many past days')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'history.db')
+        backfill_s = fill(db_path, args.rows, args.days, args.seed)
+        history = FarmingHistoryManager(db_path)
+        print(f"{args.rows} detections over {args.days} days; backfill took {backfill_s:.2f}s\n")
+
+        end = datetime.now(timezone.utc).date()
+        print(f"{'query':<16} {'rollups ms':>11} {'pandas ms':>10}")
+        for period, span in (('day', 30), ('day', args.days), ('week', args.days)):
+            start = end - timedelta(days=span - 1)
+            rollup_ms, rows = best_ms(lambda: history.get_trends('disease', period, start, end), args.repeat)
+            pandas_ms, frame = best_ms(lambda: pandas_trend(db_path, period, start, end), 1)
+            assert sum(row['count'] for row in rows) == int(frame['count'].sum())
+            print(f"{period + ' x ' + str(span):<16} {rollup_ms:>11.2f} {pandas_ms:>10.1f}")
@@ -4,16 +4,20 @@ from crop_prediction import CropPredictor
 from disease_detection import DiseaseDetector
 
 class EnhancedFarmingChatbot:
-    def __init__(self):
+    def __init__(self, crop_predictor=None, disease_detector=None):
         self.conversation_history = []
-        self.crop_predictor = CropPredictor()
+        # Pass the app's predictor/detector to share them instead of loading second copies
+        self.crop_predictor = crop_predictor or CropPredictor()
         
         # Try to load disease detector, but don't fail if it errors
-        try:
-            self.disease_detector = DiseaseDetector()
-        except Exception as e:
-            print(f"Warning: Could not initialize DiseaseDetector: {e}")
-            self.disease_detector = None
+        if disease_detector is not None:
+            self.disease_detector = disease_detector
+        else:
+            try:
+                self.disease_detector = DiseaseDetector()
+            except Exception as e:
+                print(f"Warning: Could not initialize DiseaseDetector: {e}")
+                self.disease_detector = None
         
         # Extract crop names and info from predictor
         self.crop_info = self.crop_predictor.crop_info
@@ -1,17 +1,37 @@
 import os
-from openai import OpenAI
+import threading
+from .llm_client import PooledChatClient, CircuitBreaker
 
 class FarmingAssistant:
-    def __init__(self):
+    def __init__(self, fallback_factory=None):
         api_key = os.environ.get("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
         
         # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
         # do not change this unless explicitly requested by the user
-        self.client = OpenAI(api_key=api_key)
+        # OPENAI_BASE_URL can point at a local mock server (python -m chatbot.mock_server)
+        self.client = PooledChatClient(
+            api_key=api_key,
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+            max_connections=int(os.environ.get("CHATBOT_MAX_CONNECTIONS", 10)),
+            deadline=float(os.environ.get("CHATBOT_TIMEOUT", 20)),
+            max_retries=int(os.environ.get("CHATBOT_MAX_RETRIES", 1)),
+            max_concurrency=int(os.environ.get("CHATBOT_MAX_CONCURRENCY", 8)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("CHATBOT_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.environ.get("CHATBOT_BREAKER_RESET", 30))
+            )
+        )
         self.model = "gpt-5"
         self.conversation_history = []
+        self._history_lock = threading.Lock()
+        
+        # Offline chatbot used when the upstream call fails or the breaker is open.
+        # Built lazily so online mode does not pay for a second set of models.
+        self.fallback_factory = fallback_factory
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
         
         self.system_prompt = """You are an expert agricultural advisor with deep knowledge of farming practices, crop management, soil science, pest control, and sustainable agriculture.
 
@@ -32,26 +52,51 @@ Guidelines:
 Focus areas: crop recommendation, disease diagnosis, soil management, irrigation, pest control, fertilization, organic farming, and seasonal planning."""
     
     def chat(self, user_message):
+        return self.reply(user_message)[0]
+    
+    def reply(self, user_message):
+        """Return (message, source) where source is 'online' or 'offline_enhanced'."""
+        user_turn = {"role": "user", "content": user_message}
+        with self._history_lock:
+            messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history[-19:] + [user_turn]
+        
         try:
-            self.conversation_history.append({"role": "user", "content": user_message})
-            
-            messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history[-20:]
-            
             # gpt-5 doesn't support temperature parameter, do not use it.
-            response = self.client.chat.completions.create(
+            assistant_message = self.client.complete(
                 model=self.model,
                 messages=messages,
                 max_completion_tokens=500
             )
             
-            assistant_message = response.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": assistant_message})
+            # Both turns only after a successful call, so a failed one leaves no orphan user turn
+            with self._history_lock:
+                self.conversation_history.append(user_turn)
+                self.conversation_history.append({"role": "assistant", "content": assistant_message})
             
-            return assistant_message
+            return assistant_message, 'online'
             
         except Exception as e:
+            fallback = self._get_fallback()
+            if fallback is not None:
+                return fallback.generate_reply(user_message), 'offline_enhanced'
             error_msg = f"I apologize, but I'm having trouble connecting right now. Error: {str(e)}"
-            return error_msg
+            return error_msg, 'online'
+    
+    def _get_fallback(self):
+        if self.fallback_factory is None:
+            return None
+        with self._fallback_lock:
+            if self._fallback is None:
+                try:
+                    self._fallback = self.fallback_factory()
+                except Exception as e:
+                    print(f"Warning: Could not initialize fallback chatbot: {e}")
+                    self.fallback_factory = None
+            return self._fallback
+    
+    def get_stats(self):
+        """Upstream client metrics (counters, breaker state, latency percentiles)."""
+        return self.client.get_stats()
     
     def get_farming_tips(self, topic):
         topic_prompts = {
@@ -79,4 +124,5 @@ Focus areas: crop recommendation, disease diagnosis, soil management, irrigation
         return self.chat(prompt)
     
     def reset_conversation(self):
-        self.conversation_history = []
+        with self._history_lock:
+            self.conversation_history = []
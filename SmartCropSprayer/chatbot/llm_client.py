@@ -0,0 +1,221 @@
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from openai import OpenAI, APIConnectionError, APIStatusError
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is refusing upstream calls."""
+
+
+class ConcurrencyLimitError(Exception):
+    """Raised when no upstream call slot frees up in time."""
+
+
+def is_retryable(error):
+    """True for timeouts, connection errors, 429 and 5xx: failures a later attempt may not repeat."""
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may go upstream right now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: let exactly one probe through
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class PooledChatClient:
+    """Chat completion client with keep-alive pooling, deadlines and a concurrency cap.
+
+    One instance is shared by every Flask worker thread. Connections are kept
+    alive in an httpx pool, each call gets a hard deadline covering all retry
+    attempts, at most ``max_concurrency`` calls run upstream at once, and a
+    circuit breaker stops calling a failing upstream altogether.
+    """
+
+    def __init__(self, api_key, base_url=None, max_connections=10, max_keepalive=5,
+                 keepalive_expiry=30.0, connect_timeout=3.0, deadline=20.0, max_retries=1,
+                 max_concurrency=8, acquire_timeout=0.5, breaker=None, retry_backoff=0.25):
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        # Base delay before a retry; doubled per attempt, with full jitter
+        self.retry_backoff = retry_backoff
+        self.acquire_timeout = acquire_timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        self._http = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(deadline, connect=connect_timeout)
+        )
+        # Retries are handled here so they count against the per-call deadline
+        self._client = OpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=0)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counts = {
+            'requests': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'rejected': 0,
+            'short_circuited': 0
+        }
+        self._in_flight = 0
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._counts[key] += amount
+
+    def complete(self, model, messages, deadline=None, **kwargs):
+        """Run a chat completion and return the message text.
+
+        Raises CircuitOpenError or ConcurrencyLimitError without touching the
+        network. Timeouts, connection errors, 429 and 5xx are retried after a
+        jittered backoff while the deadline allows; the last one is re-raised
+        once the retry budget or the deadline is exhausted. Any other error
+        (a 4xx from a reachable upstream) is raised at once and does not
+        count against the circuit breaker.
+        """
+        self._count('requests')
+        # Slot first: a half-open breaker's single probe must not be spent on a call that never runs
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._count('rejected')
+            raise ConcurrencyLimitError('Too many concurrent chat requests')
+
+        if not self.breaker.allow_request():
+            self._slots.release()
+            self._count('short_circuited')
+            raise CircuitOpenError('Upstream chat service is unavailable')
+
+        with self._stats_lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        end_by = time.monotonic() + (deadline or self.deadline)
+        try:
+            attempt = 0
+            while True:
+                remaining = end_by - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise httpx.TimeoutException('Chat request deadline exceeded')
+                    timeout = httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining))
+                    response = self._client.with_options(timeout=timeout).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        **kwargs
+                    )
+                    break
+                except Exception as e:
+                    if not is_retryable(e):
+                        self._record_rejection(start)
+                        raise
+                    delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                    if attempt >= self.max_retries or end_by - time.monotonic() <= delay:
+                        self._record_failure(e, start)
+                        raise
+                    attempt += 1
+                    self._count('retries')
+                    time.sleep(delay)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        self.breaker.record_success()
+        with self._stats_lock:
+            self._counts['successes'] += 1
+            self._latencies.append(time.perf_counter() - start)
+        return response.choices[0].message.content
+
+    def _record_failure(self, error, start):
+        self.breaker.record_failure()
+        with self._stats_lock:
+            self._counts['failures'] += 1
+            if isinstance(error, httpx.TimeoutException) or 'timed out' in str(error).lower():
+                self._counts['timeouts'] += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    def _record_rejection(self, start):
+        # The upstream answered, so it is healthy as far as the breaker is concerned
+        self.breaker.record_success()
+        with self._stats_lock:
+            self._counts['failures'] += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    def get_stats(self):
+        """Return call counters, breaker state and latency percentiles (seconds)."""
+        with self._stats_lock:
+            stats = dict(self._counts)
+            stats['in_flight'] = self._in_flight
+            latencies = sorted(self._latencies)
+
+        stats['max_concurrency'] = self.max_concurrency
+        stats['breaker_state'] = self.breaker.state
+        if latencies:
+            stats['latency_p50'] = latencies[int(0.50 * (len(latencies) - 1))]
+            stats['latency_p95'] = latencies[int(0.95 * (len(latencies) - 1))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def close(self):
+        self._http.close()
@@ -0,0 +1,76 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Lets the online chatbot path be exercised without network access:
+
+    python -m chatbot.mock_server --port 8001 --delay 0.2 --failure-rate 0.1
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay=0.0, failure_rate=0.0, reply='Mock farming advice.'):
+    class MockChatHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so connection pooling is visible
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+
+            if delay:
+                time.sleep(delay)
+
+            if not self.path.endswith('/chat/completions'):
+                return self._send(404, {'error': {'message': 'Not found'}})
+            if random.random() < failure_rate:
+                return self._send(500, {'error': {'message': 'Injected failure'}})
+
+            self._send(200, {
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'mock'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': reply},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+            })
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockChatHandler
+
+
+def serve(host='127.0.0.1', port=8001, delay=0.0, failure_rate=0.0):
+    """Create (but do not start) a mock server; call serve_forever() on the result."""
+    return ThreadingHTTPServer((host, port), make_handler(delay, failure_rate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock OpenAI chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before replying')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay, args.failure_rate)
+    print(f"Mock chat API listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
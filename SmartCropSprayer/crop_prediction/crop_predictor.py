@@ -1,14 +1,39 @@
 import pickle
 import os
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
+
+# Feature order used by the model and the rule tables
+FEATURES = ['nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Rule-based fallback as range tables: a crop earns the bonus for every feature
+# strictly inside (low, high). Scores start at 50 and are capped at 100.
+RULE_GROUPS = [
+    (['rice', 'jute', 'banana'], {'rainfall': (150, np.inf, 30), 'humidity': (70, np.inf, 20)}),
+    (['cotton', 'maize', 'mango'], {'rainfall': (50, 100, 25), 'temperature': (20, 30, 25)}),
+    (['apple', 'grapes'], {'temperature': (-np.inf, 25, 30), 'rainfall': (50, 125, 20)}),
+    (['chickpea', 'lentil', 'mothbeans'], {'rainfall': (-np.inf, 60, 30), 'nitrogen': (-np.inf, 50, 20)}),
+]
+GENERAL_RULES = {
+    'ph': (6.0, 7.5, 10),
+    'nitrogen': (40, np.inf, 5),
+    'phosphorus': (30, np.inf, 5),
+    'potassium': (30, np.inf, 5),
+}
 
 class CropPredictor:
-    def __init__(self):
+    def __init__(self, lookup_table_path=None):
         self.model = None
         self.model_path = os.path.join('models', 'RandomForest.pkl')
+        # Flat copy written by train_model.py; preferred because it maps instead of unpickling
+        self.forest_path = os.path.join('models', 'RandomForest.forest')
         self.load_model()
         
+        # Optional precomputed grid (see lookup_table.py) for O(1) recommendations
+        self.lookup_table = None
+        self.lookup_table_path = lookup_table_path
+        if lookup_table_path:
+            self.load_lookup_table(lookup_table_path)
+        
         self.crop_info = {
             'rice': 'Rice grows best in warm, humid climates with temperatures between 20-35°C. Requires flooded fields or heavy rainfall (150-300 cm annually). Suitable for clayey or loamy soil with pH 5.5-7.0. Growing season: 3-6 months.',
             'maize': 'Maize thrives in moderate temperatures (18-27°C) with well-distributed rainfall (50-75 cm). Prefers well-drained loamy soil with pH 5.5-7.5. Rich in nitrogen and phosphorus requirements. Growing season: 3-5 months.',
@@ -33,25 +58,112 @@ class CropPredictor:
             'jute': 'Jute grows in warm, humid climate with temperatures 24-35°C. Requires heavy rainfall (150-250 cm) during growing season. Best in fertile alluvial soil with pH 6.0-7.5. Growing season: 4-5 months.',
             'coffee': 'Coffee grows in tropical highlands with temperatures 15-24°C. Requires well-distributed rainfall (150-250 cm). Prefers well-drained volcanic or loamy soil rich in organic matter with pH 6.0-6.5. Shade-loving perennial shrub.'
         }
+        self._build_rule_tables()
     
     def load_model(self):
-        if os.path.exists(self.model_path):
-            try:
-                with open(self.model_path, 'rb') as f:
-                    self.model = pickle.load(f)
-                print(f"Crop recommendation model loaded from {self.model_path}")
-            except Exception as e:
-                print(f"Warning: Could not load model from {self.model_path}: {e}")
-                self.model = None
-        else:
+        if not os.path.exists(self.model_path) and not os.path.exists(self.forest_path):
             print(f"Warning: Model file not found at {self.model_path}")
             print("Please run train_model.py to train a new model")
             self.model = None
+            return
+        try:
+            self.model, source = self._read_model()
+            print(f"Crop recommendation model {source}")
+        except Exception as e:
+            print(f"Warning: Could not load model from {self.model_path}: {e}")
+            self.model = None
+    
+    def _read_model(self):
+        """Return (model, description) without touching self.model.
+        
+        Prefers the flat forest when it was exported from the current pickle.
+        The model carries a version attribute (sha256 prefix of the pickle).
+        """
+        from .forest_format import file_sha256
+        model = self._load_flat_forest()
+        if model is not None:
+            source = f"mapped from {self.forest_path}"
+            version = model.source_sha256
+        else:
+            with open(self.model_path, 'rb') as f:
+                model = pickle.load(f)
+            source = f"loaded from {self.model_path}"
+            version = file_sha256(self.model_path)
+        model.version = (version or 'unknown')[:12]
+        return model, source
+    
+    def _load_flat_forest(self):
+        if not os.path.exists(self.forest_path):
+            return None
+        from .forest_format import load_forest, file_sha256
+        try:
+            forest = load_forest(self.forest_path)
+        except Exception as e:
+            print(f"Warning: Could not load flat forest from {self.forest_path}: {e}")
+            return None
+        if os.path.exists(self.model_path) and forest.source_sha256 != file_sha256(self.model_path):
+            print(f"Warning: {self.forest_path} does not match {self.model_path}; run train_model.py --export-only")
+            return None
+        return forest
+    
+    @property
+    def model_version(self):
+        return getattr(self.model, 'version', None) or 'rule-based'
+    
+    def artifact_paths(self):
+        return [self.model_path, self.forest_path]
+    
+    def validate_model(self, model, samples_path=os.path.join('data', 'crop_recommendation.csv'), min_accuracy=0.8):
+        """Score the labelled sample CSV; raises ValueError if accuracy is below min_accuracy."""
+        data = np.genfromtxt(samples_path, delimiter=',', names=True, dtype=None, encoding='utf-8')
+        X = np.column_stack([data[name].astype(np.float64) for name in data.dtype.names[:len(FEATURES)]])
+        probabilities = np.asarray(model.predict_proba(X))
+        if probabilities.shape != (len(X), len(model.classes_)) or not np.isfinite(probabilities).all():
+            raise ValueError(f"unexpected predict_proba output {probabilities.shape}")
+        accuracy = float(np.mean(np.asarray(model.classes_)[probabilities.argmax(axis=1)] == data['label']))
+        if accuracy < min_accuracy:
+            raise ValueError(f"sample accuracy {accuracy:.1%} is below {min_accuracy:.0%}")
+        return {'samples': len(X), 'accuracy': accuracy}
+    
+    def reload(self, min_accuracy=0.8):
+        """Load the model files in the caller's thread, validate, then swap them in.
+        
+        Requests already running keep the model they started with. The lookup
+        table is reloaded (or dropped) since it is tied to a specific pickle.
+        Raises, leaving the current model in place, if loading or validation fails.
+        """
+        model, source = self._read_model()
+        validation = self.validate_model(model, min_accuracy=min_accuracy)
+        # Stop serving the stale table before the new model goes live
+        self.lookup_table = None
+        self.model = model
+        if self.lookup_table_path:
+            self.load_lookup_table(self.lookup_table_path)
+        print(f"Crop recommendation model {source} (version {model.version})")
+        return {'version': model.version, 'validation': validation,
+                'lookup_table': self.lookup_table is not None}
+    
+    def load_lookup_table(self, path):
+        from .lookup_table import CropLookupTable
+        try:
+            table = CropLookupTable(path)
+        except Exception as e:
+            print(f"Warning: Could not load crop lookup table from {path}: {e}")
+            self.lookup_table = None
+            return
+        if not table.matches_model(self.model_path):
+            print(f"Warning: Lookup table {path} was built from a different model; using exact prediction")
+            self.lookup_table = None
+            return
+        self.lookup_table = table
+        print(f"Crop lookup table loaded from {path} (bins={table.meta['bins']})")
     
     def predict(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
         # Predict exactly as in Tkinter version: direct numpy array with correct feature order
         # Features order: N, P, K, temperature, humidity, ph, rainfall
-        if self.model is not None:
+        # One read of self.model: a concurrent reload() cannot change it mid-request
+        model = self.model
+        if model is not None:
             try:
                 # Convert all inputs to float and create array exactly like Tkinter
                 input_data = [[float(nitrogen),
@@ -63,8 +175,8 @@ class CropPredictor:
                               float(rainfall)]]
                 
                 # Get prediction probabilities
-                probabilities = self.model.predict_proba(input_data)[0]
-                classes = self.model.classes_
+                probabilities = model.predict_proba(input_data)[0]
+                classes = model.classes_
                 
                 # Get top predictions sorted by probability
                 top_indices = np.argsort(probabilities)[::-1]
@@ -85,46 +197,94 @@ class CropPredictor:
         # Fallback to rule-based prediction if model fails
         return self._get_rule_based_prediction(nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall)
     
-    def _get_rule_based_prediction(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
-        scores = {}
+    def _build_rule_tables(self):
+        """Compile RULE_GROUPS/GENERAL_RULES into crops x features range tables."""
+        self._rule_crops = list(self.crop_info.keys())
+        shape = (len(self._rule_crops), len(FEATURES))
+        self._rule_low = np.full(shape, -np.inf)
+        self._rule_high = np.full(shape, np.inf)
+        self._rule_bonus = np.zeros(shape)
+        for crops, rules in RULE_GROUPS:
+            for crop in crops:
+                row = self._rule_crops.index(crop)
+                for feature, (low, high, bonus) in rules.items():
+                    col = FEATURES.index(feature)
+                    self._rule_low[row, col] = low
+                    self._rule_high[row, col] = high
+                    self._rule_bonus[row, col] = bonus
         
-        for crop in self.crop_info.keys():
-            score = 50
-            
-            if crop in ['rice', 'jute', 'banana']:
-                if rainfall > 150: score += 30
-                if humidity > 70: score += 20
-            elif crop in ['cotton', 'maize', 'mango']:
-                if 50 < rainfall < 100: score += 25
-                if 20 < temperature < 30: score += 25
-            elif crop in ['apple', 'grapes']:
-                if temperature < 25: score += 30
-                if 50 < rainfall < 125: score += 20
-            elif crop in ['chickpea', 'lentil', 'mothbeans']:
-                if rainfall < 60: score += 30
-                if nitrogen < 50: score += 20
-            
-            if 6.0 < ph < 7.5: score += 10
-            if nitrogen > 40: score += 5
-            if phosphorus > 30: score += 5
-            if potassium > 30: score += 5
-            
-            scores[crop] = min(score, 100)
+        self._general_low = np.full(len(FEATURES), -np.inf)
+        self._general_high = np.full(len(FEATURES), np.inf)
+        self._general_bonus = np.zeros(len(FEATURES))
+        for feature, (low, high, bonus) in GENERAL_RULES.items():
+            col = FEATURES.index(feature)
+            self._general_low[col] = low
+            self._general_high[col] = high
+            self._general_bonus[col] = bonus
+    
+    def score_rule_based_batch(self, X):
+        """Rule-based scores for many inputs at once.
         
-        sorted_crops = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        X is (rows, 7) in N, P, K, temperature, humidity, ph, rainfall order.
+        Returns a (rows, crops) array whose columns follow self._rule_crops.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+        x = X[:, np.newaxis, :]
+        group_hits = (x > self._rule_low) & (x < self._rule_high)
+        general_hits = (X > self._general_low) & (X < self._general_high)
+        scores = 50 + (group_hits * self._rule_bonus).sum(axis=2) + (general_hits * self._general_bonus).sum(axis=1)[:, np.newaxis]
+        return np.minimum(scores, 100)
+    
+    def _get_rule_based_prediction(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
+        scores = self.score_rule_based_batch([nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall])[0]
+        
+        # Stable sort keeps crop_info order among equal scores
+        order = np.argsort(-scores, kind='stable')
         predictions = []
-        for crop_name, confidence in sorted_crops:
+        for idx in order:
             predictions.append({
-                'crop': crop_name,
-                'confidence': float(confidence)
+                'crop': self._rule_crops[idx],
+                'confidence': float(scores[idx])
             })
         
         return predictions
     
+    def predict_batch(self, X, top_n=3):
+        """Top-n predictions for many inputs with one model call.
+
+        X is (rows, 7) in FEATURES order. Returns one list of
+        {'crop', 'confidence'} dicts per row, ordered like predict().
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+        model = self.model
+        if model is not None:
+            try:
+                probabilities = model.predict_proba(X)
+                classes = model.classes_
+                order = np.argsort(probabilities, axis=1)[:, ::-1][:, :top_n]
+                return [[{'crop': classes[idx], 'confidence': probabilities[row, idx] * 100} for idx in indices]
+                        for row, indices in enumerate(order)]
+            except Exception as e:
+                print(f"Error in batch model prediction: {e}")
+
+        scores = self.score_rule_based_batch(X)
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :top_n]
+        return [[{'crop': self._rule_crops[idx], 'confidence': float(scores[row, idx])} for idx in indices]
+                for row, indices in enumerate(order)]
+
     def get_top_recommendations(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, top_n=3):
-        predictions = self.predict(nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall)
+        top_predictions = None
+        table = self.lookup_table
+        if table is not None and top_n <= table.top_k:
+            features = [float(nitrogen), float(phosphorus), float(potassium),
+                        float(temperature), float(humidity), float(ph), float(rainfall)]
+            hits = table.lookup(features)
+            if hits is not None:
+                top_predictions = [{'crop': crop, 'confidence': confidence} for crop, confidence in hits[:top_n]]
         
-        top_predictions = predictions[:top_n]
+        if top_predictions is None:
+            predictions = self.predict(nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall)
+            top_predictions = predictions[:top_n]
         
         for pred in top_predictions:
             crop_name = pred['crop']
@@ -0,0 +1,182 @@
+"""Flat, memory-mappable storage for the crop RandomForest.
+
+Layout of a .forest file (little-endian):
+
+    8 bytes   magic b'SCSFRST\\0'
+    4 bytes   format version (uint32)
+    4 bytes   header length (uint32)
+    header    UTF-8 JSON: array table (dtype, shape, offset), classes, sha256 of payload
+    payload   raw arrays, each aligned to 64 bytes
+
+Loading maps the file read-only and exposes every array as a zero-copy view,
+so worker processes share the same page-cache pages and nothing is unpickled.
+"""
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'SCSFRST\0'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<8sII')
+
+
+class ForestFormatError(Exception):
+    """Raised for unreadable, corrupt or incompatible .forest files."""
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class FlatForest:
+    """predict_proba-compatible RandomForest backed by flat node arrays."""
+
+    def __init__(self, arrays, classes, n_features, scaler=None, source_sha256=None):
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.classes_ = np.array(classes, dtype=object)
+        self.n_features_in_ = n_features
+        self.n_estimators = len(self.roots)
+        # (mean, scale) of the optional StandardScaler stored alongside the forest
+        self.scaler = scaler
+        # sha256 of the pickle this forest was exported from, for staleness checks
+        self.source_sha256 = source_sha256
+
+    def _leaves(self, X):
+        # Same split rule as sklearn: float32 inputs, go left when x <= threshold
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_estimators)).copy()
+        while True:
+            left = self.left[node]
+            active = left != -1
+            if not active.any():
+                return node
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(active, np.where(go_left, left, self.right[node]), node)
+
+    def predict_proba(self, X):
+        leaves = self._leaves(X)
+        # Accumulate tree by tree, as sklearn does, so results match bit for bit
+        proba = np.zeros((leaves.shape[0], len(self.classes_)), dtype=np.float64)
+        for t in range(self.n_estimators):
+            proba += self.value[leaves[:, t]]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_forest(forest, path, scaler=None, source_path=None):
+    """Write a fitted RandomForestClassifier (and optional StandardScaler) to path.
+
+    source_path is the pickle the forest came from; its hash is recorded so
+    loaders can tell when the pickle has been replaced.
+    """
+    lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        is_leaf = left == -1
+        lefts.append(np.where(is_leaf, -1, left + offset))
+        rights.append(np.where(is_leaf, -1, right + offset))
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        # Normalise leaf values exactly like DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+        roots.append(offset)
+        offset += tree.node_count
+
+    arrays = {
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'value': np.ascontiguousarray(np.concatenate(values)),
+        'roots': np.array(roots, dtype=np.int64)
+    }
+    if scaler is not None:
+        arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    table = {}
+    payload_size = 0
+    for name, array in arrays.items():
+        payload_size = _align(payload_size)
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': payload_size}
+        payload_size += array.nbytes
+
+    payload = bytearray(payload_size)
+    for name, array in arrays.items():
+        start = table[name]['offset']
+        payload[start:start + array.nbytes] = array.tobytes()
+
+    header = json.dumps({
+        'arrays': table,
+        'classes': [str(c) for c in forest.classes_],
+        'n_features': int(forest.n_features_in_),
+        'source_sha256': file_sha256(source_path) if source_path else None,
+        'payload_sha256': hashlib.sha256(payload).hexdigest()
+    }).encode('utf-8')
+    payload_start = _align(_PREAMBLE.size + len(header))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * (payload_start - _PREAMBLE.size - len(header)))
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_forest(path, verify=True):
+    """Map a .forest file and return a FlatForest whose arrays are views into it."""
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    if mapped.size < _PREAMBLE.size:
+        raise ForestFormatError(f"{path} is too small to be a forest file")
+    magic, version, header_len = _PREAMBLE.unpack(mapped[:_PREAMBLE.size].tobytes())
+    if magic != MAGIC:
+        raise ForestFormatError(f"{path} is not a forest file")
+    if version != FORMAT_VERSION:
+        raise ForestFormatError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+    header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_len].tobytes().decode('utf-8'))
+    payload = mapped[_align(_PREAMBLE.size + header_len):]
+    if verify and hashlib.sha256(payload).hexdigest() != header['payload_sha256']:
+        raise ForestFormatError(f"{path} failed checksum verification")
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = spec['offset']
+        arrays[name] = payload[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    scaler = None
+    if 'scaler_mean' in arrays:
+        scaler = (arrays['scaler_mean'], arrays['scaler_scale'])
+    return FlatForest(arrays, header['classes'], header['n_features'], scaler=scaler,
+                      source_sha256=header.get('source_sha256'))
@@ -0,0 +1,163 @@
+"""Precomputed top-k crop recommendations over a quantized feature grid.
+
+The seven crop inputs are bounded by the ranges the crop prediction form
+accepts, so the RandomForest can be evaluated offline at every cell centre
+of a regular grid. At serve time a recommendation is a single index into a
+memory-mapped .npy file, with no sklearn call.
+
+Build tables and report agreement/size per resolution:
+
+    python -m crop_prediction.lookup_table --bins 6 8 10
+"""
+import argparse
+import json
+import os
+import warnings
+
+import numpy as np
+
+from .forest_format import file_sha256
+
+# Feature order used everywhere in CropPredictor: N, P, K, temperature, humidity, ph, rainfall
+FEATURE_NAMES = ['nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Input ranges accepted by templates/crop_prediction.html
+FEATURE_RANGES = [(0, 150), (0, 150), (0, 200), (-10, 50), (0, 100), (3.0, 10.0), (0, 500)]
+
+
+class CropLookupTable:
+    """Memory-mapped top-k table indexed by quantized feature cell."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(self._meta_path(path), 'r') as f:
+            self.meta = json.load(f)
+        self.classes = self.meta['classes']
+        self.top_k = self.meta['top_k']
+        self.bins = np.array(self.meta['bins'], dtype=np.int64)
+        ranges = np.array(self.meta['ranges'], dtype=np.float64)
+        self.low = ranges[:, 0]
+        self.high = ranges[:, 1]
+        self._scale = self.bins / (self.high - self.low)
+        # Read-only mapping: pages are shared between every process using the table
+        self.table = np.load(path, mmap_mode='r')
+
+    @staticmethod
+    def _meta_path(path):
+        return os.path.splitext(path)[0] + '.json'
+
+    def matches_model(self, model_path):
+        """True if the table was built from the model file currently on disk."""
+        return os.path.exists(model_path) and file_sha256(model_path) == self.meta.get('model_sha256')
+
+    def lookup(self, features):
+        """Return [(crop, confidence_percent), ...] or None if outside the grid."""
+        x = np.asarray(features, dtype=np.float64)
+        if not (np.all(x >= self.low) and np.all(x <= self.high)):
+            return None
+        idx = np.minimum(((x - self.low) * self._scale).astype(np.int64), self.bins - 1)
+        record = self.table[tuple(idx)]
+        return [(self.classes[c], float(conf)) for c, conf in zip(record['crop'], record['confidence'])]
+
+    def lookup_batch(self, X):
+        """Top-1 class index for each row of X (rows outside the grid are clipped)."""
+        X = np.asarray(X, dtype=np.float64)
+        idx = ((X - self.low) * self._scale).astype(np.int64)
+        idx = np.clip(idx, 0, self.bins - 1)
+        return self.table[tuple(idx.T)]['crop'][:, 0]
+
+    @classmethod
+    def build(cls, model, path, bins=8, top_k=3, ranges=None, model_path=None, chunk_size=200000):
+        """Evaluate model.predict_proba at every grid cell centre and write the table."""
+        ranges = np.array(ranges or FEATURE_RANGES, dtype=np.float64)
+        bins = np.broadcast_to(np.asarray(bins, dtype=np.int64), (len(FEATURE_NAMES),)).copy()
+        top_k = min(top_k, len(model.classes_))
+        if len(model.classes_) > 255:
+            raise ValueError('Lookup tables support at most 255 classes')
+
+        centres = [lo + (np.arange(n) + 0.5) * (hi - lo) / n for (lo, hi), n in zip(ranges, bins)]
+        dtype = np.dtype([('crop', np.uint8, (top_k,)), ('confidence', np.float16, (top_k,))])
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npy'
+        table = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=tuple(bins))
+        flat = table.reshape(-1)
+
+        total = int(np.prod(bins))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # sklearn feature-name warning
+            for start in range(0, total, chunk_size):
+                stop = min(start + chunk_size, total)
+                cell = np.unravel_index(np.arange(start, stop), tuple(bins))
+                X = np.column_stack([centres[f][cell[f]] for f in range(len(FEATURE_NAMES))])
+                proba = model.predict_proba(X)
+                # Same ordering (including ties) as CropPredictor.predict
+                order = np.argsort(proba, axis=1)[:, ::-1][:, :top_k]
+                flat['crop'][start:stop] = order
+                flat['confidence'][start:stop] = np.take_along_axis(proba, order, axis=1) * 100
+
+        table.flush()
+        del flat, table
+        os.replace(tmp_path, path)
+
+        meta = {
+            'version': 1,
+            'features': FEATURE_NAMES,
+            'ranges': ranges.tolist(),
+            'bins': bins.tolist(),
+            'top_k': top_k,
+            'classes': [str(c) for c in model.classes_],
+            'model_path': model_path,
+            'model_sha256': file_sha256(model_path) if model_path and os.path.exists(model_path) else None
+        }
+        with open(cls._meta_path(path), 'w') as f:
+            json.dump(meta, f, indent=2)
+        return cls(path)
+
+
+def agreement_rate(table, model, X):
+    """Fraction of rows where the table's top crop equals the model's top crop."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        exact = np.argsort(model.predict_proba(X), axis=1)[:, -1]
+    return float(np.mean(table.lookup_batch(X) == exact))
+
+
+def _evaluation_sets(samples, seed=0):
+    rng = np.random.default_rng(seed)
+    ranges = np.array(FEATURE_RANGES, dtype=np.float64)
+    uniform = rng.uniform(ranges[:, 0], ranges[:, 1], size=(samples, len(FEATURE_NAMES)))
+    sets = {'uniform': uniform}
+    csv_path = os.path.join('data', 'crop_recommendation.csv')
+    if os.path.exists(csv_path):
+        import pandas as pd
+        df = pd.read_csv(csv_path)
+        dataset = df[['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']].to_numpy(dtype=np.float64)
+        sets['dataset'] = np.clip(dataset, ranges[:, 0], ranges[:, 1])
+    return sets
+
+
+if __name__ == '__main__':
+    from .crop_predictor import CropPredictor
+
+    parser = argparse.ArgumentParser(description='Build crop recommendation lookup tables')
+    parser.add_argument('--bins', type=int, nargs='+', default=[8], help='Grid cells per feature (one table per value)')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--output-dir', default='models')
+    parser.add_argument('--samples', type=int, default=20000, help='Random inputs used to measure agreement')
+    args = parser.parse_args()
+
+    predictor = CropPredictor()
+    if predictor.model is None:
+        raise SystemExit('No crop model available; run train_model.py first')
+
+    eval_sets = _evaluation_sets(args.samples)
+    for n in args.bins:
+        path = os.path.join(args.output_dir, f'crop_lookup_{n}.npy')
+        print(f"Building {n}^{len(FEATURE_NAMES)} grid -> {path}")
+        table = CropLookupTable.build(predictor.model, path, bins=n, top_k=args.top_k,
+                                      model_path=predictor.model_path)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        rates = ', '.join(f"{name}: {agreement_rate(table, predictor.model, X) * 100:.2f}%"
+                          for name, X in eval_sets.items())
+        print(f"  bins={n} size={size_mb:.2f} MB top-1 agreement ({rates})")
@@ -1,3 +1,5 @@
 from .farming_history import FarmingHistoryManager
+from .image_archive import ImageArchive
+from .embeddings import EmbeddingStore
 
-__all__ = ['FarmingHistoryManager']
+__all__ = ['FarmingHistoryManager', 'ImageArchive', 'EmbeddingStore']
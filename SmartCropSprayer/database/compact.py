@@ -0,0 +1,320 @@
+"""Compact history schema (user_version 1) and the migration to it.
+
+The original tables repeated long text on every row: the crop_info
+paragraph, canned chatbot answers, and all_predictions as a JSON list.
+Schema version 1 stores:
+
+  * repeated text once in `texts` (keyed by sha1), referenced by
+    crop_recommendations.crop_info_id and chatbot_queries.bot_response_id;
+  * per-class probabilities as little-endian float32 in
+    disease_detections.prediction_scores, with the class names (in the
+    same order) once per distinct ordering in `label_sets`.
+
+Scores keep about 7 significant digits. FarmingHistoryManager migrates an
+old database on startup; to migrate one by hand and see the size change:
+
+    python -m database.compact database/farming_history.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+
+# The original layout (user_version 0), kept for the migration benchmark
+LEGACY_SCHEMA = [
+    '''
+    CREATE TABLE crop_recommendations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        nitrogen REAL, phosphorus REAL, potassium REAL, temperature REAL, humidity REAL, ph REAL, rainfall REAL,
+        recommended_crop TEXT,
+        confidence REAL,
+        crop_info TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE disease_detections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        image_name TEXT,
+        detected_disease TEXT,
+        confidence REAL,
+        pesticide TEXT,
+        is_healthy BOOLEAN,
+        all_predictions TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE chatbot_queries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_query TEXT,
+        bot_response TEXT,
+        chatbot_type TEXT
+    )
+    '''
+]
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS texts (
+        id INTEGER PRIMARY KEY,
+        digest BLOB NOT NULL UNIQUE,
+        body TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS label_sets (
+        id INTEGER PRIMARY KEY,
+        labels TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS crop_recommendations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        nitrogen REAL,
+        phosphorus REAL,
+        potassium REAL,
+        temperature REAL,
+        humidity REAL,
+        ph REAL,
+        rainfall REAL,
+        recommended_crop TEXT,
+        confidence REAL,
+        crop_info_id INTEGER REFERENCES texts (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS disease_detections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        image_name TEXT,
+        detected_disease TEXT,
+        confidence REAL,
+        pesticide TEXT,
+        is_healthy BOOLEAN,
+        label_set_id INTEGER REFERENCES label_sets (id),
+        prediction_scores BLOB,
+        image_sha256 TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_disease_detections_image ON disease_detections (image_sha256)',
+    '''
+    CREATE TABLE IF NOT EXISTS chatbot_queries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_query TEXT,
+        bot_response_id INTEGER REFERENCES texts (id),
+        chatbot_type TEXT
+    )
+    '''
+]
+
+ORIGINAL_FIELDS = {
+    'crop_recommendations': ['id', 'timestamp', 'nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity',
+                             'ph', 'rainfall', 'recommended_crop', 'confidence', 'crop_info'],
+    'disease_detections': ['id', 'timestamp', 'image_name', 'detected_disease', 'confidence', 'pesticide',
+                           'is_healthy', 'all_predictions', 'image_sha256'],
+    'chatbot_queries': ['id', 'timestamp', 'user_query', 'bot_response', 'chatbot_type']
+}
+
+# SELECTs returning the original (schema 0) columns from a compact table or view
+ORIGINAL_COLUMNS = {
+    'crop_recommendations': '''
+        SELECT c.id, c.timestamp, c.nitrogen, c.phosphorus, c.potassium, c.temperature, c.humidity,
+               c.ph, c.rainfall, c.recommended_crop, c.confidence, t.body AS crop_info
+        FROM {table} c LEFT JOIN texts t ON t.id = c.crop_info_id
+    ''',
+    'disease_detections': '''
+        SELECT d.id, d.timestamp, d.image_name, d.detected_disease, d.confidence, d.pesticide, d.is_healthy,
+               l.labels, d.prediction_scores, d.image_sha256
+        FROM {table} d LEFT JOIN label_sets l ON l.id = d.label_set_id
+    ''',
+    'chatbot_queries': '''
+        SELECT q.id, q.timestamp, q.user_query, t.body AS bot_response, q.chatbot_type
+        FROM {table} q LEFT JOIN texts t ON t.id = q.bot_response_id
+    '''
+}
+
+
+def original_rows(cursor, table_name, table=None, order_by='timestamp DESC'):
+    """Yield dicts with the original columns (all_predictions as JSON text) from table (default table_name)."""
+    cursor.execute(ORIGINAL_COLUMNS[table_name].format(table=table or table_name) + f' ORDER BY {order_by}')
+    columns = [d[0] for d in cursor.description]
+    for values in cursor:
+        row = dict(zip(columns, values))
+        if table_name == 'disease_detections':
+            row['all_predictions'] = json.dumps(unpack_predictions(row.pop('labels'), row.pop('prediction_scores')))
+        yield {field: row[field] for field in ORIGINAL_FIELDS[table_name]}
+
+
+def pack_predictions(all_predictions):
+    """[{'disease', 'confidence'}, ...] -> (labels JSON, float32 bytes), order preserved."""
+    labels = json.dumps([p['disease'] for p in all_predictions])
+    scores = np.array([p['confidence'] for p in all_predictions], dtype='<f4')
+    return labels, scores.tobytes()
+
+
+def unpack_predictions(labels, blob):
+    if labels is None or blob is None:
+        return []
+    scores = np.frombuffer(blob, dtype='<f4')
+    return [{'disease': label, 'confidence': float(score)} for label, score in zip(json.loads(labels), scores)]
+
+
+class Interner:
+    """Maps text bodies and label sets to ids, caching ids already seen."""
+
+    def __init__(self, max_cached=4096):
+        self.max_cached = max_cached
+        self._texts = {}
+        self._label_sets = {}
+
+    def text_id(self, cursor, body):
+        if body is None:
+            return None
+        digest = hashlib.sha1(body.encode('utf-8')).digest()
+        text_id = self._texts.get(digest)
+        if text_id is None:
+            cursor.execute('INSERT OR IGNORE INTO texts (digest, body) VALUES (?, ?)', (digest, body))
+            text_id = cursor.execute('SELECT id FROM texts WHERE digest = ?', (digest,)).fetchone()[0]
+            if len(self._texts) < self.max_cached:
+                self._texts[digest] = text_id
+        return text_id
+
+    def label_set_id(self, cursor, labels):
+        label_set_id = self._label_sets.get(labels)
+        if label_set_id is None:
+            cursor.execute('INSERT OR IGNORE INTO label_sets (labels) VALUES (?)', (labels,))
+            label_set_id = cursor.execute('SELECT id FROM label_sets WHERE labels = ?', (labels,)).fetchone()[0]
+            if len(self._label_sets) < self.max_cached:
+                self._label_sets[labels] = label_set_id
+        return label_set_id
+
+
+def _columns(cursor, table):
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+
+
+def is_legacy(cursor):
+    """True if the database still has the original (uncompacted) history tables."""
+    return 'crop_info' in _columns(cursor, 'crop_recommendations')
+
+
+def migrate(conn, batch_size=5000):
+    """Rewrite legacy tables into the compact layout in one transaction.
+
+    Row ids and timestamps are kept. Returns the number of rows migrated.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # Another process may have migrated while we waited for the lock
+        if not is_legacy(cursor):
+            conn.rollback()
+            return 0
+        if 'image_sha256' not in _columns(cursor, 'disease_detections'):
+            cursor.execute('ALTER TABLE disease_detections ADD COLUMN image_sha256 TEXT')
+        cursor.execute('DROP INDEX IF EXISTS idx_disease_detections_image')
+        for table in ('crop_recommendations', 'disease_detections', 'chatbot_queries'):
+            cursor.execute(f'ALTER TABLE {table} RENAME TO legacy_{table}')
+        for statement in SCHEMA:
+            cursor.execute(statement)
+
+        interner = Interner()
+        migrated = 0
+        copies = [
+            ('''SELECT id, timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall,
+                       recommended_crop, confidence, crop_info FROM legacy_crop_recommendations''',
+             lambda row: row[:11] + (interner.text_id(cursor, row[11]),),
+             '''INSERT INTO crop_recommendations
+                (id, timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall,
+                 recommended_crop, confidence, crop_info_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''),
+            ('''SELECT id, timestamp, image_name, detected_disease, confidence, pesticide, is_healthy,
+                       all_predictions, image_sha256 FROM legacy_disease_detections''',
+             lambda row: row[:7] + _packed(cursor, interner, row[7]) + (row[8],),
+             '''INSERT INTO disease_detections
+                (id, timestamp, image_name, detected_disease, confidence, pesticide, is_healthy,
+                 label_set_id, prediction_scores, image_sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''),
+            ('SELECT id, timestamp, user_query, bot_response, chatbot_type FROM legacy_chatbot_queries',
+             lambda row: (row[0], row[1], row[2], interner.text_id(cursor, row[3]), row[4]),
+             '''INSERT INTO chatbot_queries (id, timestamp, user_query, bot_response_id, chatbot_type)
+                VALUES (?, ?, ?, ?, ?)''')
+        ]
+        reader = conn.cursor()
+        for select, convert, insert in copies:
+            reader.execute(select)
+            while True:
+                rows = reader.fetchmany(batch_size)
+                if not rows:
+                    break
+                cursor.executemany(insert, [convert(row) for row in rows])
+                migrated += len(rows)
+        for table in ('crop_recommendations', 'disease_detections', 'chatbot_queries'):
+            cursor.execute(f'DROP TABLE legacy_{table}')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return migrated
+
+
+def _packed(cursor, interner, all_predictions_json):
+    if not all_predictions_json:
+        return None, None
+    labels, blob = pack_predictions(json.loads(all_predictions_json))
+    return interner.label_set_id(cursor, labels), blob
+
+
+def table_sizes(db_path):
+    """Bytes used per table and index (via dbstat when available), plus the file size."""
+    conn = sqlite3.connect(db_path)
+    try:
+        sizes = dict(conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall())
+    except sqlite3.OperationalError:
+        sizes = {}
+    conn.close()
+    sizes['(file)'] = os.path.getsize(db_path)
+    return sizes
+
+
+def format_size_report(before, after):
+    lines = [f"{'table':<32} {'before':>12} {'after':>12} {'change':>8}"]
+    for name in sorted(set(before) | set(after), key=lambda n: (n == '(file)', n)):
+        old, new = before.get(name, 0), after.get(name, 0)
+        change = f"{(new - old) / old:+.0%}" if old else 'new'
+        lines.append(f"{name:<32} {old:>12,} {new:>12,} {change:>8}")
+    return '\n'.join(lines)
+
+
+def migrate_file(db_path, vacuum=True):
+    """Migrate db_path in place and return (rows, sizes before, sizes after)."""
+    before = table_sizes(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    rows = migrate(conn)
+    if rows and vacuum:
+        # Give the freed pages back to the filesystem
+        conn.execute('VACUUM')
+    conn.close()
+    return rows, before, table_sizes(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate a history database to the compact schema')
+    parser.add_argument('db', nargs='?', default=os.environ.get('HISTORY_DB', 'database/farming_history.db'))
+    parser.add_argument('--no-vacuum', action='store_true', help='Skip VACUUM (the file keeps its size)')
+    args = parser.parse_args()
+
+    rows, before, after = migrate_file(args.db, vacuum=not args.no_vacuum)
+    if not rows:
+        print(f"{args.db} is already compact")
+    else:
+        print(f"Migrated {rows} rows in {args.db}\n")
+    print(format_size_report(before, after))
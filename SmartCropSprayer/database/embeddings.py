@@ -0,0 +1,165 @@
+"""Append-only float16 store of disease detection embeddings.
+
+The detector's penultimate-layer features (512 floats for ResNet18) are
+L2-normalized and kept per model version, since vectors from different
+weights are not comparable:
+
+    database/embeddings/<model version>.f16   16-byte header, then N x dim float16
+    database/embeddings/<model version>.ids   N int64 disease_detections ids
+
+Row i of both files belongs to the same detection. Appends from every
+worker process are serialized with a file lock and written at the offset
+given by the .ids length, so a process killed between the two writes
+leaves no misaligned rows. Readers map the files (numpy.memmap) and only
+see rows whose id has been written.
+"""
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b'SCSEMB1\0'
+HEADER = struct.Struct('<8sII')  # magic, dim, reserved
+ID_DTYPE = np.dtype('<i8')
+VECTOR_DTYPE = np.dtype('<f2')
+
+
+def _write_at(fd, data, offset):
+    # lseek + write rather than os.pwrite, which Windows lacks; callers hold the file lock
+    os.lseek(fd, offset, os.SEEK_SET)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class EmbeddingStore:
+    def __init__(self, directory='database/embeddings'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps = {}
+
+    def _paths(self, version):
+        if not re.fullmatch(r'[\w.-]+', version):
+            raise ValueError(f'Invalid model version: {version}')
+        base = os.path.join(self.directory, version)
+        return base + '.f16', base + '.ids'
+
+    def versions(self):
+        """Model versions with stored embeddings, newest file first."""
+        names = [name[:-4] for name in os.listdir(self.directory) if name.endswith('.ids')]
+        return sorted(names, key=lambda name: os.path.getmtime(os.path.join(self.directory, name + '.ids')),
+                      reverse=True)
+
+    @contextmanager
+    def _file_lock(self, fd):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def append(self, version, detection_id, embedding):
+        """Store one detection's embedding (any float array; normalized here)."""
+        self.append_many(version, [detection_id], [embedding])
+
+    def append_many(self, version, detection_ids, embeddings):
+        """Store several embeddings with one lock and two writes."""
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(detection_ids), -1)
+        norms = np.linalg.norm(vectors, axis=1)
+        valid = np.isfinite(norms) & (norms > 0)
+        if not valid.any():
+            return
+        vectors = (vectors[valid] / norms[valid, None]).astype(VECTOR_DTYPE)
+        ids = np.asarray(detection_ids, dtype=ID_DTYPE)[valid]
+        dim = vectors.shape[1]
+        vectors_path, ids_path = self._paths(version)
+        vectors_fd = os.open(vectors_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            with self._file_lock(vectors_fd):
+                if os.fstat(vectors_fd).st_size < HEADER.size:
+                    _write_at(vectors_fd, HEADER.pack(MAGIC, dim, 0), 0)
+                stored_dim = self._read_dim(vectors_fd)
+                if stored_dim != dim:
+                    raise ValueError(f'{version} stores {stored_dim}-d embeddings, got {dim}')
+                ids_fd = os.open(ids_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+                try:
+                    rows = os.fstat(ids_fd).st_size // ID_DTYPE.itemsize
+                    _write_at(vectors_fd, vectors.tobytes(), HEADER.size + rows * dim * VECTOR_DTYPE.itemsize)
+                    _write_at(ids_fd, ids.tobytes(), rows * ID_DTYPE.itemsize)
+                finally:
+                    os.close(ids_fd)
+        finally:
+            os.close(vectors_fd)
+
+    @staticmethod
+    def _read_dim(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        magic, dim, _ = HEADER.unpack(os.read(fd, HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Not an embeddings file')
+        return dim
+
+    def load(self, version):
+        """(ids, vectors) as read-only memory maps, or (None, None) if nothing is stored.
+
+        Maps are reused until either file changes. The key includes the inode,
+        so files deleted and recreated by another worker's clear() are never
+        served from a stale map, even at the same row count.
+        """
+        vectors_path, ids_path = self._paths(version)
+        try:
+            ids_stat = os.stat(ids_path)
+            vectors_stat = os.stat(vectors_path)
+        except OSError:
+            return None, None
+        key = tuple((st.st_ino, st.st_mtime_ns, st.st_size) for st in (ids_stat, vectors_stat))
+        cached = self._maps.get(version)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        rows = ids_stat.st_size // ID_DTYPE.itemsize
+        if not rows:
+            return None, None
+        with open(vectors_path, 'rb') as f:
+            dim = self._read_dim(f.fileno())
+        ids = np.memmap(ids_path, dtype=ID_DTYPE, mode='r', shape=(rows,))
+        vectors = np.memmap(vectors_path, dtype=VECTOR_DTYPE, mode='r', offset=HEADER.size, shape=(rows, dim))
+        self._maps[version] = (key, (ids, vectors))
+        return ids, vectors
+
+    def find(self, detection_id, versions=None):
+        """(version, row) holding detection_id's embedding, or (None, None)."""
+        for version in versions or self.versions():
+            ids, _ = self.load(version)
+            if ids is None:
+                continue
+            rows = np.flatnonzero(ids == detection_id)
+            if len(rows):
+                return version, int(rows[-1])
+        return None, None
+
+    def clear(self):
+        """Delete every stored embedding (used when the history is cleared)."""
+        self._maps = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(('.f16', '.ids', '.ivfpq.npz')):
+                os.remove(os.path.join(self.directory, name))
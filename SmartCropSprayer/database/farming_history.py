@@ -1,112 +1,204 @@
 import sqlite3
 import os
-import pandas as pd
-from datetime import datetime
-import json
+from datetime import date
+import functools
+from . import ingest, partitions, rollups
+from .versions import WriteVersions
+from .compact import (SCHEMA, SCHEMA_VERSION, ORIGINAL_FIELDS, Interner, is_legacy, migrate, original_rows,
+                      pack_predictions)
+
+# The history API has always sent timestamps as HTTP dates (how Flask's JSON
+# encoder renders datetimes); http_date() produces the same text from the column.
+DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+@functools.lru_cache(maxsize=4096)
+def _http_day(day):
+    weekday = DAY_NAMES[date.fromisoformat(day).weekday()]
+    return f'{weekday}, {day[8:10]} {MONTH_NAMES[int(day[5:7]) - 1]} {day[:4]} '
+
+
+def http_date(timestamp):
+    """'2026-10-18 23:49:15' -> 'Sun, 18 Oct 2026 23:49:15 GMT'."""
+    if timestamp is None:
+        return None
+    return _http_day(timestamp[:10]) + timestamp[11:19] + ' GMT'
+
+
+# Rows served by the history API, columns in sorted order (the JSON key order)
+HISTORY_QUERIES = {
+    'crops': '''
+        SELECT c.confidence, t.body AS crop_info, c.humidity, c.nitrogen, c.ph, c.phosphorus, c.potassium,
+               c.rainfall, c.recommended_crop, c.temperature, http_date(c.timestamp) AS timestamp
+        FROM crop_recommendations c
+        LEFT JOIN texts t ON t.id = c.crop_info_id
+        ORDER BY c.timestamp DESC
+        LIMIT ?
+    ''',
+    'diseases': '''
+        SELECT d.confidence, d.detected_disease, d.image_name, d.image_sha256, d.is_healthy, d.pesticide,
+               http_date(d.timestamp) AS timestamp
+        FROM disease_detections d
+        ORDER BY d.timestamp DESC
+        LIMIT ?
+    ''',
+    'chatbot': '''
+        SELECT t.body AS bot_response, q.chatbot_type, http_date(q.timestamp) AS timestamp,
+               q.user_query
+        FROM chatbot_queries q
+        LEFT JOIN texts t ON t.id = q.bot_response_id
+        ORDER BY q.timestamp DESC
+        LIMIT ?
+    '''
+}
+
 
 class FarmingHistoryManager:
     def __init__(self, db_path='database/farming_history.db'):
         self.db_path = db_path
+        self.interner = Interner()
+        # Month of the partition each table was last written to
+        self._partitions = {}
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.init_database()
+        # Bumped after every committed write; the history API derives ETags from them
+        self.versions = WriteVersions(db_path + '-versions', partitions.TABLES)
     
     def init_database(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crop_recommendations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                nitrogen REAL,
-                phosphorus REAL,
-                potassium REAL,
-                temperature REAL,
-                humidity REAL,
-                ph REAL,
-                rainfall REAL,
-                recommended_crop TEXT,
-                confidence REAL,
-                crop_info TEXT
-            )
-        ''')
+        if is_legacy(cursor):
+            # Databases from before the compact schema are rewritten once (see compact.py)
+            rows = migrate(conn)
+            if rows:
+                print(f"Migrated {rows} history rows in {self.db_path} to the compact schema")
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS disease_detections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                image_name TEXT,
-                detected_disease TEXT,
-                confidence REAL,
-                pesticide TEXT,
-                is_healthy BOOLEAN,
-                all_predictions TEXT
-            )
-        ''')
+        if not partitions.is_partitioned(cursor):
+            existing = cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+            if not existing:
+                # Must be set before the first table is created
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('BEGIN IMMEDIATE')
+            if cursor.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            cursor.execute('COMMIT')
+            
+            # Monthly partitions (see partitions.py); VACUUM once to switch on incremental vacuum
+            rows = partitions.migrate(conn)
+            if existing and rows is not None:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+                print(f"Partitioned {rows} history rows in {self.db_path} by month")
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chatbot_queries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                user_query TEXT,
-                bot_response TEXT,
-                chatbot_type TEXT
-            )
-        ''')
+        # Trend rollups (see rollups.py), backfilled the first time
+        rows = rollups.ensure(conn)
+        if rows:
+            print(f"Rolled up {rows} history rows in {self.db_path} into trend buckets")
+        
+        # Idempotency keys of records uploaded by edge devices (see ingest.py)
+        cursor.execute(ingest.SCHEMA)
+        cursor.execute(partitions.EXPIRED_SCHEMA)
         
-        conn.commit()
         conn.close()
     
+    def _partition(self, table, timestamp):
+        """Name of the partition for timestamp, creating it on the first write of a new month."""
+        month = partitions.month_of(timestamp)
+        if self._partitions.get(table) != month:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                partitions.create_partition(cursor, table, month)
+                cursor.execute('COMMIT')
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            self._partitions[table] = month
+        return partitions.partition_name(table, month)
+    
     def log_crop_recommendation(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, 
                                 recommended_crop, confidence, crop_info):
+        timestamp = partitions.utc_now()
+        table = self._partition('crop_recommendations', timestamp)
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO crop_recommendations 
-            (nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, recommended_crop, confidence, crop_info)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, 
-              recommended_crop, confidence, crop_info))
+        cursor.execute(f'''
+            INSERT INTO {table} 
+            (timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, recommended_crop, confidence, crop_info_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, 
+              recommended_crop, confidence, self.interner.text_id(cursor, crop_info)))
+        rollups.record(cursor, 'crop', timestamp, recommended_crop, confidence)
         
         conn.commit()
         conn.close()
+        self.versions.bump('crop_recommendations')
     
-    def log_disease_detection(self, image_name, detected_disease, confidence, pesticide, is_healthy, all_predictions):
+    def log_disease_detection(self, image_name, detected_disease, confidence, pesticide, is_healthy, all_predictions,
+                              image_sha256=None):
+        timestamp = partitions.utc_now()
+        table = self._partition('disease_detections', timestamp)
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        all_predictions_json = json.dumps(all_predictions)
+        labels, scores = pack_predictions(all_predictions)
         
-        cursor.execute('''
-            INSERT INTO disease_detections 
-            (image_name, detected_disease, confidence, pesticide, is_healthy, all_predictions)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (image_name, detected_disease, confidence, pesticide, is_healthy, all_predictions_json))
+        cursor.execute(f'''
+            INSERT INTO {table} 
+            (timestamp, image_name, detected_disease, confidence, pesticide, is_healthy, label_set_id, prediction_scores, image_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, image_name, detected_disease, confidence, pesticide, is_healthy,
+              self.interner.label_set_id(cursor, labels), scores, image_sha256))
+        rollups.record(cursor, 'disease', timestamp, detected_disease, confidence)
+        detection_id = cursor.lastrowid
         
         conn.commit()
         conn.close()
+        self.versions.bump('disease_detections')
+        return detection_id
     
     def log_chatbot_query(self, user_query, bot_response, chatbot_type='offline'):
+        timestamp = partitions.utc_now()
+        table = self._partition('chatbot_queries', timestamp)
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO chatbot_queries 
-            (user_query, bot_response, chatbot_type)
-            VALUES (?, ?, ?)
-        ''', (user_query, bot_response, chatbot_type))
+        cursor.execute(f'''
+            INSERT INTO {table} 
+            (timestamp, user_query, bot_response_id, chatbot_type)
+            VALUES (?, ?, ?, ?)
+        ''', (timestamp, user_query, self.interner.text_id(cursor, bot_response), chatbot_type))
         
         conn.commit()
         conn.close()
+        self.versions.bump('chatbot_queries')
+    
+    def ingest(self, lines, chunk_size=1000, stats=None):
+        """Bulk insert (line number, record) pairs from an edge-device sync; returns ingest.BatchStats."""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        try:
+            return ingest.ingest(conn, lines, chunk_size, on_commit=lambda tables: self.versions.bump(*tables),
+                                 stats=stats)
+        finally:
+            conn.close()
     
     def get_crop_recommendations(self, limit=100):
+        import pandas as pd  # only the DataFrame readers need pandas
         conn = sqlite3.connect(self.db_path)
         query = f'''
-            SELECT timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, 
-                   recommended_crop, confidence, crop_info
-            FROM crop_recommendations
-            ORDER BY timestamp DESC
+            SELECT c.timestamp, c.nitrogen, c.phosphorus, c.potassium, c.temperature, c.humidity, c.ph, c.rainfall, 
+                   c.recommended_crop, c.confidence, t.body AS crop_info
+            FROM crop_recommendations c
+            LEFT JOIN texts t ON t.id = c.crop_info_id
+            ORDER BY c.timestamp DESC
             LIMIT {limit}
         '''
         df = pd.read_sql_query(query, conn, parse_dates=['timestamp'])
@@ -114,9 +206,10 @@ class FarmingHistoryManager:
         return df
     
     def get_disease_detections(self, limit=100):
+        import pandas as pd
         conn = sqlite3.connect(self.db_path)
         query = f'''
-            SELECT timestamp, image_name, detected_disease, confidence, pesticide, is_healthy
+            SELECT timestamp, image_name, detected_disease, confidence, pesticide, is_healthy, image_sha256
             FROM disease_detections
             ORDER BY timestamp DESC
             LIMIT {limit}
@@ -125,18 +218,85 @@ class FarmingHistoryManager:
         conn.close()
         return df
     
+    def iter_history(self, history_type, limit=100, batch_size=1000):
+        """Yield the column names, then lists of up to batch_size row tuples, newest first.
+        
+        history_type is 'crops', 'diseases' or 'chatbot'; rows are as served
+        by the history API (see HISTORY_QUERIES). The query runs on the first
+        next(), so errors surface before any row is sent.
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.create_function('http_date', 1, http_date, deterministic=True)
+        try:
+            cursor = conn.execute(HISTORY_QUERIES[history_type], (limit,))
+            yield [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+    
+    def get_latest_detections(self, image_hashes):
+        """Most recent {'detected_disease', 'confidence', 'timestamp'} per archived image hash."""
+        conn = sqlite3.connect(self.db_path)
+        latest = {}
+        hashes = list(image_hashes)
+        for offset in range(0, len(hashes), 500):
+            batch = hashes[offset:offset + 500]
+            rows = conn.execute(f'''
+                SELECT image_sha256, detected_disease, confidence, timestamp
+                FROM disease_detections
+                WHERE image_sha256 IN ({', '.join('?' * len(batch))})
+                ORDER BY id
+            ''', batch).fetchall()
+            for digest, disease, confidence, timestamp in rows:
+                latest[digest] = {'detected_disease': disease, 'confidence': confidence, 'timestamp': timestamp}
+        conn.close()
+        return latest
+    
+    def get_detections_by_id(self, detection_ids):
+        """{id: detection} for the ids still in the history (retention may have dropped some)."""
+        conn = sqlite3.connect(self.db_path)
+        found = {}
+        ids = list(detection_ids)
+        for offset in range(0, len(ids), 500):
+            batch = ids[offset:offset + 500]
+            rows = conn.execute(f'''
+                SELECT id, timestamp, image_name, detected_disease, confidence, pesticide, is_healthy, image_sha256
+                FROM disease_detections
+                WHERE id IN ({', '.join('?' * len(batch))})
+            ''', batch).fetchall()
+            for row in rows:
+                found[row[0]] = {'detection_id': row[0], 'timestamp': row[1], 'image_name': row[2],
+                                 'detected_disease': row[3], 'confidence': row[4], 'pesticide': row[5],
+                                 'is_healthy': bool(row[6]), 'image_sha256': row[7]}
+        conn.close()
+        return found
+    
     def get_chatbot_queries(self, limit=100):
+        import pandas as pd
         conn = sqlite3.connect(self.db_path)
         query = f'''
-            SELECT timestamp, user_query, bot_response, chatbot_type
-            FROM chatbot_queries
-            ORDER BY timestamp DESC
+            SELECT q.timestamp, q.user_query, t.body AS bot_response, q.chatbot_type
+            FROM chatbot_queries q
+            LEFT JOIN texts t ON t.id = q.bot_response_id
+            ORDER BY q.timestamp DESC
             LIMIT {limit}
         '''
         df = pd.read_sql_query(query, conn, parse_dates=['timestamp'])
         conn.close()
         return df
     
+    def get_trends(self, kind, period, start, end, labels=None):
+        """Counts and average confidence per bucket and label from the rollups (see rollups.py)."""
+        conn = sqlite3.connect(self.db_path)
+        rows = rollups.query(conn.cursor(), kind, period, start, end, labels)
+        conn.close()
+        return [{'bucket': bucket, 'label': label, 'count': count, 'avg_confidence': avg_confidence}
+                for bucket, label, count, avg_confidence in rows]
+    
     def get_statistics(self):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -182,16 +342,32 @@ class FarmingHistoryManager:
         }
     
     def clear_all_history(self):
-        """Clear all history from all tables."""
-        conn = sqlite3.connect(self.db_path)
+        """Clear all history from all tables.
+        
+        Drops every partition (instead of deleting row by row) and returns the
+        freed pages to the filesystem.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
         cursor = conn.cursor()
         
         try:
-            cursor.execute('DELETE FROM crop_recommendations')
-            cursor.execute('DELETE FROM disease_detections')
-            cursor.execute('DELETE FROM chatbot_queries')
-            
-            conn.commit()
+            cursor.execute('BEGIN IMMEDIATE')
+            current = partitions.month_of(partitions.utc_now())
+            for table in partitions.TABLES:
+                # Ids are never reused (embeddings and sync keys refer to them), so the
+                # new partition continues after the highest id handed out so far
+                last_id = partitions.last_row_id(cursor, table)
+                for month in partitions.list_partitions(cursor, table):
+                    cursor.execute(f'DROP TABLE {partitions.partition_name(table, month)}')
+                partitions.create_partition(cursor, table, current)
+                if last_id:
+                    partitions.advance_sequence(cursor, table, last_id)
+            rollups.clear(cursor)
+            cursor.execute('DELETE FROM ingest_keys')
+            cursor.execute('COMMIT')
+            self.versions.bump()
+            self._partitions = {table: current for table in partitions.TABLES}
+            partitions.incremental_vacuum(conn)
             return True
         except Exception as e:
             conn.rollback()
@@ -200,20 +376,27 @@ class FarmingHistoryManager:
         finally:
             conn.close()
     
+    def apply_retention(self, keep_months, archive_dir='database/archive'):
+        """Archive partitions older than keep_months to archive_dir (gzip NDJSON) and drop them."""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        try:
+            done = partitions.apply_retention(conn, keep_months, archive_dir)
+            if done:
+                self.versions.bump(*{table for table, _, _, _ in done})
+            return done
+        finally:
+            conn.close()
+    
     def export_to_csv(self, table_name, filename):
+        import pandas as pd
         conn = sqlite3.connect(self.db_path)
         
-        if table_name == 'crop_recommendations':
-            query = 'SELECT * FROM crop_recommendations ORDER BY timestamp DESC'
-        elif table_name == 'disease_detections':
-            query = 'SELECT * FROM disease_detections ORDER BY timestamp DESC'
-        elif table_name == 'chatbot_queries':
-            query = 'SELECT * FROM chatbot_queries ORDER BY timestamp DESC'
-        else:
+        if table_name not in ORIGINAL_FIELDS:
             conn.close()
             raise ValueError(f"Unknown table name: {table_name}")
         
-        df = pd.read_sql_query(query, conn)
+        # Columns as in the original (uncompacted) tables
+        df = pd.DataFrame(list(original_rows(conn.cursor(), table_name)), columns=ORIGINAL_FIELDS[table_name])
         conn.close()
         
         export_dir = 'database/exports'
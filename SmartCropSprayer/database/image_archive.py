@@ -0,0 +1,152 @@
+"""Content-addressed store for uploaded leaf images.
+
+Each image is stored once, named by the sha256 of its bytes and sharded by
+the first two byte pairs so no directory grows too large:
+
+    uploads/objects/3f/a2/3fa2...e1.jpg
+    uploads/thumbs/3f/a2/3fa2...e1.jpg
+
+Uploading the same bytes again only returns the existing hash. Files are
+written to a temp name and renamed into place, so two workers storing the
+same image at once both end up with one complete file. Thumbnails are made
+by a background thread (and on demand if a request beats it); the
+objects/ directory doubles as the input of "rescore" bulk jobs.
+"""
+import hashlib
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+from PIL import Image
+
+from monitoring import metrics
+
+stored_total = metrics.registry.counter(
+    'scs_image_archive_stores_total', 'Images offered to the archive', ['result'])
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+
+
+class ImageArchive:
+    def __init__(self, root='uploads', thumbnail_size=(160, 160), queue_size=256):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.thumbs_dir = os.path.join(root, 'thumbs')
+        self.thumbnail_size = thumbnail_size
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.thumbs_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shard(directory, digest):
+        return os.path.join(directory, digest[:2], digest[2:4])
+
+    @staticmethod
+    def is_digest(digest):
+        return len(digest) == 64 and all(c in '0123456789abcdef' for c in digest)
+
+    def path_for(self, digest):
+        """Path of the stored image, or None if the archive does not have it."""
+        if not self.is_digest(digest):
+            return None
+        shard = self._shard(self.objects_dir, digest)
+        for ext in EXTENSIONS.values():
+            path = os.path.join(shard, digest + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def store(self, stream, image_format):
+        """Copy stream (a file object positioned anywhere) into the archive.
+
+        Returns (digest, created); created is False for a duplicate.
+        """
+        sha = hashlib.sha256()
+        stream.seek(0)
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            sha.update(block)
+        digest = sha.hexdigest()
+        if self.path_for(digest) is not None:
+            stored_total.inc(result='duplicate')
+            return digest, False
+
+        shard = self._shard(self.objects_dir, digest)
+        os.makedirs(shard, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=shard, prefix='.tmp-')
+        try:
+            stream.seek(0)
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(stream, out, 1024 * 1024)
+            os.replace(tmp_path, os.path.join(shard, digest + EXTENSIONS.get(image_format, '.img')))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        stored_total.inc(result='created')
+        self._schedule_thumbnail(digest)
+        return digest, True
+
+    def thumbnail_path(self, digest, create=True):
+        """Path of the JPEG thumbnail, made now if missing and create is set."""
+        source = self.path_for(digest)
+        if source is None:
+            return None
+        path = os.path.join(self._shard(self.thumbs_dir, digest), digest + '.jpg')
+        if not os.path.exists(path) and create:
+            self._make_thumbnail(source, path)
+        return path if os.path.exists(path) else None
+
+    def _make_thumbnail(self, source, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with Image.open(source) as image:
+            # JPEG can decode straight at reduced scale; thumbnail() does the rest
+            image.draft('RGB', self.thumbnail_size)
+            image = image.convert('RGB')
+            image.thumbnail(self.thumbnail_size)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.jpg')
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, 'JPEG', quality=80)
+        os.replace(tmp_path, path)
+
+    def _schedule_thumbnail(self, digest):
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(digest)
+        except queue.Full:
+            pass  # made on first request instead
+
+    def ensure_started(self):
+        """Start the thumbnail thread once per process (call after fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._thumbnail_worker, name='thumbnailer', daemon=True).start()
+
+    def _thumbnail_worker(self):
+        while True:
+            digest = self._queue.get()
+            try:
+                self.thumbnail_path(digest)
+            except Exception as e:
+                print(f"Warning: Could not create thumbnail for {digest}: {e}")
+
+    def iter_digests(self):
+        for root, dirs, names in os.walk(self.objects_dir):
+            dirs.sort()
+            for name in sorted(names):
+                if not name.startswith('.'):
+                    yield os.path.splitext(name)[0]
+
+    def stats(self):
+        count = size = 0
+        for root, dirs, names in os.walk(self.objects_dir):
+            for name in names:
+                if not name.startswith('.'):
+                    count += 1
+                    size += os.path.getsize(os.path.join(root, name))
+        return {'images': count, 'bytes': size, 'pending_thumbnails': self._queue.qsize()}
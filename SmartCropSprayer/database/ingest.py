@@ -0,0 +1,315 @@
+"""Bulk ingestion of detection logs recorded offline (edge sync).
+
+Sprayer rigs without connectivity keep their disease detections and crop
+recommendations locally and upload them later as NDJSON, one record per
+line (gzip-compressed over HTTP):
+
+    {"idempotency_key": "rig7-000123", "type": "disease", "timestamp": "2026-10-18T06:12:00Z",
+     "detected_disease": "Apple Scab", "confidence": 87.5, "pesticide": "Mancozeb",
+     "image_name": "leaf.jpg", "is_healthy": false, "all_predictions": [...], "image_sha256": null}
+    {"idempotency_key": "rig7-000124", "type": "crop", "timestamp": "2026-10-18 06:15:00",
+     "nitrogen": 90, "phosphorus": 42, "potassium": 43, "temperature": 20.8, "humidity": 82,
+     "ph": 6.5, "rainfall": 202.9, "recommended_crop": "rice", "confidence": 72.0, "crop_info": null}
+
+Valid records are inserted with executemany in one transaction per chunk,
+into the monthly partition of their own timestamp, with the trend rollups
+updated in the same transaction. Every key is stored in `ingest_keys`, so
+a record sent again (a retried upload) is counted as a duplicate and not
+inserted twice. Invalid lines are skipped and reported with their line
+number, and so are records for a month retention has already archived and
+dropped (writing them would recreate that partition).
+"""
+import json
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+from monitoring import metrics
+
+from . import partitions, rollups
+from .compact import Interner, pack_predictions
+
+records_total = metrics.registry.counter(
+    'scs_ingest_records_total', 'Records received by bulk sync, by kind and result', ['kind', 'result'])
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ingest_keys (
+        idempotency_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        ingested_at DATETIME NOT NULL
+    ) WITHOUT ROWID
+'''
+
+MAX_KEY_LENGTH = 128
+MAX_LINE_BYTES = 64 * 1024
+# Device clocks may run a little ahead
+MAX_CLOCK_SKEW = timedelta(days=1)
+# Partition names need a four-digit year
+MIN_YEAR = 2000
+
+SOIL_FIELDS = ('nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall')
+
+KINDS = {
+    'disease': ('disease_detections', '''
+        INSERT INTO {table} (id, timestamp, image_name, detected_disease, confidence, pesticide, is_healthy,
+                             label_set_id, prediction_scores, image_sha256)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''),
+    'crop': ('crop_recommendations', '''
+        INSERT INTO {table} (id, timestamp, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall,
+                             recommended_crop, confidence, crop_info_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''')
+}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def _number(record, field, low=None, high=None, required=True):
+    value = record.get(field)
+    if value is None and not required:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise InvalidRecord(f'{field} must be a number')
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise InvalidRecord(f'{field} must be between {low} and {high}')
+    return float(value)
+
+
+def _text(record, field, required=False, max_length=1000):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise InvalidRecord(f'{field} is required')
+        return None
+    if not isinstance(value, str) or not value or len(value) > max_length:
+        raise InvalidRecord(f'{field} must be a non-empty string of at most {max_length} characters')
+    return value
+
+
+def _timestamp(record, now):
+    value = _text(record, 'timestamp', required=True, max_length=40)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidRecord('timestamp must be ISO 8601, e.g. 2026-10-18T06:12:00Z')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > now + MAX_CLOCK_SKEW:
+        raise InvalidRecord('timestamp is in the future')
+    if parsed.year < MIN_YEAR:
+        raise InvalidRecord(f'timestamp must be in {MIN_YEAR} or later')
+    return f'{parsed.year:04d}-' + parsed.strftime('%m-%d %H:%M:%S')
+
+
+def validate(record, now=None):
+    """Normalized copy of one sync record; raises InvalidRecord."""
+    if not isinstance(record, dict):
+        raise InvalidRecord('record must be a JSON object')
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    kind = record.get('type')
+    if kind not in KINDS:
+        raise InvalidRecord(f"type must be one of: {', '.join(KINDS)}")
+    clean = {
+        'idempotency_key': _text(record, 'idempotency_key', required=True, max_length=MAX_KEY_LENGTH),
+        'type': kind,
+        'timestamp': _timestamp(record, now),
+        'confidence': _number(record, 'confidence', 0, 100)
+    }
+    if kind == 'disease':
+        clean['detected_disease'] = _text(record, 'detected_disease', required=True, max_length=200)
+        clean['image_name'] = _text(record, 'image_name', max_length=255)
+        clean['pesticide'] = _text(record, 'pesticide', max_length=1000)
+        is_healthy = record.get('is_healthy', clean['detected_disease'] == 'Healthy')
+        if not isinstance(is_healthy, bool):
+            raise InvalidRecord('is_healthy must be true or false')
+        clean['is_healthy'] = is_healthy
+        image_sha256 = _text(record, 'image_sha256', max_length=64)
+        if image_sha256 is not None and (len(image_sha256) != 64 or image_sha256.strip('0123456789abcdef')):
+            raise InvalidRecord('image_sha256 must be 64 lowercase hex digits')
+        clean['image_sha256'] = image_sha256
+        predictions = record.get('all_predictions') or []
+        if not isinstance(predictions, list) or not all(
+                isinstance(p, dict) and isinstance(p.get('disease'), str)
+                and isinstance(p.get('confidence'), (int, float)) and not isinstance(p.get('confidence'), bool)
+                for p in predictions):
+            raise InvalidRecord('all_predictions must be a list of {"disease", "confidence"}')
+        clean['all_predictions'] = predictions
+    else:
+        for field in SOIL_FIELDS:
+            clean[field] = _number(record, field, 0, 14 if field == 'ph' else 10000)
+        clean['recommended_crop'] = _text(record, 'recommended_crop', required=True, max_length=100)
+        clean['crop_info'] = _text(record, 'crop_info', max_length=10000)
+    return clean
+
+
+def parse_lines(stream, max_lines):
+    """Yield (line number, record or InvalidRecord) from a binary NDJSON stream.
+
+    Raises OverflowError on line max_lines + 1, so a small gzip body cannot
+    expand into unbounded work.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        line_number += 1
+        if line_number > max_lines:
+            raise OverflowError(f'more than {max_lines} lines in one batch')
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b'\n'):
+            # Skip the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_LINE_BYTES)
+            yield line_number, InvalidRecord(f'line longer than {MAX_LINE_BYTES} bytes')
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, InvalidRecord(f'invalid JSON: {e}')
+
+
+class BatchStats:
+    def __init__(self):
+        self.received = 0
+        self.inserted = {kind: 0 for kind in KINDS}
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.chunks = 0
+        self.started = time.perf_counter()
+
+    def reject(self, line_number, error, max_errors=100, kind='unknown'):
+        self.rejected += 1
+        records_total.inc(kind=kind, result='rejected')
+        if len(self.errors) < max_errors:
+            self.errors.append({'line': line_number, 'error': str(error)})
+
+    def expire(self, record):
+        self.reject(record['line'], InvalidRecord(
+            f"timestamp is in {record['timestamp'][:7]}, which retention has already archived"), kind=record['type'])
+
+    def as_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'transactions': self.chunks,
+            'seconds': round(seconds, 4),
+            'records_per_second': round(self.received / seconds, 1) if seconds > 0 else None
+        }
+
+
+def _insert_chunk(conn, chunk, interner, stats):
+    """Insert one chunk of validated records in a single transaction."""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        keys = list({record['idempotency_key'] for record in chunk})
+        existing = set()
+        for offset in range(0, len(keys), 500):
+            batch = keys[offset:offset + 500]
+            existing.update(row[0] for row in cursor.execute(
+                f"SELECT idempotency_key FROM ingest_keys WHERE idempotency_key IN ({', '.join('?' * len(batch))})",
+                batch))
+        # Read under the write lock, so retention cannot drop a month between the check and the insert
+        expired = {kind: partitions.newest_expired(cursor, table) for kind, (table, _) in KINDS.items()}
+        fresh = []
+        for record in chunk:
+            if record['idempotency_key'] in existing:
+                stats.duplicates += 1
+                records_total.inc(kind=record['type'], result='duplicate')
+            elif _is_expired(record, expired):
+                stats.expire(record)
+            else:
+                existing.add(record['idempotency_key'])
+                fresh.append(record)
+
+        ingested_at = partitions.utc_now()
+        key_rows = []
+        for kind, (table, insert) in KINDS.items():
+            records = [record for record in fresh if record['type'] == kind]
+            if not records:
+                continue
+            # Explicit ids, continuing after the newest id of any partition
+            next_id = (partitions.last_row_id(cursor, table) or 0) + 1
+            by_partition = {}
+            for record in records:
+                record['id'] = next_id
+                next_id += 1
+                month = partitions.month_of(record['timestamp'])
+                by_partition.setdefault(month, []).append(_row(cursor, interner, record))
+                key_rows.append((record['idempotency_key'], kind, record['id'], ingested_at))
+            for month, rows in by_partition.items():
+                name = partitions.create_partition(cursor, table, month)
+                cursor.executemany(insert.format(table=name), rows)
+            partitions.advance_sequence(cursor, table, next_id - 1)
+            label = 'detected_disease' if kind == 'disease' else 'recommended_crop'
+            rollups.record_many(cursor, kind, [(r['timestamp'], r[label], r['confidence']) for r in records])
+            stats.inserted[kind] += len(records)
+            records_total.inc(len(records), kind=kind, result='inserted')
+        cursor.executemany('INSERT INTO ingest_keys (idempotency_key, kind, row_id, ingested_at) VALUES (?, ?, ?, ?)',
+                           key_rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    stats.chunks += 1
+    return {KINDS[kind][0] for kind in KINDS if any(record['type'] == kind for record in fresh)}
+
+
+def _is_expired(record, expired):
+    newest = expired[record['type']]
+    return newest is not None and partitions.month_of(record['timestamp']) <= newest
+
+
+def _row(cursor, interner, record):
+    if record['type'] == 'disease':
+        labels, scores = pack_predictions(record['all_predictions'])
+        return (record['id'], record['timestamp'], record['image_name'], record['detected_disease'],
+                record['confidence'], record['pesticide'], record['is_healthy'],
+                interner.label_set_id(cursor, labels), scores, record['image_sha256'])
+    return ((record['id'], record['timestamp']) + tuple(record[field] for field in SOIL_FIELDS)
+            + (record['recommended_crop'], record['confidence'], interner.text_id(cursor, record['crop_info'])))
+
+
+def ingest(conn, lines, chunk_size=1000, on_commit=None, stats=None):
+    """Validate and insert (line number, record) pairs; returns BatchStats.
+
+    on_commit(tables) is called after each committed chunk with the tables it
+    wrote. Pass stats to keep the counts of committed chunks if lines raises.
+    """
+    stats = stats or BatchStats()
+    # Ids cached by an interner must not outlive a rolled-back chunk, so use a fresh one per batch
+    interner = Interner()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    chunk = []
+    for line_number, record in lines:
+        stats.received += 1
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            record = validate(record, now)
+        except InvalidRecord as e:
+            stats.reject(line_number, e)
+            continue
+        record['line'] = line_number
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            tables = _insert_chunk(conn, chunk, interner, stats)
+            if on_commit and tables:
+                on_commit(tables)
+            chunk = []
+    if chunk:
+        tables = _insert_chunk(conn, chunk, interner, stats)
+        if on_commit and tables:
+            on_commit(tables)
+    return stats
@@ -0,0 +1,309 @@
+"""Monthly partitions for the history tables (schema version 2).
+
+Each history table is split into one table per calendar month (UTC), e.g.
+disease_detections_202610. The original name becomes a view over all live
+partitions (UNION ALL), so every reader keeps querying
+`disease_detections` unchanged; writers insert into the current month's
+partition, created on first use. Ids keep increasing across partitions:
+a new partition's AUTOINCREMENT sequence starts after the newest id.
+
+Retention archives each partition older than the cut-off to a gzip
+NDJSON file (original columns, readable without the app), then drops it:
+a DROP TABLE instead of a row-by-row DELETE. The database uses
+auto_vacuum=INCREMENTAL, and freed pages are returned to the filesystem
+with PRAGMA incremental_vacuum.
+
+    python -m database.partitions --keep-months 12 --archive-dir database/archive
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+from .compact import original_rows
+
+SCHEMA_VERSION = 2
+
+TABLES = {
+    'crop_recommendations': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            nitrogen REAL,
+            phosphorus REAL,
+            potassium REAL,
+            temperature REAL,
+            humidity REAL,
+            ph REAL,
+            rainfall REAL,
+            recommended_crop TEXT,
+            confidence REAL,
+            crop_info_id INTEGER REFERENCES texts (id)
+        )
+    ''',
+    'disease_detections': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            image_name TEXT,
+            detected_disease TEXT,
+            confidence REAL,
+            pesticide TEXT,
+            is_healthy BOOLEAN,
+            label_set_id INTEGER REFERENCES label_sets (id),
+            prediction_scores BLOB,
+            image_sha256 TEXT
+        )
+    ''',
+    'chatbot_queries': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_query TEXT,
+            bot_response_id INTEGER REFERENCES texts (id),
+            chatbot_type TEXT
+        )
+    '''
+}
+
+# Months retention has dropped, so a late write into one can be refused
+EXPIRED_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS expired_partitions (
+        table_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        PRIMARY KEY (table_name, month)
+    ) WITHOUT ROWID
+'''
+
+INDEXES = {
+    'disease_detections': ['CREATE INDEX IF NOT EXISTS idx_{name}_image ON {name} (image_sha256)']
+}
+
+
+def utc_now():
+    """Current UTC time as stored in the timestamp column."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def month_of(timestamp):
+    """'2026-10-18 23:43:00' -> '202610'."""
+    return timestamp[:4] + timestamp[5:7]
+
+
+def partition_name(table, month):
+    return f'{table}_{month}'
+
+
+def list_partitions(cursor, table):
+    """Months with a live partition of table, oldest first."""
+    pattern = re.compile(rf'^{table}_(\d{{6}})$')
+    names = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return sorted(m.group(1) for m in map(pattern.match, names) if m)
+
+
+def rebuild_view(cursor, table):
+    months = list_partitions(cursor, table)
+    cursor.execute(f'DROP VIEW IF EXISTS {table}')
+    if months:
+        cursor.execute(f'CREATE VIEW {table} AS '
+                       + ' UNION ALL '.join(f'SELECT * FROM {partition_name(table, m)}' for m in months))
+
+
+def create_partition(cursor, table, month):
+    """Create the month's partition if missing; returns its name. Call inside a write transaction."""
+    name = partition_name(table, month)
+    if month in list_partitions(cursor, table):
+        return name
+    cursor.execute(TABLES[table].format(name=name))
+    for statement in INDEXES.get(table, []):
+        cursor.execute(statement.format(name=name))
+    # Continue the id sequence of the existing partitions
+    last_id = last_row_id(cursor, table)
+    if last_id:
+        cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, last_id))
+    rebuild_view(cursor, table)
+    return name
+
+
+def last_row_id(cursor, table):
+    """Highest id handed out in any partition of table (None if none yet)."""
+    return cursor.execute("SELECT MAX(seq) FROM sqlite_sequence WHERE name GLOB ?",
+                          (f'{table}_[0-9][0-9][0-9][0-9][0-9][0-9]',)).fetchone()[0]
+
+
+def advance_sequence(cursor, table, last_id):
+    """After inserting explicit ids up to last_id (possibly into an older partition),
+    make every partition continue after it so ids stay unique across the view."""
+    for month in list_partitions(cursor, table):
+        name = partition_name(table, month)
+        if not cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (last_id, name)).rowcount:
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, last_id))
+
+
+def newest_expired(cursor, table):
+    """Newest month of table dropped by retention (None if none)."""
+    return cursor.execute('SELECT MAX(month) FROM expired_partitions WHERE table_name = ?', (table,)).fetchone()[0]
+
+
+def is_partitioned(cursor):
+    return cursor.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION
+
+
+def migrate(conn):
+    """Split schema-1 tables into monthly partitions in one transaction.
+
+    Row ids are kept. Returns the number of rows moved, or None if another
+    process got there first; run VACUUM afterwards so auto_vacuum=INCREMENTAL
+    takes effect.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        if is_partitioned(cursor):
+            conn.rollback()
+            return None
+        moved = 0
+        current = month_of(utc_now())
+        for table in TABLES:
+            cursor.execute(f'ALTER TABLE {table} RENAME TO unpartitioned_{table}')
+            months = [row[0] for row in cursor.execute(
+                f"SELECT DISTINCT substr(timestamp, 1, 4) || substr(timestamp, 6, 2) FROM unpartitioned_{table} "
+                "WHERE timestamp IS NOT NULL")]
+            for month in sorted(set(months) | {current}):
+                name = create_partition(cursor, table, month)
+                where = 'substr(timestamp, 1, 4) || substr(timestamp, 6, 2) = ?'
+                if month == current:
+                    where = f'({where} OR timestamp IS NULL)'
+                cursor.execute(f'INSERT INTO {name} SELECT * FROM unpartitioned_{table} WHERE {where}', (month,))
+                moved += cursor.rowcount
+            cursor.execute(f'DROP TABLE unpartitioned_{table}')
+            rebuild_view(cursor, table)
+        cursor.execute('DROP INDEX IF EXISTS idx_disease_detections_image')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return moved
+
+
+def archive_path(archive_dir, name):
+    """First unused archive file for partition name: <name>.ndjson.gz, then <name>.2.ndjson.gz, ..."""
+    path = os.path.join(archive_dir, f'{name}.ndjson.gz')
+    copy = 1
+    while os.path.exists(path):
+        copy += 1
+        path = os.path.join(archive_dir, f'{name}.{copy}.ndjson.gz')
+    return path
+
+
+def archive_partition(conn, table, month, archive_dir):
+    """Write one partition to archive_dir/<table>_<month>.ndjson.gz; returns (path, rows).
+
+    A month archived before (e.g. recreated by a late write) gets a
+    numbered file next to the earlier one instead of replacing it.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    name = partition_name(table, month)
+    tmp_path = os.path.join(archive_dir, f'{name}.ndjson.gz.tmp')
+    rows = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as out:
+        for row in original_rows(conn.cursor(), table, table=name, order_by='1'):  # by id
+            out.write(json.dumps(row) + '\n')
+            rows += 1
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    path = archive_path(archive_dir, name)
+    os.replace(tmp_path, path)
+    return path, rows
+
+
+def drop_partition(conn, table, month, archive_dir=None):
+    """Drop one partition and record its month as expired; returns (path, rows) of the archive.
+
+    With archive_dir the partition is archived first, inside the same
+    write transaction, so no row can be written between the archive and
+    the drop (and none is accepted afterwards: ingest checks
+    expired_partitions under the same lock).
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        path, rows = archive_partition(conn, table, month, archive_dir) if archive_dir else (None, None)
+        cursor.execute(f'DROP TABLE IF EXISTS {partition_name(table, month)}')
+        rebuild_view(cursor, table)
+        cursor.execute(EXPIRED_SCHEMA)
+        cursor.execute('INSERT OR IGNORE INTO expired_partitions (table_name, month) VALUES (?, ?)', (table, month))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return path, rows
+
+
+def expired_months(cursor, table, keep_months, now=None):
+    """Partitions entirely older than the newest keep_months months (the current month counts)."""
+    now = now or datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - (keep_months - 1)
+    cutoff = f'{index // 12:04d}{index % 12 + 1:02d}'
+    return [month for month in list_partitions(cursor, table) if month < cutoff]
+
+
+def apply_retention(conn, keep_months, archive_dir=None, vacuum=True):
+    """Archive (if archive_dir) and drop expired partitions; returns [(table, month, rows, path)]."""
+    if keep_months < 1:
+        raise ValueError('keep_months must be at least 1')
+    done = []
+    for table in TABLES:
+        for month in expired_months(conn.cursor(), table, keep_months):
+            path, rows = drop_partition(conn, table, month, archive_dir)
+            done.append((table, month, rows, path))
+    if done and vacuum:
+        incremental_vacuum(conn)
+    return done
+
+
+def incremental_vacuum(conn, pages=None):
+    """Return free pages to the filesystem (all of them unless pages is given)."""
+    # execute() steps the pragma once (one page); executescript() runs it to completion
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});' if pages else 'PRAGMA incremental_vacuum;')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def partition_stats(conn):
+    cursor = conn.cursor()
+    return {
+        table: {month: cursor.execute(f'SELECT COUNT(*) FROM {partition_name(table, month)}').fetchone()[0]
+                for month in list_partitions(cursor, table)}
+        for table in TABLES
+    }
+
+
+if __name__ == '__main__':
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description='Archive and drop old history partitions')
+    parser.add_argument('--db', default=os.environ.get('HISTORY_DB', 'database/farming_history.db'))
+    parser.add_argument('--keep-months', type=int, default=int(os.environ.get('HISTORY_RETENTION_MONTHS', 12)))
+    parser.add_argument('--archive-dir', default=os.environ.get('HISTORY_ARCHIVE_DIR', 'database/archive'))
+    parser.add_argument('--no-archive', action='store_true', help='Drop expired partitions without archiving')
+    parser.add_argument('--dry-run', action='store_true', help='Only list partitions and what would expire')
+    args = parser.parse_args()
+
+    from .farming_history import FarmingHistoryManager
+    history = FarmingHistoryManager(args.db)  # migrates older layouts first
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=30)
+    for table, months in partition_stats(conn).items():
+        expired = expired_months(conn.cursor(), table, args.keep_months)
+        print(f"{table}: " + ', '.join(f"{m}={n}{' (expired)' if m in expired else ''}" for m, n in months.items()))
+    if not args.dry_run:
+        size_before = os.path.getsize(args.db)
+        done = apply_retention(conn, args.keep_months, None if args.no_archive else args.archive_dir)
+        for table, month, rows, path in done:
+            print(f"dropped {partition_name(table, month)}" + (f" ({rows} rows archived to {path})" if path else ''))
+        if done:
+            history.versions.bump(*{table for table, _, _, _ in done})
+        print(f"{args.db}: {size_before:,} -> {os.path.getsize(args.db):,} bytes")
+    conn.close()
@@ -0,0 +1,175 @@
+"""Daily and weekly trend rollups for disease detections and crop recommendations.
+
+`history_rollups` holds one row per (kind, period, bucket, label) with the
+number of rows and the sum of their confidence, so a trend over any date
+range is a primary-key range scan instead of a pass over the history:
+
+    kind     'disease' (detected_disease) or 'crop' (recommended_crop)
+    period   'day' or 'week' (weeks start on Monday)
+    bucket   first day of the bucket, 'YYYY-MM-DD' (UTC, like timestamp)
+
+FarmingHistoryManager updates the rollups in the same transaction as each
+insert. Rollups outlive retention (dropped partitions keep their counts);
+"clear history" empties them. To rebuild them from the rows on disk:
+
+    python -m database.rollups --db database/farming_history.db
+
+The rebuild only replaces buckets starting on or after the first day of
+each table's oldest live partition; earlier buckets may count rows that
+retention has dropped, so they are kept as they are.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+from . import partitions
+
+KINDS = {
+    'disease': ('disease_detections', 'detected_disease'),
+    'crop': ('crop_recommendations', 'recommended_crop')
+}
+
+PERIODS = ('day', 'week')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS history_rollups (
+        kind TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        label TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        confidence_sum REAL NOT NULL,
+        PRIMARY KEY (kind, period, bucket, label)
+    ) WITHOUT ROWID
+'''
+
+UPSERT = '''
+    INSERT INTO history_rollups (kind, period, bucket, label, count, confidence_sum) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (kind, period, bucket, label) DO UPDATE SET
+        count = count + excluded.count,
+        confidence_sum = confidence_sum + excluded.confidence_sum
+'''
+
+# SQL equivalents of bucket_start(), used by the backfill
+BUCKET_SQL = {
+    'day': 'date(timestamp)',
+    'week': "date(timestamp, '-' || ((CAST(strftime('%w', timestamp) AS INTEGER) + 6) % 7) || ' days')"
+}
+
+
+def bucket_start(day, period):
+    """First day of the period containing day (a date)."""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def record(cursor, kind, timestamp, label, confidence):
+    """Count one row in every period; call inside the transaction that inserts it."""
+    record_many(cursor, kind, [(timestamp, label, confidence)])
+
+
+def record_many(cursor, kind, rows):
+    """Count (timestamp, label, confidence) rows, one upsert per bucket and label."""
+    totals = {}
+    for timestamp, label, confidence in rows:
+        if label is None:
+            continue
+        day = date.fromisoformat(timestamp[:10])
+        for period in PERIODS:
+            key = (kind, period, bucket_start(day, period).isoformat(), label)
+            count, confidence_sum = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, confidence_sum + (confidence or 0.0))
+    cursor.executemany(UPSERT, [key + value for key, value in totals.items()])
+
+
+def backfill(conn):
+    """Rebuild the rollups of the live partitions in one transaction; returns rows counted."""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        counted = _rebuild(cursor, keep_older=True)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return counted
+
+
+def _rebuild(cursor, keep_older=False):
+    """Recount buckets from the history tables.
+
+    keep_older leaves buckets starting before each table's oldest live
+    partition untouched (retention may have dropped their rows); otherwise
+    every bucket is replaced.
+    """
+    cursor.execute(SCHEMA)
+    counted = 0
+    for kind, (table, column) in KINDS.items():
+        months = partitions.list_partitions(cursor, table) if partitions.is_partitioned(cursor) else []
+        since = f'{months[0][:4]}-{months[0][4:]}-01' if keep_older and months else '0000-00-00'
+        cursor.execute('DELETE FROM history_rollups WHERE kind = ? AND bucket >= ?', (kind, since))
+        for period in PERIODS:
+            cursor.execute(f'''
+                INSERT INTO history_rollups (kind, period, bucket, label, count, confidence_sum)
+                SELECT ?, ?, {BUCKET_SQL[period]} AS bucket, {column}, COUNT(*), TOTAL(confidence)
+                FROM {table}
+                WHERE {column} IS NOT NULL AND timestamp IS NOT NULL AND {BUCKET_SQL[period]} >= ?
+                GROUP BY bucket, {column}
+            ''', (kind, period, since))
+        counted += cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE {column} IS NOT NULL '
+                                  'AND timestamp IS NOT NULL AND date(timestamp) >= ?', (since,)).fetchone()[0]
+    return counted
+
+
+def ensure(conn):
+    """Create and backfill the rollups table if missing; returns rows counted, or None if it existed."""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_rollups'").fetchone():
+            conn.rollback()
+            return None
+        counted = _rebuild(cursor)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return counted
+
+
+def clear(cursor):
+    cursor.execute('DELETE FROM history_rollups')
+
+
+def query(cursor, kind, period, start, end, labels=None):
+    """[(bucket, label, count, avg_confidence)] for buckets starting in [start, end] (dates)."""
+    sql = '''
+        SELECT bucket, label, count, confidence_sum / count
+        FROM history_rollups
+        WHERE kind = ? AND period = ? AND bucket BETWEEN ? AND ?
+    '''
+    params = [kind, period, bucket_start(start, period).isoformat(), end.isoformat()]
+    if labels:
+        sql += f" AND label IN ({', '.join('?' * len(labels))})"
+        params.extend(labels)
+    return cursor.execute(sql + ' ORDER BY bucket, label', params).fetchall()
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import time
+
+    parser = argparse.ArgumentParser(description='Rebuild the history trend rollups')
+    parser.add_argument('--db', default=os.environ.get('HISTORY_DB', 'database/farming_history.db'))
+    args = parser.parse_args()
+
+    from .farming_history import FarmingHistoryManager
+    history = FarmingHistoryManager(args.db)  # migrates older layouts first
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=30)
+    start = time.perf_counter()
+    counted = backfill(conn)
+    history.versions.bump(*(table for table, _ in KINDS.values()))  # cached trend responses are stale
+    buckets = conn.execute('SELECT COUNT(*) FROM history_rollups').fetchone()[0]
+    conn.close()
+    print(f"Rolled up {counted} history rows into {buckets} buckets in {time.perf_counter() - start:.2f}s")
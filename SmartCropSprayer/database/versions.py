@@ -0,0 +1,80 @@
+"""Per-table write versions shared by every process using a history database.
+
+Each table has a counter that FarmingHistoryManager bumps after every
+committed write. The counters live in a small file next to the database
+(farming_history.db-versions) that each process maps into memory, so
+reading them (to build an ETag) costs no system call and no SQLite query,
+and a write in one gunicorn worker or job worker is seen by all the others.
+
+Layout: 8 random bytes identifying this file (a deleted and recreated file
+never repeats old versions), then one little-endian uint64 per table.
+"""
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HEADER_SIZE = 8
+SLOT = struct.Struct('<Q')
+
+
+class WriteVersions:
+    def __init__(self, path, tables):
+        self.path = path
+        self.tables = list(tables)
+        self.size = HEADER_SIZE + SLOT.size * len(self.tables)
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock():
+            current_size = os.fstat(self._fd).st_size
+            if current_size < HEADER_SIZE:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, os.urandom(HEADER_SIZE))
+            if current_size < self.size:
+                os.ftruncate(self._fd, self.size)
+        self._map = mmap.mmap(self._fd, self.size)
+        self.token = self._map[:HEADER_SIZE].hex()
+
+    @contextmanager
+    def _file_lock(self):
+        # lockf locks belong to the process, so the thread lock covers this process's threads
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def _offset(self, table):
+        return HEADER_SIZE + SLOT.size * self.tables.index(table)
+
+    def get(self, *tables):
+        """Current versions of tables (all tables if none given), as a tuple."""
+        return tuple(SLOT.unpack_from(self._map, self._offset(table))[0] for table in tables or self.tables)
+
+    def bump(self, *tables):
+        """Record a committed write to tables (all tables if none given)."""
+        with self._file_lock():
+            for table in tables or self.tables:
+                offset = self._offset(table)
+                SLOT.pack_into(self._map, offset, SLOT.unpack_from(self._map, offset)[0] + 1)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
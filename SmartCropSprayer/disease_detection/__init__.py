@@ -1,3 +1,5 @@
 from .disease_detector import DiseaseDetector
+from .similarity import SimilarCases
+from .registry import DiseaseModelRegistry, ModelUnavailable, load_manifests
 
-__all__ = ['DiseaseDetector']
+__all__ = ['DiseaseDetector', 'SimilarCases', 'DiseaseModelRegistry', 'ModelUnavailable', 'load_manifests']
@@ -1,26 +1,61 @@
+import hashlib
 import os
+import time
+import inspect
 import numpy as np
 from PIL import Image
 import cv2
 import torch
 import torch.nn as nn
 from torchvision import transforms
+from monitoring import process_memory, format_memory, metrics
+
+# IMPORTANT: Model has exactly 3 classes (no Healthy class in model)
+# Order must match training: ['apple black rot', 'Apple Scab', 'Powdery Mildew']
+BASE_CLASS_NAMES = ['apple black rot', 'Apple Scab', 'Powdery Mildew']
+
+def forward_with_embedding(model, batch):
+    """One ResNet forward pass returning (penultimate-layer features, logits).
+    
+    Same layers as torchvision's ResNet.forward, stopping to keep the pooled
+    features (512 per image for ResNet18) that feed the fc layer.
+    """
+    x = model.maxpool(model.relu(model.bn1(model.conv1(batch))))
+    x = model.layer4(model.layer3(model.layer2(model.layer1(x))))
+    features = torch.flatten(model.avgpool(x), 1)
+    return features, model.fc(features)
+
+# Class order when the checkpoint also has a Healthy output
+CLASS_NAMES_WITH_HEALTHY = ['apple black rot', 'Apple Scab', 'Healthy', 'Powdery Mildew']
 
 class DiseaseDetector:
-    def __init__(self):
+    def __init__(self, manifest=None, load=True):
+        """The apple model at models/model.pth, or the crop model a manifest describes.
+        
+        See disease_detection/registry.py for the manifest format. load=False
+        leaves loading to an explicit load_model() call.
+        """
         self.model = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.load_stats = {}
+        self.load_error = None
+        self.manifest = manifest
         
         # Use the PyTorch model file
         model_path = os.path.join('models', 'model.pth')
-        self.model_path = model_path
+        self.model_path = manifest['path'] if manifest else model_path
+        self.crop = manifest['crop'] if manifest else 'apple'
+        self.architecture = manifest.get('architecture', 'resnet18') if manifest else 'resnet18'
         
-        # Class names matching the working project exactly
-        # IMPORTANT: Model has exactly 3 classes (no Healthy class in model)
-        # Order must match training: ['apple black rot', 'Apple Scab', 'Powdery Mildew']
-        self.class_names = ['apple black rot', 'Apple Scab', 'Powdery Mildew']
+        # Class names matching the working project exactly (see BASE_CLASS_NAMES)
+        self.base_class_names = list(manifest['classes']) if manifest else list(BASE_CLASS_NAMES)
+        # Alternative class lists by checkpoint output count
+        self.classes_by_outputs = ({int(n): list(names) for n, names in manifest.get('classes_by_outputs', {}).items()}
+                                   if manifest else {4: CLASS_NAMES_WITH_HEALTHY})
+        # The colour heuristics only know apple diseases
+        self.rule_based_fallback = manifest.get('rule_based_fallback', False) if manifest else True
+        self.class_names = list(self.base_class_names)
         self.img_size = (224, 224)
-        self.load_model()
         
         # Preprocessing pipeline - matching working code exactly
         self.transform = transforms.Compose([
@@ -67,69 +102,200 @@ class DiseaseDetector:
                 'precautions': 'Continue regular inspection for early disease detection'
             }
         }
+        
+        if manifest:
+            # Other crops: only their own diseases, plus the shared Healthy/None entries
+            self.disease_descriptions = {'Healthy': self.disease_descriptions['Healthy'],
+                                         **manifest.get('descriptions', {})}
+            self.pesticide_map = {'Healthy': 'None', **manifest.get('pesticides', {})}
+            self.pesticide_details = {'None': self.pesticide_details['None'],
+                                      **manifest.get('pesticide_details', {})}
+        
+        if load:
+            self.load_model()
     
     def load_model(self):
         """Load the PyTorch model file (model.pth) - matching working code exactly."""
+        self.load_error = None
         if not os.path.exists(self.model_path):
             self._safe_print(f"WARNING: Model file not found at {os.path.abspath(self.model_path)}")
-            self._safe_print("Using rule-based detection as fallback")
+            if self.rule_based_fallback:
+                self._safe_print("Using rule-based detection as fallback")
             self.model = None
+            self.load_error = 'model file not found'
             return
         
         try:
-            # Initialize model architecture exactly like working code
-            import torchvision.models as models
-            
-            # Try loading state_dict first to check number of classes
-            state_dict = torch.load(self.model_path, map_location=self.device)
-            
-            # Check if model has 4 classes (including Healthy) by inspecting fc.weight shape
-            if isinstance(state_dict, dict):
-                # Check fc layer shape to determine number of classes
-                if 'fc.weight' in state_dict:
-                    num_classes_in_model = state_dict['fc.weight'].shape[0]
-                elif 'model.fc.weight' in state_dict:
-                    num_classes_in_model = state_dict['model.fc.weight'].shape[0]
-                else:
-                    # Try to infer from any weight layer
-                    num_classes_in_model = len(self.class_names)
-            else:
-                num_classes_in_model = len(self.class_names)
-            
-            # If model has 4 classes, add Healthy to class list
-            if num_classes_in_model == 4 and len(self.class_names) == 3:
-                self._safe_print("Model has 4 classes (including Healthy). Updating class list...")
-                self.class_names = ['apple black rot', 'Apple Scab', 'Healthy', 'Powdery Mildew']
-                # Update descriptions and mappings
-                if 'Healthy' not in self.disease_descriptions:
-                    self.disease_descriptions['Healthy'] = 'The leaf shows no signs of disease. The plant appears to be in good health with normal coloration and structure.'
-                if 'Healthy' not in self.pesticide_map:
-                    self.pesticide_map['Healthy'] = 'None'
-            
-            num_classes = len(self.class_names)
-            self.model = models.resnet18(weights=None)
-            self.model.fc = nn.Linear(self.model.fc.in_features, num_classes)
-            
-            # Load trained weights - matching working code exactly
-            self.model.load_state_dict(state_dict)
-            self.model = self.model.to(self.device)
-            self.model.eval()
-            
+            model, load_stats = self._build_model()
+            self.model = model
+            self.class_names = model.class_names
+            self.load_stats = load_stats
             self._safe_print(f"PyTorch model loaded successfully from: {os.path.abspath(self.model_path)}")
-            self._safe_print(f"Model type: PyTorch ResNet18 (.pth format)")
+            self._safe_print(f"Model type: PyTorch {self.architecture} (.pth format), crop: {self.crop}")
             self._safe_print(f"Device: {self.device}")
-            self._safe_print(f"Number of classes: {num_classes} ({', '.join(self.class_names)})")
+            self._safe_print(f"Number of classes: {len(model.class_names)} ({', '.join(model.class_names)})")
+            self._safe_print(f"Weights: {'memory-mapped' if load_stats['mmap'] else 'copied into process memory'} "
+                             f"in {load_stats['load_seconds']:.2f}s; {format_memory(process_memory())}")
                 
-        except FileNotFoundError:
+        except FileNotFoundError as e:
             self._safe_print(f"ERROR: Model file not found at {self.model_path}")
-            self._safe_print("Using rule-based detection as fallback")
+            if self.rule_based_fallback:
+                self._safe_print("Using rule-based detection as fallback")
             self.model = None
+            self.load_error = (str(e).strip().splitlines() or [type(e).__name__])[0]
         except Exception as e:
             import traceback
             self._safe_print(f"ERROR: Could not load PyTorch model from {self.model_path}: {e}")
             self._safe_print(f"Error details: {traceback.format_exc()}")
-            self._safe_print("Using rule-based detection as fallback")
+            if self.rule_based_fallback:
+                self._safe_print("Using rule-based detection as fallback")
             self.model = None
+            self.load_error = (str(e).strip().splitlines() or [type(e).__name__])[0]
+    
+    def _build_model(self):
+        """Load model.pth into a new eval-mode ResNet without touching self.model.
+        
+        The model carries its own class_names and version (checkpoint sha256
+        prefix), so a request holding it is unaffected by a later swap.
+        Returns (model, load_stats).
+        """
+        # Initialize model architecture exactly like working code
+        import torchvision.models as models
+        
+        memory_before = process_memory()
+        load_start = time.perf_counter()
+        digest = hashlib.sha256()
+        with open(self.model_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        version = digest.hexdigest()[:12]
+        
+        # Try loading state_dict first to check number of classes
+        state_dict, mmapped = self._load_state_dict()
+        
+        # Check if model has 4 classes (including Healthy) by inspecting fc.weight shape
+        if isinstance(state_dict, dict):
+            # Check fc layer shape to determine number of classes
+            if 'fc.weight' in state_dict:
+                num_classes_in_model = state_dict['fc.weight'].shape[0]
+            elif 'model.fc.weight' in state_dict:
+                num_classes_in_model = state_dict['model.fc.weight'].shape[0]
+            else:
+                # Try to infer from any weight layer
+                num_classes_in_model = len(self.base_class_names)
+        else:
+            num_classes_in_model = len(self.base_class_names)
+        
+        class_names = list(self.base_class_names)
+        # If model has 4 classes, add Healthy to class list
+        if num_classes_in_model in self.classes_by_outputs:
+            self._safe_print(f"Model has {num_classes_in_model} classes (including Healthy). Updating class list...")
+            class_names = list(self.classes_by_outputs[num_classes_in_model])
+            # Update descriptions and mappings
+            if 'Healthy' not in self.disease_descriptions:
+                self.disease_descriptions['Healthy'] = 'The leaf shows no signs of disease. The plant appears to be in good health with normal coloration and structure.'
+            if 'Healthy' not in self.pesticide_map:
+                self.pesticide_map['Healthy'] = 'None'
+        
+        num_classes = len(class_names)
+        architecture = getattr(models, self.architecture)
+        if mmapped:
+            # Build on the meta device (no storage allocated) and adopt the
+            # mmapped tensors directly, so the weights exist once, in the page cache
+            with torch.device('meta'):
+                model = architecture(weights=None)
+                model.fc = nn.Linear(model.fc.in_features, num_classes)
+            model.load_state_dict(state_dict, assign=True)
+        else:
+            model = architecture(weights=None)
+            model.fc = nn.Linear(model.fc.in_features, num_classes)
+            
+            # Load trained weights - matching working code exactly
+            model.load_state_dict(state_dict)
+        model = model.to(self.device)
+        model.eval()
+        model.class_names = class_names
+        model.version = version
+        
+        memory_after = process_memory()
+        load_stats = {
+            'load_seconds': time.perf_counter() - load_start,
+            'mmap': mmapped,
+            'weights_bytes': sum(t.numel() * t.element_size() for t in model.state_dict().values()),
+            'rss_before': memory_before['rss'],
+            'rss_after': memory_after['rss'],
+            'peak_rss': memory_after['peak_rss'],
+            'shared': memory_after['shared'],
+            'private': memory_after['private']
+        }
+        return model, load_stats
+    
+    @property
+    def model_version(self):
+        model = self.model
+        return getattr(model, 'version', None) or 'rule-based'
+    
+    def artifact_paths(self):
+        return [self.model_path]
+    
+    def validate_model(self, model, samples_dir='test_samples', min_accuracy=0.5):
+        """Run model over the labelled smoke set; raises ValueError if it looks broken.
+        
+        Sample labels come from the file name prefix (black_rot_, scab_, powdery_mildew_).
+        """
+        labels = {'black_rot': 'Apple Black Rot', 'scab': 'Apple Scab', 'powdery_mildew': 'Powdery Mildew',
+                  'healthy': 'Healthy'}
+        checked = correct = 0
+        for name in sorted(os.listdir(samples_dir)):
+            if not name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+            with Image.open(os.path.join(samples_dir, name)) as image:
+                batch = self.preprocess_image(image)
+            with torch.no_grad():
+                outputs = model(batch)
+            if outputs.shape != (1, len(model.class_names)) or not torch.isfinite(outputs).all():
+                raise ValueError(f"unexpected output {tuple(outputs.shape)} for {name}")
+            predicted = self._format_class_name(model.class_names[int(outputs[0].argmax())])
+            expected = next((label for prefix, label in labels.items() if name.startswith(prefix)), None)
+            if expected is not None:
+                checked += 1
+                correct += predicted == expected
+        if checked and correct / checked < min_accuracy:
+            raise ValueError(f"smoke set accuracy {correct}/{checked} is below {min_accuracy:.0%}")
+        return {'samples': checked, 'accuracy': correct / checked if checked else None}
+    
+    def reload(self, min_accuracy=0.5):
+        """Load model.pth in the caller's thread, validate it, then swap it in.
+        
+        Requests already running keep the model they started with. Raises
+        (leaving the current model in place) if loading or validation fails.
+        """
+        model, load_stats = self._build_model()
+        validation = self.validate_model(model, min_accuracy=min_accuracy)
+        self.class_names = model.class_names
+        self.load_stats = load_stats
+        self.model = model
+        return {'version': model.version, 'validation': validation, 'load_seconds': load_stats['load_seconds']}
+    
+    def _load_state_dict(self):
+        """Load weights, memory-mapped when possible. Returns (state_dict, mmapped).
+        
+        On CPU the checkpoint is mapped read-only (torch.load(mmap=True)), so
+        forked workers share its pages copy-on-write. GPU inference needs a
+        device copy anyway, and legacy (non-zip) checkpoints cannot be mapped;
+        both use the regular load.
+        """
+        supports_assign = 'assign' in inspect.signature(nn.Module.load_state_dict).parameters
+        if self.device.type == 'cpu' and supports_assign:
+            try:
+                state_dict = torch.load(self.model_path, map_location='cpu', mmap=True)
+                if isinstance(state_dict, dict) and all(isinstance(v, torch.Tensor) for v in state_dict.values()):
+                    return state_dict, True
+                return state_dict, False
+            except (TypeError, RuntimeError) as e:
+                # TypeError: no mmap argument in this torch; RuntimeError: legacy format
+                self._safe_print(f"Memory-mapped load unavailable ({e}); loading weights into memory")
+        return torch.load(self.model_path, map_location=self.device), False
     
     def _safe_print(self, message):
         """Print message with UTF-8 encoding to avoid Unicode errors."""
@@ -162,63 +328,85 @@ class DiseaseDetector:
         
         return img_tensor
     
-    def detect_disease(self, image):
-        """Detect disease using PyTorch model - matching working code exactly."""
+    def detect_disease(self, image, use_model=True, return_embedding=False):
+        """Detect disease using PyTorch model - matching working code exactly.
+        
+        use_model=False forces the cheap rule-based detection (used under overload).
+        return_embedding=True adds 'embedding', the image's penultimate-layer
+        features from the same forward pass (float32 array; None without a model).
+        """
         try:
-            if self.model is not None and isinstance(self.model, nn.Module):
+            # One read of self.model: a concurrent reload() cannot change it mid-request
+            model = self.model
+            if use_model and model is not None and isinstance(model, nn.Module):
+                class_names = getattr(model, 'class_names', self.class_names)
                 # Preprocess image - matching working code
-                processed_image = self.preprocess_image(image)
+                with metrics.stage('disease.preprocess'):
+                    processed_image = self.preprocess_image(image)
                 
                 # Run inference - matching working code exactly
-                with torch.no_grad():
-                    outputs = self.model(processed_image)
+                embedding = None
+                with metrics.stage('disease.forward'), torch.no_grad():
+                    if return_embedding:
+                        features, outputs = forward_with_embedding(model, processed_image)
+                        embedding = features[0].cpu().numpy()
+                    else:
+                        outputs = model(processed_image)
                     
                     # Apply softmax - CRITICAL: Use outputs[0] and dim=0 like working code
                     probabilities = torch.nn.functional.softmax(outputs[0], dim=0)
                     
                     # Get prediction - matching working code
                     confidence, predicted_idx = torch.max(probabilities, 0)
-                    predicted_class = self.class_names[predicted_idx.item()]
+                    predicted_class = class_names[predicted_idx.item()]
                     confidence_percent = confidence.item() * 100
                 
-                # Convert to numpy for all probabilities
-                all_probabilities = probabilities.cpu().numpy()
-                
-                # Format all predictions
-                all_predictions = []
-                for i, class_name in enumerate(self.class_names):
-                    prob_value = float(all_probabilities[i] * 100)
-                    all_predictions.append({
-                        'disease': self._format_class_name(class_name),
-                        'confidence': prob_value
-                    })
-                
-                # Sort by confidence (descending)
-                all_predictions.sort(key=lambda x: x['confidence'], reverse=True)
-                
-                # Format class name nicely (like working code)
-                formatted_class = self._format_class_name(predicted_class)
-                is_healthy = (formatted_class == 'Healthy')
+                with metrics.stage('disease.postprocess'):
+                    # Convert to numpy for all probabilities
+                    all_probabilities = probabilities.cpu().numpy()
+                    
+                    # Format all predictions
+                    all_predictions = []
+                    for i, class_name in enumerate(class_names):
+                        prob_value = float(all_probabilities[i] * 100)
+                        all_predictions.append({
+                            'disease': self._format_class_name(class_name),
+                            'confidence': prob_value
+                        })
+                    
+                    # Sort by confidence (descending)
+                    all_predictions.sort(key=lambda x: x['confidence'], reverse=True)
+                    
+                    # Format class name nicely (like working code)
+                    formatted_class = self._format_class_name(predicted_class)
+                    is_healthy = (formatted_class == 'Healthy')
                 
             else:
                 # Fallback to rule-based detection
-                result = self._rule_based_detection(image)
+                with metrics.stage('disease.rule_based'):
+                    result = self._rule_based_detection(image)
                 formatted_class = result['disease']
                 confidence_percent = result['confidence']
                 all_predictions = result['all_predictions']
                 is_healthy = (formatted_class == 'Healthy')
+                model = None
+                embedding = None
             
             pesticide = self.pesticide_map.get(formatted_class, 'Unknown')
             pesticide_info = self.pesticide_details.get(pesticide, None)
             
-            return {
+            result = {
                 'disease': formatted_class,
                 'confidence': confidence_percent,
                 'is_healthy': is_healthy,
                 'pesticide': pesticide,
                 'pesticide_details': pesticide_info,
-                'all_predictions': all_predictions
+                'all_predictions': all_predictions,
+                'model_version': getattr(model, 'version', None) or 'rule-based'
             }
+            if return_embedding:
+                result['embedding'] = embedding
+            return result
             
         except Exception as e:
             import traceback
@@ -234,8 +422,14 @@ class DiseaseDetector:
                 'error': str(e)
             }
     
+    def display_classes(self):
+        """Class names as detect_disease reports them."""
+        return [self._format_class_name(name) for name in self.class_names]
+    
     def _format_class_name(self, class_name):
         """Format class name nicely - matching working code logic."""
+        if self.manifest:
+            return class_name  # manifest classes are display names already
         formatted = class_name.title()
         if "black rot" in class_name.lower():
             formatted = "Apple Black Rot"
@@ -0,0 +1,205 @@
+"""Per-crop disease models, loaded on first use and evicted least recently used.
+
+Each crop is described by a JSON manifest in models/disease/ (crop defaults
+to the file name):
+
+    {
+      "crop": "grape",
+      "path": "models/grape.pth",
+      "architecture": "resnet18",
+      "classes": ["Grape Black Rot", "Grape Esca (Black Measles)", "Healthy", ...],
+      "descriptions": {"Grape Black Rot": "..."},
+      "pesticides": {"Grape Black Rot": "Mancozeb", ...},
+      "pesticide_details": {"Mancozeb": {"description": ..., "usage": ..., "precautions": ...}}
+    }
+
+classes are in checkpoint output order. The built-in apple detector is the
+default crop; it stays loaded and keeps its rule-based fallback. Other crops
+load the first time they are asked for, and while the loaded weights exceed
+memory_cap bytes the least recently used of them are dropped (requests
+already holding one finish with it). A crop whose weights are missing or
+fail to load raises ModelUnavailable rather than answering with apple rules.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
+from monitoring import metrics
+from .disease_detector import DiseaseDetector
+
+ARCHITECTURES = ('resnet18', 'resnet34', 'resnet50')
+
+loads_total = metrics.registry.counter(
+    'scs_disease_model_loads_total', 'Crop disease model loads by result', ['crop', 'result'])
+evictions_total = metrics.registry.counter(
+    'scs_disease_model_evictions_total', 'Crop disease models evicted to stay under the memory cap', ['crop'])
+inference_seconds = metrics.registry.histogram(
+    'scs_disease_model_seconds', 'Disease detection time per crop model', ['crop'])
+
+
+class ModelUnavailable(Exception):
+    def __init__(self, crop, reason):
+        super().__init__(f"no disease model available for {crop}: {reason}")
+        self.crop = crop
+        self.reason = reason
+
+
+def load_manifests(directory):
+    """{crop: manifest} for every *.json in directory (missing directory: none)."""
+    manifests = {}
+    if not os.path.isdir(directory):
+        return manifests
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifest.setdefault('crop', name[:-len('.json')])
+            manifest['crop'] = manifest['crop'].lower()
+            if not manifest.get('path') or not manifest.get('classes'):
+                raise ValueError("'path' and 'classes' are required")
+            if manifest.setdefault('architecture', 'resnet18') not in ARCHITECTURES:
+                raise ValueError(f"architecture must be one of: {', '.join(ARCHITECTURES)}")
+        except (OSError, ValueError) as e:
+            print(f"Warning: Skipping disease model manifest {path}: {e}")
+            continue
+        manifests[manifest['crop']] = manifest
+    return manifests
+
+
+class DiseaseModelRegistry:
+    def __init__(self, manifests, default_detector, default_crop='apple', memory_cap=256 * 1024 * 1024,
+                 latency_window=512):
+        self.manifests = dict(manifests)
+        self.default_crop = default_crop
+        self.default_detector = default_detector
+        self.memory_cap = memory_cap
+        self._loaded = OrderedDict()    # crop -> (signature, detector), least recently used first
+        self._failed = {}               # crop -> (signature, error) of the last failed load
+        self._crop_locks = {crop: threading.Lock() for crop in self.manifests}
+        self._lock = threading.Lock()
+        self._stats = {crop: {'loads': 0, 'evictions': 0, 'requests': 0, 'load_seconds': None,
+                              'latency': deque(maxlen=latency_window)}
+                       for crop in self.crops()}
+
+    def crops(self):
+        return [self.default_crop] + sorted(crop for crop in self.manifests if crop != self.default_crop)
+
+    def _signature(self, crop):
+        try:
+            st = os.stat(self.manifests[crop]['path'])
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def get(self, crop=None):
+        """The detector for crop (default crop if None); KeyError if unknown, ModelUnavailable if unloadable."""
+        crop = (crop or self.default_crop).lower()
+        if crop == self.default_crop and crop not in self.manifests:
+            return self.default_detector
+        if crop not in self.manifests:
+            raise KeyError(crop)
+        signature = self._signature(crop)
+        with self._lock:
+            cached = self._loaded.get(crop)
+            if cached is not None and cached[0] == signature:
+                self._loaded.move_to_end(crop)
+                return cached[1]
+        with self._crop_locks[crop]:
+            # Another request may have loaded it while this one waited
+            with self._lock:
+                cached = self._loaded.get(crop)
+                if cached is not None and cached[0] == signature:
+                    self._loaded.move_to_end(crop)
+                    return cached[1]
+            if signature is None:
+                raise ModelUnavailable(crop, 'model file not found')
+            failed = self._failed.get(crop)
+            if failed is not None and failed[0] == signature:
+                raise ModelUnavailable(crop, failed[1])
+            return self._load(crop, signature)
+
+    def _load(self, crop, signature):
+        detector = DiseaseDetector(self.manifests[crop], load=False)
+        detector.load_model()
+        if detector.model is None:
+            loads_total.inc(crop=crop, result='error')
+            self._failed[crop] = (signature, detector.load_error)
+            raise ModelUnavailable(crop, detector.load_error)
+        loads_total.inc(crop=crop, result='ok')
+        self._failed.pop(crop, None)
+        with self._lock:
+            stats = self._stats[crop]
+            stats['loads'] += 1
+            stats['load_seconds'] = detector.load_stats['load_seconds']
+            self._loaded[crop] = (signature, detector)
+            self._loaded.move_to_end(crop)
+            self._evict(keep=crop)
+        return detector
+
+    def _evict(self, keep):
+        # Called with self._lock held
+        while self._loaded_bytes() > self.memory_cap:
+            crop = next((name for name in self._loaded if name != keep), None)
+            if crop is None:
+                break
+            del self._loaded[crop]
+            self._stats[crop]['evictions'] += 1
+            evictions_total.inc(crop=crop)
+            print(f"Evicted {crop} disease model to stay under {self.memory_cap / 1024 / 1024:.0f} MB")
+
+    def _loaded_bytes(self):
+        return sum(detector.load_stats.get('weights_bytes', 0) for _, detector in self._loaded.values())
+
+    def loaded_bytes(self):
+        with self._lock:
+            return self._loaded_bytes()
+
+    def loaded_detectors(self):
+        with self._lock:
+            return [self.default_detector] + [detector for _, detector in self._loaded.values()]
+
+    def observe(self, crop, seconds):
+        """Record one detection's latency for crop."""
+        inference_seconds.observe(seconds, crop=crop)
+        with self._lock:
+            stats = self._stats[crop]
+            stats['requests'] += 1
+            stats['latency'].append(seconds)
+
+    def available(self, crop):
+        """True if crop's weights are present (a load may still fail)."""
+        if crop == self.default_crop and crop not in self.manifests:
+            return True
+        return self._signature(crop) is not None
+
+    def stats(self):
+        """Per-crop state, load/eviction counts and recent latency percentiles (this worker)."""
+        with self._lock:
+            report = {}
+            for crop in self.crops():
+                stats = self._stats[crop]
+                if crop == self.default_crop and crop not in self.manifests:
+                    detector, state = self.default_detector, 'pinned'
+                elif crop in self._loaded:
+                    detector, state = self._loaded[crop][1], 'loaded'
+                else:
+                    detector, state = None, 'failed' if crop in self._failed else 'unloaded'
+                latency = sorted(stats['latency'])
+                report[crop] = {
+                    'state': state,
+                    'model_version': detector.model_version if detector else None,
+                    'weights_bytes': detector.load_stats.get('weights_bytes') if detector else None,
+                    'loads': stats['loads'],
+                    'evictions': stats['evictions'],
+                    'requests': stats['requests'],
+                    'load_seconds': stats['load_seconds'] if detector is not self.default_detector
+                    else detector.load_stats.get('load_seconds'),
+                    'p50_ms': latency[len(latency) // 2] * 1000 if latency else None,
+                    'p95_ms': latency[min(len(latency) - 1, int(len(latency) * 0.95))] * 1000 if latency else None,
+                    'error': self._failed[crop][1] if state == 'failed' else None
+                }
+            return {'memory_cap': self.memory_cap, 'loaded_bytes': self._loaded_bytes(), 'crops': report}
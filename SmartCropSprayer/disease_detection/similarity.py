@@ -0,0 +1,246 @@
+"""Nearest-neighbour search over stored detection embeddings.
+
+Embeddings (database/embeddings.py) are unit length, so the most similar
+past cases are the rows with the largest dot product with the query.
+Two ways to find them:
+
+  exact   the float16 rows are converted and multiplied block by block;
+          200-300 ms per 100k rows on one core (mostly the conversion)
+  ivfpq   an inverted file with product quantization, built offline. Rows
+          are grouped under the nearest of nlist k-means centroids and kept
+          as m one-byte codes of their residual. A query scores only the
+          rows of the nprobe closest lists, from lookup tables, then
+          re-ranks the best 1024 with their exact float16 vectors.
+
+Rows appended after an index was built are searched exactly, so the index
+only needs rebuilding (e.g. nightly) once that tail grows large:
+
+    python -m disease_detection.similarity --nlist 1024 --m 64
+"""
+import argparse
+import os
+import threading
+
+import numpy as np
+
+
+def _top_k(scores, k):
+    """Positions of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _nearest(data, centroids, block_rows=16384):
+    """Index of the nearest centroid (L2) for each row of data."""
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    nearest = np.empty(len(data), dtype=np.int64)
+    for offset in range(0, len(data), block_rows):
+        block = np.asarray(data[offset:offset + block_rows], dtype=np.float32)
+        # argmin |x - c|^2 == argmax x.c - |c|^2 / 2
+        nearest[offset:offset + len(block)] = (block @ centroids.T - half_norms).argmax(axis=1)
+    return nearest
+
+
+def kmeans(data, k, iterations=20, seed=0):
+    """Lloyd's k-means on float32 rows; returns k centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind='stable')
+        filled = counts > 0
+        starts = np.searchsorted(assign[order], np.arange(k))[filled]
+        centroids[filled] = np.add.reduceat(data[order], starts) / counts[filled, None]
+        # Restart empty clusters from random rows
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def search_exact(vectors, query, k, start=0, block_rows=65536):
+    """(rows, scores) of the k best rows of vectors[start:] for a unit float32 query."""
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for offset in range(start, len(vectors), block_rows):
+        scores = np.asarray(vectors[offset:offset + block_rows], dtype=np.float32) @ query
+        top = _top_k(scores, k)
+        best_rows = np.concatenate([best_rows, top + offset])
+        best_scores = np.concatenate([best_scores, scores[top]])
+        keep = _top_k(best_scores, k)
+        best_rows, best_scores = best_rows[keep], best_scores[keep]
+    return best_rows, best_scores
+
+
+class IVFPQIndex:
+    def __init__(self, centroids, codebooks, offsets, rows, codes, size):
+        self.centroids = centroids    # (nlist, dim) float32
+        self.codebooks = codebooks    # (m, ksub, dim / m) float32
+        self.offsets = offsets        # list l holds positions offsets[l]:offsets[l + 1]
+        self.rows = rows              # store row of each position
+        self.codes = codes            # (positions, m) uint8
+        self.size = size              # store rows 0..size-1 are indexed
+
+    @classmethod
+    def build(cls, vectors, nlist=None, m=None, sample=None, iterations=10, seed=0, block_rows=65536):
+        """Train on a sample of vectors (N x dim, e.g. the float16 memmap) and encode all of them.
+
+        Quantizers are trained on `sample` rows (default 64 per list, as more
+        barely moves the centroids); every row is then assigned and encoded.
+        """
+        n, dim = vectors.shape
+        nlist = min(n, nlist or int(np.clip(np.sqrt(n), 16, 4096)))
+        m = m or dim // 8
+        if dim % m:
+            raise ValueError(f'm={m} must divide the embedding size {dim}')
+        rng = np.random.default_rng(seed)
+        sample = min(n, sample or max(64 * nlist, 32768))
+        train = np.asarray(vectors[np.sort(rng.choice(n, sample, replace=False))], dtype=np.float32)
+
+        centroids = kmeans(train, nlist, iterations, seed)
+        # Codebooks: 256 one-byte codes per subspace, trained on 64 residuals per code
+        residuals = (train - centroids[_nearest(train, centroids)])[:16384]
+        sub = dim // m
+        ksub = min(256, len(residuals))
+        codebooks = np.stack([kmeans(np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub]), ksub, iterations,
+                                     seed + 1 + j) for j in range(m)])
+
+        lists = np.empty(n, dtype=np.int64)
+        codes = np.empty((n, m), dtype=np.uint8)
+        for offset in range(0, n, block_rows):
+            block = np.asarray(vectors[offset:offset + block_rows], dtype=np.float32)
+            nearest = _nearest(block, centroids)
+            lists[offset:offset + len(block)] = nearest
+            codes[offset:offset + len(block)] = cls._encode(block - centroids[nearest], codebooks)
+        order = np.argsort(lists, kind='stable')
+        offsets = np.searchsorted(lists[order], np.arange(nlist + 1))
+        return cls(centroids, codebooks, offsets, order, codes[order], n)
+
+    @staticmethod
+    def _encode(residuals, codebooks):
+        m, _, sub = codebooks.shape
+        codes = np.empty((len(residuals), m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = _nearest(residuals[:, j * sub:(j + 1) * sub], codebooks[j])
+        return codes
+
+    def search(self, query, k, nprobe=16, vectors=None, rerank=1024):
+        """(rows, scores) of the approximate k best rows.
+
+        With vectors (the store's float16 rows), the best `rerank` candidates
+        are re-scored exactly, so returned scores are true similarities.
+        """
+        coarse = self.centroids @ query
+        probe = _top_k(coarse, nprobe)
+        starts, ends = self.offsets[probe], self.offsets[probe + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)])
+        m, _, sub = self.codebooks.shape
+        # q.x ~= q.centroid + sum over subspaces of q_j.codeword_j
+        tables = np.einsum('jks,js->jk', self.codebooks, query.reshape(m, sub))
+        scores = tables[np.arange(m), self.codes[positions]].sum(axis=1) + np.repeat(coarse[probe], lengths)
+        rows = self.rows[positions]
+        if vectors is not None:
+            shortlist = _top_k(scores, max(rerank, k))
+            rows = np.sort(rows[shortlist])  # ascending rows: sequential reads from the memmap
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        top = _top_k(scores, k)
+        return rows[top], scores[top]
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, centroids=self.centroids, codebooks=self.codebooks, offsets=self.offsets,
+                 rows=self.rows, codes=self.codes, size=np.array(self.size))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['codebooks'], data['offsets'], data['rows'], data['codes'],
+                       int(data['size']))
+
+
+class SimilarCases:
+    """Similarity search over an EmbeddingStore, using a built index when there is one."""
+
+    def __init__(self, store, nprobe=16):
+        self.store = store
+        self.nprobe = nprobe
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index_path(self, version):
+        return os.path.join(self.store.directory, version + '.ivfpq.npz')
+
+    def _index(self, version):
+        """The version's IVF-PQ index, reloaded when the file changes (None if not built)."""
+        path = self.index_path(version)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._indexes.get(version)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, IVFPQIndex.load(path))
+                self._indexes[version] = cached
+        return cached[1]
+
+    def search(self, version, query, k=5, nprobe=None, exclude_ids=()):
+        """([(detection id, similarity)], stats) for the k stored rows most like query."""
+        ids, vectors = self.store.load(version)
+        if ids is None:
+            return [], {'indexed': 0, 'exact': 0}
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        wanted = k + len(exclude_ids)
+        index = self._index(version)
+        if index is not None and index.size <= len(ids):
+            rows, scores = index.search(query, wanted, nprobe or self.nprobe, vectors)
+            indexed = index.size
+        else:
+            rows, scores, indexed = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), 0
+        tail_rows, tail_scores = search_exact(vectors, query, wanted, start=indexed)
+        rows = np.concatenate([rows, tail_rows])
+        scores = np.concatenate([scores, tail_scores])
+        cases = [(int(ids[rows[i]]), float(scores[i])) for i in _top_k(scores, len(scores))
+                 if int(ids[rows[i]]) not in exclude_ids]
+        return cases[:k], {'indexed': indexed, 'exact': len(ids) - indexed}
+
+    def build(self, version, **options):
+        """Build and save the IVF-PQ index over everything stored for version; returns it."""
+        _, vectors = self.store.load(version)
+        if vectors is None:
+            return None
+        index = IVFPQIndex.build(vectors, **options)
+        index.save(self.index_path(version))
+        return index
+
+
+if __name__ == '__main__':
+    import time
+    from database.embeddings import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description='Build IVF-PQ similarity indexes over stored embeddings')
+    parser.add_argument('--dir', default=os.environ.get('EMBEDDINGS_DIR', 'database/embeddings'))
+    parser.add_argument('--version', help='Model version to index (default: every stored version)')
+    parser.add_argument('--nlist', type=int, help='Inverted lists (default sqrt(rows), 16..4096)')
+    parser.add_argument('--m', type=int, help='Bytes per vector code (default embedding size / 8)')
+    parser.add_argument('--sample', type=int, help='Rows used to train the lists (default 64 per list)')
+    args = parser.parse_args()
+
+    similar = SimilarCases(EmbeddingStore(args.dir))
+    for version in [args.version] if args.version else similar.store.versions():
+        start = time.perf_counter()
+        index = similar.build(version, nlist=args.nlist, m=args.m, sample=args.sample)
+        if index is None:
+            print(f"{version}: no embeddings stored")
+            continue
+        print(f"{version}: indexed {index.size} embeddings in {len(index.centroids)} lists, "
+              f"{index.codes.shape[1]} bytes each, in {time.perf_counter() - start:.1f}s")
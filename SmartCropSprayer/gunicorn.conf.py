@@ -0,0 +1,74 @@
+"""Gunicorn settings for SmartCropSprayer.
+
+Every value can be overridden with an environment variable, e.g.
+    WEB_WORKERS=4 WEB_THREADS=2 gunicorn -c gunicorn.conf.py wsgi:app
+
+Sizing guidance and benchmark numbers: README_DEPLOYMENT.txt (PRODUCTION SERVER).
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('WEB_HOST', '127.0.0.1')}:{os.environ.get('WEB_PORT', 5000)}"
+
+# Disease detection is CPU bound, so one worker per core; threads cover the
+# I/O-bound routes (history, chatbot upstream calls) inside each worker.
+# Only measured on 1 vCPU so far: benchmark the multi-core target (README sizing).
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# Load models once in the master; workers inherit them copy-on-write
+preload_app = True
+
+# Graceful drain: on SIGTERM workers stop accepting and finish in-flight
+# requests for up to graceful_timeout seconds before being killed
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+
+# Keep idle client connections open this many seconds between requests
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+backlog = int(os.environ.get('WEB_BACKLOG', 256))
+
+# Optional periodic worker recycling (0 disables)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 0))
+
+# Heartbeat file on tmpfs so a slow disk cannot stall workers
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('WEB_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Worker metric snapshots from a previous run must not be merged into this one
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    # Move everything allocated during preload out of the GC's reach, so
+    # collections in the workers do not touch (and un-share) those pages
+    gc.freeze()
+    server.log.info(f"Models preloaded; starting {workers} worker(s) x {threads} thread(s)")
+
+
+def post_fork(server, worker):
+    # N workers each using every core for torch would oversubscribe the CPU
+    try:
+        import torch
+        torch.set_num_threads(int(os.environ.get('TORCH_THREADS', 1)))
+    except ImportError:
+        pass
+
+
+def worker_exit(server, worker):
+    from app import chatbot
+    if hasattr(chatbot, 'client') and hasattr(chatbot.client, 'close'):
+        chatbot.client.close()
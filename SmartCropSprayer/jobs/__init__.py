@@ -0,0 +1,5 @@
+from .queue import JobQueue, JOB_KINDS
+from .worker import JobWorker, start_worker_threads
+from .runners import use_models
+
+__all__ = ['JobQueue', 'JobWorker', 'JOB_KINDS', 'start_worker_threads', 'use_models']
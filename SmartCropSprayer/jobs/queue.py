@@ -0,0 +1,168 @@
+"""SQLite-backed queue for long-running bulk scoring jobs.
+
+A job moves through queued -> running -> completed / failed / cancelled.
+Workers claim jobs atomically and record a checkpoint after every chunk:
+how many input items are done and how many bytes of the result file are
+valid. A job whose worker stops heartbeating is handed to another worker,
+which truncates the result file to the checkpoint and carries on from
+there, so every item appears in the output exactly once.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+JOB_KINDS = ('disease', 'crop', 'rescore')
+
+
+class JobQueue:
+    def __init__(self, db_path='database/jobs.db', results_dir='job_results', stale_after=120):
+        self.db_path = db_path
+        self.results_dir = results_dir
+        # Seconds without a heartbeat before a running job is reclaimed
+        self.stale_after = stale_after
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        os.makedirs(results_dir, exist_ok=True)
+        self.init_database()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_database(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                options TEXT,
+                status TEXT NOT NULL,
+                total INTEGER,
+                processed INTEGER NOT NULL DEFAULT 0,
+                failed_items INTEGER NOT NULL DEFAULT 0,
+                output_bytes INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+        conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'] or '{}')
+        job['progress'] = job['processed'] / job['total'] if job['total'] else None
+        return job
+
+    def submit(self, kind, input_path, **options):
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'; choose from {', '.join(JOB_KINDS)}")
+        job_id = uuid.uuid4().hex
+        output_path = os.path.join(self.results_dir, f'{job_id}.ndjson')
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO jobs (id, kind, input_path, output_path, options, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, kind, input_path, output_path, json.dumps(options), QUEUED, time.time()))
+        conn.close()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        return self._to_dict(row)
+
+    def list_jobs(self, status=None, limit=50):
+        conn = self._connect()
+        if status:
+            rows = conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?',
+                                (status, limit)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        conn.close()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker):
+        """Atomically take the oldest queued (or abandoned running) job, or return None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT id FROM jobs
+                WHERE status = ? OR (status = ? AND heartbeat_at < ?)
+                ORDER BY created_at LIMIT 1
+            ''', (QUEUED, RUNNING, now - self.stale_after)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute('''
+                UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,
+                       started_at = COALESCE(started_at, ?), heartbeat_at = ?
+                WHERE id = ?
+            ''', (RUNNING, worker, now, now, row['id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return self.get(row['id'])
+
+    def set_total(self, job_id, total):
+        conn = self._connect()
+        conn.execute('UPDATE jobs SET total = ? WHERE id = ?', (total, job_id))
+        conn.close()
+
+    def checkpoint(self, job_id, worker, processed, failed_items, output_bytes):
+        """Record progress; returns False if the job was cancelled or taken over."""
+        conn = self._connect()
+        cursor = conn.execute('''
+            UPDATE jobs SET processed = ?, failed_items = ?, output_bytes = ?, heartbeat_at = ?
+            WHERE id = ? AND worker = ? AND status = ?
+        ''', (processed, failed_items, output_bytes, time.time(), job_id, worker, RUNNING))
+        conn.close()
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, worker, status, error=None):
+        conn = self._connect()
+        conn.execute('''
+            UPDATE jobs SET status = ?, error = ?, finished_at = ?
+            WHERE id = ? AND worker = ? AND status = ?
+        ''', (status, error, time.time(), job_id, worker, RUNNING))
+        conn.close()
+
+    def release(self, job_id, worker):
+        """Hand a running job back to the queue (worker shutting down)."""
+        conn = self._connect()
+        conn.execute('UPDATE jobs SET status = ?, worker = NULL WHERE id = ? AND worker = ? AND status = ?',
+                     (QUEUED, job_id, worker, RUNNING))
+        conn.close()
+
+    def cancel(self, job_id):
+        conn = self._connect()
+        cursor = conn.execute('UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+                              (CANCELLED, time.time(), job_id, QUEUED, RUNNING))
+        conn.close()
+        return cursor.rowcount == 1
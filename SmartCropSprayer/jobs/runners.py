@@ -0,0 +1,200 @@
+"""Scoring logic for each job kind.
+
+A runner knows how to count the items in an input, read them in chunks
+starting from a checkpoint, and score a chunk. Models are created once per
+worker process and reused for every job it runs. When jobs run inside the
+web process, use_models() shares the app's models instead and routes every
+call through their schedulers as bulk work.
+"""
+import contextlib
+import csv
+import os
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+# Accepted CSV headers for each feature, in CropPredictor feature order
+CSV_COLUMNS = [
+    ('N', 'nitrogen'), ('P', 'phosphorus'), ('K', 'potassium'), ('temperature',),
+    ('humidity',), ('ph',), ('rainfall',)
+]
+
+_models = {}
+_schedulers = {}
+
+
+def use_models(detector=None, crop_predictor=None, schedulers=None):
+    """Score with existing model instances, scheduled as bulk work if schedulers are given."""
+    if detector is not None:
+        _models['disease'] = detector
+    if crop_predictor is not None:
+        _models['crop'] = crop_predictor
+    _schedulers.update(schedulers or {})
+
+
+def _slot(name):
+    scheduler = _schedulers.get(name)
+    return scheduler.slot('bulk') if scheduler is not None else contextlib.nullcontext()
+
+
+def _model(name):
+    if name not in _models:
+        if name == 'disease':
+            from disease_detection import DiseaseDetector
+            _models[name] = DiseaseDetector()
+        else:
+            from crop_prediction import CropPredictor
+            _models[name] = CropPredictor()
+    return _models[name]
+
+
+class DiseaseJobRunner:
+    """Input: a directory of leaf images (searched recursively, sorted by path)."""
+
+    def _files(self, input_path):
+        files = []
+        for root, dirs, names in os.walk(input_path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append(os.path.relpath(os.path.join(root, name), input_path))
+        return files
+
+    def count(self, input_path):
+        if not os.path.isdir(input_path):
+            raise ValueError(f"{input_path} is not a directory")
+        return len(self._files(input_path))
+
+    def iter_chunks(self, input_path, start, chunk_size):
+        files = self._files(input_path)
+        for offset in range(start, len(files), chunk_size):
+            yield [(index, os.path.join(input_path, files[index]), files[index])
+                   for index in range(offset, min(offset + chunk_size, len(files)))]
+
+    def score(self, chunk):
+        detector = _model('disease')
+        results = []
+        for index, path, name in chunk:
+            try:
+                # One slot per image (decode included, it is CPU work too) so
+                # interactive requests can slip in between
+                with _slot('disease'), Image.open(path) as image:
+                    image.load()
+                    result = detector.detect_disease(image)
+            except Exception as e:
+                results.append({'index': index, 'file': name, 'error': str(e)})
+                continue
+            if result.get('error'):
+                results.append({'index': index, 'file': name, 'error': result['error']})
+                continue
+            results.append({
+                'index': index,
+                'file': name,
+                'disease': result['disease'],
+                'confidence': round(result['confidence'], 2),
+                'is_healthy': result['is_healthy'],
+                'pesticide': result['pesticide']
+            })
+        return results
+
+
+class RescoreJobRunner(DiseaseJobRunner):
+    """Input: the image archive's objects/ directory; re-scores every stored image.
+
+    Each result carries the image hash, the model version, and the most recent
+    stored detection for that image (from history_db) for comparison.
+    """
+
+    def __init__(self, history_db=None):
+        self.history = None
+        if history_db:
+            from database import FarmingHistoryManager
+            self.history = FarmingHistoryManager(history_db)
+
+    def score(self, chunk):
+        results = super().score(chunk)
+        version = _model('disease').model_version
+        for result in results:
+            result['image_sha256'] = os.path.splitext(os.path.basename(result['file']))[0]
+            result['model_version'] = version
+        if self.history is not None:
+            previous = self.history.get_latest_detections(r['image_sha256'] for r in results)
+            for result in results:
+                before = previous.get(result['image_sha256'])
+                if before is not None:
+                    result['previous'] = before
+                    result['changed'] = 'disease' in result and result['disease'] != before['detected_disease']
+        return results
+
+
+class CropJobRunner:
+    """Input: a soil survey CSV with N/P/K (or nitrogen/...), temperature, humidity, ph, rainfall."""
+
+    def __init__(self, top_n=3):
+        self.top_n = top_n
+
+    @staticmethod
+    def _columns(header):
+        lookup = {name.strip().lower(): i for i, name in enumerate(header)}
+        columns = []
+        for aliases in CSV_COLUMNS:
+            for alias in aliases:
+                if alias.lower() in lookup:
+                    columns.append(lookup[alias.lower()])
+                    break
+            else:
+                raise ValueError(f"CSV is missing a '{aliases[-1]}' column")
+        return columns
+
+    def count(self, input_path):
+        with open(input_path, newline='') as f:
+            reader = csv.reader(f)
+            self._columns(next(reader, []))
+            return sum(1 for row in reader if row)
+
+    def iter_chunks(self, input_path, start, chunk_size):
+        with open(input_path, newline='') as f:
+            reader = csv.reader(f)
+            columns = self._columns(next(reader))
+            chunk = []
+            index = 0
+            for row in reader:
+                if not row:
+                    continue
+                if index >= start:
+                    chunk.append((index, [row[c] if c < len(row) else '' for c in columns]))
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+                index += 1
+            if chunk:
+                yield chunk
+
+    def score(self, chunk):
+        results = {}
+        valid = []
+        for index, values in chunk:
+            try:
+                valid.append((index, [float(v) for v in values]))
+            except ValueError:
+                results[index] = {'index': index, 'error': f"non-numeric value in row: {values}"}
+        if valid:
+            with _slot('crop'):
+                predictions = _model('crop').predict_batch([features for _, features in valid], top_n=self.top_n)
+            for (index, features), top in zip(valid, predictions):
+                results[index] = {
+                    'index': index,
+                    'input': features,
+                    'crop': top[0]['crop'],
+                    'confidence': round(float(top[0]['confidence']), 2),
+                    'top': [{'crop': p['crop'], 'confidence': round(float(p['confidence']), 2)} for p in top]
+                }
+        return [results[index] for index, _ in chunk]
+
+
+RUNNERS = {
+    'disease': DiseaseJobRunner,
+    'crop': CropJobRunner,
+    'rescore': RescoreJobRunner
+}
@@ -0,0 +1,123 @@
+"""Worker processes for the bulk job queue.
+
+    python -m jobs.worker --processes 2
+
+Jobs can also run inside the web process (JOBS_IN_PROCESS), sharing its
+models with interactive requests; see serving/scheduler.py.
+
+Each process claims one job at a time and scores it chunk by chunk,
+appending results to the job's NDJSON file and checkpointing after every
+chunk. SIGTERM/Ctrl-C finishes the current chunk, hands the job back to
+the queue and exits; the next worker resumes from the checkpoint.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from .queue import JobQueue, COMPLETED, FAILED
+from .runners import RUNNERS
+
+
+class JobWorker:
+    def __init__(self, queue, name=None, chunk_size=64):
+        self.queue = queue
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.chunk_size = chunk_size
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run_job(self, job):
+        """Score one claimed job from its checkpoint; returns the final status or None if interrupted."""
+        options = job['options']
+        runner = RUNNERS[job['kind']](**options.get('runner', {}))
+        chunk_size = int(options.get('chunk_size', self.chunk_size))
+        try:
+            if job['total'] is None:
+                self.queue.set_total(job['id'], runner.count(job['input_path']))
+
+            processed = job['processed']
+            failed_items = job['failed_items']
+            # Drop anything written after the last checkpoint by a previous attempt
+            mode = 'r+b' if os.path.exists(job['output_path']) else 'wb'
+            with open(job['output_path'], mode) as out:
+                out.truncate(job['output_bytes'])
+                out.seek(job['output_bytes'])
+                for chunk in runner.iter_chunks(job['input_path'], processed, chunk_size):
+                    results = runner.score(chunk)
+                    out.write(''.join(json.dumps(r) + '\n' for r in results).encode('utf-8'))
+                    out.flush()
+                    os.fsync(out.fileno())
+                    processed += len(chunk)
+                    failed_items += sum(1 for r in results if 'error' in r)
+                    if not self.queue.checkpoint(job['id'], self.name, processed, failed_items, out.tell()):
+                        return None  # cancelled, or reclaimed by another worker
+                    if self.stopping:
+                        self.queue.release(job['id'], self.name)
+                        return None
+        except Exception as e:
+            self.queue.finish(job['id'], self.name, FAILED, error=str(e))
+            return FAILED
+        self.queue.finish(job['id'], self.name, COMPLETED)
+        return COMPLETED
+
+    def run(self, poll_interval=1.0, once=False):
+        while not self.stopping:
+            job = self.queue.claim(self.name)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            print(f"[{self.name}] job {job['id']} ({job['kind']}) from item {job['processed']}")
+            status = self.run_job(job)
+            print(f"[{self.name}] job {job['id']} {status or 'interrupted'}")
+
+
+def start_worker_threads(queue, count, chunk_size=64, poll_interval=1.0):
+    """Run count JobWorkers as daemon threads in this process (e.g. inside a web worker)."""
+    workers = []
+    for i in range(count):
+        worker = JobWorker(queue, name=f'{socket.gethostname()}:{os.getpid()}:{i}', chunk_size=chunk_size)
+        threading.Thread(target=worker.run, args=(poll_interval,), name=f'job-worker-{i}', daemon=True).start()
+        workers.append(worker)
+    return workers
+
+
+def _worker_main(db_path, results_dir, chunk_size, poll_interval):
+    worker = JobWorker(JobQueue(db_path, results_dir), chunk_size=chunk_size)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(poll_interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run bulk scoring job workers')
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('JOBS_PROCESSES', 1)))
+    parser.add_argument('--db', default=os.environ.get('JOBS_DB', 'database/jobs.db'))
+    parser.add_argument('--results-dir', default=os.environ.get('JOBS_RESULTS_DIR', 'job_results'))
+    parser.add_argument('--chunk-size', type=int, default=64, help='Items per checkpoint (jobs may override)')
+    parser.add_argument('--poll', type=float, default=1.0, help='Seconds between queue polls when idle')
+    args = parser.parse_args()
+
+    # Keep one torch thread per process unless told otherwise
+    os.environ.setdefault('OMP_NUM_THREADS', os.environ.get('TORCH_THREADS', '1'))
+    processes = [multiprocessing.Process(target=_worker_main,
+                                         args=(args.db, args.results_dir, args.chunk_size, args.poll))
+                 for _ in range(args.processes)]
+    for p in processes:
+        p.start()
+    # Forward SIGTERM so every worker drains its current chunk
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes])
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.join()
@@ -0,0 +1,6 @@
+from .memory import process_memory, format_memory
+from .introspection import MemoryTracker, deep_sizeof
+from .profiler import RequestProfiler
+from . import metrics
+
+__all__ = ['process_memory', 'format_memory', 'MemoryTracker', 'deep_sizeof', 'RequestProfiler', 'metrics']
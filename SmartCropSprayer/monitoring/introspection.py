@@ -0,0 +1,202 @@
+"""Memory introspection for long-running workers.
+
+MemoryTracker periodically:
+  * takes a tracemalloc snapshot (when tracing is on) and diffs it against
+    the first snapshot and the previous one, so slow growth shows up as the
+    allocation sites whose size keeps increasing;
+  * measures registered components (models, caches, histories) with
+    deep_sizeof;
+  * compares RSS with an optional watermark and, once exceeded, asks the
+    worker to exit gracefully (SIGTERM). Under gunicorn the worker finishes
+    its in-flight requests and the master starts a fresh one.
+"""
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from .memory import process_memory
+
+# Allocations made by tracemalloc itself and the import system are noise
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj, counting shared objects once.
+
+    numpy arrays and torch tensors/modules are measured by their buffers;
+    memory-mapped arrays count their mapped size even if not resident.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    module = type(obj).__module__ or ''
+    if module.startswith('numpy') and hasattr(obj, 'nbytes'):
+        # Views share their base's buffer; count the buffer through the base
+        base = getattr(obj, 'base', None)
+        if base is not None and hasattr(base, 'nbytes'):
+            return sys.getsizeof(obj) + deep_sizeof(base, seen)
+        return sys.getsizeof(obj) + int(obj.nbytes)
+    if module.startswith('torch'):
+        if hasattr(obj, 'untyped_storage'):
+            storage = obj.untyped_storage()
+            if storage.data_ptr() in seen:
+                return sys.getsizeof(obj)
+            seen.add(storage.data_ptr())
+            return sys.getsizeof(obj) + storage.nbytes()
+        if hasattr(obj, 'parameters') and hasattr(obj, 'buffers'):
+            return sum(deep_sizeof(t, seen) for t in list(obj.parameters()) + list(obj.buffers()))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in list(obj))
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def _format_stat(stat):
+    frame = stat.traceback[0]
+    entry = {
+        'site': f"{frame.filename}:{frame.lineno}",
+        'size': stat.size,
+        'count': stat.count
+    }
+    if hasattr(stat, 'size_diff'):
+        entry['size_diff'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+class MemoryTracker:
+    def __init__(self, interval=300, trace=False, trace_frames=1, rss_limit=None, top=20, on_limit=None):
+        self.interval = interval
+        self.trace = trace
+        self.trace_frames = trace_frames
+        # Bytes; None disables the watermark
+        self.rss_limit = rss_limit
+        self.top = top
+        self.on_limit = on_limit or self._recycle
+        self._components = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._baseline = None
+        self._previous = None
+        self._latest = None
+        self._component_sizes = {}
+        self._samples = 0
+        self._limit_hit = False
+
+    def register(self, name, getter):
+        """Account for getter() under name; getter is called on every sample.
+
+        Objects reachable from several components are counted once, under the
+        component registered first.
+        """
+        self._components[name] = getter
+
+    def ensure_started(self):
+        """Start sampling in this process (safe to call on every request, and after fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Snapshots from the parent describe a different process
+            self._baseline = self._previous = self._latest = None
+            self._limit_hit = False
+            if self.trace and not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+            thread = threading.Thread(target=self._run, name='memory-tracker', daemon=True)
+            thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Memory sampling failed: {e}")
+            time.sleep(self.interval)
+
+    def sample(self):
+        """Take one sample now: snapshot, component sizes and watermark check."""
+        sizes = {}
+        seen = set()
+        for name, getter in list(self._components.items()):
+            try:
+                sizes[name] = deep_sizeof(getter(), seen)
+            except Exception:
+                sizes[name] = None
+        snapshot = None
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+        with self._lock:
+            self._component_sizes = sizes
+            self._samples += 1
+            if snapshot is not None:
+                if self._baseline is None:
+                    self._baseline = snapshot
+                self._previous = self._latest
+                self._latest = snapshot
+
+        rss = process_memory().get('rss')
+        if self.rss_limit and rss and rss > self.rss_limit and not self._limit_hit:
+            self._limit_hit = True
+            print(f"Worker {os.getpid()} RSS {rss / (1024 * 1024):.1f}MB exceeds "
+                  f"{self.rss_limit / (1024 * 1024):.1f}MB watermark; recycling")
+            self.on_limit()
+
+    @staticmethod
+    def _recycle():
+        # gunicorn workers treat SIGTERM as a graceful shutdown request
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def component_sizes(self):
+        with self._lock:
+            return dict(self._component_sizes)
+
+    def report(self, top=None, key_type='lineno'):
+        """Memory summary with the top allocation sites and their growth."""
+        top = top or self.top
+        with self._lock:
+            baseline, previous, latest = self._baseline, self._previous, self._latest
+            components = dict(self._component_sizes)
+            samples = self._samples
+
+        report = {
+            'pid': os.getpid(),
+            'process': process_memory(),
+            'rss_limit': self.rss_limit,
+            'components': components,
+            'samples': samples,
+            'gc_objects': len(gc.get_objects()),
+            'tracing': tracemalloc.is_tracing()
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report['traced'] = {'current': current, 'peak': peak}
+        if latest is not None:
+            report['top_allocations'] = [_format_stat(s) for s in latest.statistics(key_type)[:top]]
+            report['growth_since_start'] = [_format_stat(s) for s in latest.compare_to(baseline, key_type)[:top]]
+            if previous is not None:
+                report['growth_since_last_sample'] = [_format_stat(s)
+                                                      for s in latest.compare_to(previous, key_type)[:top]]
+        return report
@@ -0,0 +1,53 @@
+def _read_kb_fields(path, fields):
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in fields:
+                    values[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return values
+
+
+def process_memory():
+    """Return memory usage of the current process in bytes.
+
+    Keys: rss, peak_rss, and on Linux shared/private (pages shared with other
+    processes, e.g. copy-on-write model weights after fork, versus pages owned
+    by this process alone). Missing values are None.
+    """
+    status = _read_kb_fields('/proc/self/status', {'VmRSS', 'VmHWM'})
+    rollup = _read_kb_fields('/proc/self/smaps_rollup',
+                             {'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'})
+
+    usage = {
+        'rss': status.get('VmRSS'),
+        'peak_rss': status.get('VmHWM'),
+        'shared': None,
+        'private': None
+    }
+    if rollup:
+        usage['shared'] = rollup.get('Shared_Clean', 0) + rollup.get('Shared_Dirty', 0)
+        usage['private'] = rollup.get('Private_Clean', 0) + rollup.get('Private_Dirty', 0)
+
+    if usage['peak_rss'] is None:
+        try:
+            import resource
+            import sys
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is kilobytes on Linux, bytes on macOS
+            usage['peak_rss'] = peak if sys.platform == 'darwin' else peak * 1024
+        except (ImportError, OSError):
+            pass
+    return usage
+
+
+def format_memory(usage):
+    """One-line human readable summary of process_memory()."""
+    parts = []
+    for key in ('rss', 'peak_rss', 'shared', 'private'):
+        if usage.get(key) is not None:
+            parts.append(f"{key}={usage[key] / (1024 * 1024):.1f}MB")
+    return ' '.join(parts) or 'unavailable'
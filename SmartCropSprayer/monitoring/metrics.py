@@ -0,0 +1,262 @@
+"""Lightweight counters, gauges and histograms with Prometheus text export.
+
+Usage:
+    from monitoring import metrics
+
+    with metrics.stage('disease.forward'):
+        outputs = model(batch)
+
+When metrics are disabled (METRICS_ENABLED=0) stage() hands back one shared
+no-op context manager and the Flask hooks are never registered, so the
+instrumentation costs nothing.
+
+Each process keeps its own registry. Under gunicorn set METRICS_DIR to a
+shared directory: every worker periodically writes its snapshot there and
+/metrics merges all snapshots, so a scrape sees the whole server.
+"""
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Seconds; spans sub-millisecond history reads up to slow CPU inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {'values': [[list(key), value] for key, value in self._values.items()]}
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snap in snapshots:
+            for key, value in snap['values']:
+                merged[tuple(key)] = merged.get(tuple(key), 0) + value
+        return {'values': [[list(key), value] for key, value in merged.items()]}
+
+    def render(self, snap):
+        lines = []
+        for key, value in snap['values']:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Point-in-time value, either set directly or computed at scrape time."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        # callback() -> {label_tuple: value}; evaluated on every snapshot
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def snapshot(self):
+        if self.callback is not None:
+            try:
+                values = self.callback() or {}
+            except Exception:
+                values = {}
+            return {'values': [[list(key), value] for key, value in values.items() if value is not None]}
+        return super().snapshot()
+
+
+class Histogram:
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'series': [[list(key), list(counts), total, count]
+                               for key, (counts, total, count) in self._series.items()]}
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snap in snapshots:
+            for key, counts, total, count in snap['series']:
+                current = merged.setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+                current[2] += count
+        return {'series': [[list(key), counts, total, count] for key, (counts, total, count) in merged.items()]}
+
+    def render(self, snap):
+        lines = []
+        for key, counts, total, count in snap['series']:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, shared_dir=None, flush_interval=1.0):
+        self.enabled = enabled
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+        self.stage_seconds = self.histogram('scs_stage_seconds', 'Time spent in each request processing stage',
+                                            ['stage'])
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def stage(self, name):
+        """Context manager timing a block into scs_stage_seconds{stage=name}."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self.stage_seconds, name)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def flush(self, force=False):
+        """Write this process's snapshot to shared_dir (rate limited)."""
+        if not self.shared_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        os.makedirs(self.shared_dir, exist_ok=True)
+        path = os.path.join(self.shared_dir, f'{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        # Gauges describe this process only; they are not merged across workers
+        data = {name: snap for name, snap in self.snapshot().items()
+                if not isinstance(self._metrics[name], Gauge)}
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _collect(self):
+        local = self.snapshot()
+        if not self.shared_dir or not os.path.isdir(self.shared_dir):
+            return local
+        self.flush(force=True)
+        snapshots = {}
+        for filename in os.listdir(self.shared_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.shared_dir, filename)) as f:
+                    for name, snap in json.load(f).items():
+                        snapshots.setdefault(name, []).append(snap)
+            except (OSError, ValueError):
+                continue
+        merged = {}
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Gauge) or name not in snapshots:
+                merged[name] = local[name]
+            else:
+                merged[name] = type(metric).merge(snapshots[name])
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        collected = self._collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric.render(collected[name]))
+        return '\n'.join(lines) + '\n'
+
+
+class _StageTimer:
+    __slots__ = ('histogram', 'name', 'start')
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, stage=self.name)
+        return False
+
+
+registry = MetricsRegistry(
+    enabled=os.environ.get('METRICS_ENABLED', '1') != '0',
+    shared_dir=os.environ.get('METRICS_DIR')
+)
+stage = registry.stage
@@ -0,0 +1,161 @@
+"""Opt-in cProfile capture for live requests.
+
+A request is profiled when profiling is enabled and either a random draw
+falls under sample_rate or the request carries the trigger header. Each
+profile is saved as gzip-compressed pstats data under
+<directory>/<route>/<timestamp>_<request_id>.prof.gz. To inspect one:
+
+    gunzip -c profile.prof.gz > profile.prof && python -m pstats profile.prof
+
+Settings live in <directory>/control.json so a change made through the
+admin endpoint reaches every worker process without a restart.
+"""
+import cProfile
+import gzip
+import json
+import marshal
+import os
+import random
+import re
+import threading
+import time
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _slug(text):
+    return _SAFE_NAME.sub('_', text.strip('/')) or 'root'
+
+
+class RequestProfiler:
+    def __init__(self, directory='profiles', enabled=False, sample_rate=0.0, header='X-Profile',
+                 max_profiles=500, refresh_interval=1.0):
+        self.directory = directory
+        self.header = header
+        self.max_profiles = max_profiles
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self._control_path = os.path.join(directory, 'control.json')
+        self._control_mtime = None
+        self._last_refresh = 0.0
+        # Only one cProfile profiler may be active per process (Python 3.12+),
+        # so concurrent requests are not profiled while another one is
+        self._active = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+        try:
+            mtime = os.path.getmtime(self._control_path)
+        except OSError:
+            return
+        if mtime == self._control_mtime:
+            return
+        try:
+            with open(self._control_path) as f:
+                control = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._control_mtime = mtime
+        self.enabled = bool(control.get('enabled', self.enabled))
+        self.sample_rate = float(control.get('sample_rate', self.sample_rate))
+
+    def configure(self, enabled=None, sample_rate=None):
+        """Change settings for every worker sharing this directory."""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self._control_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'enabled': self.enabled, 'sample_rate': self.sample_rate}, f)
+        os.replace(tmp_path, self._control_path)
+        self._control_mtime = os.path.getmtime(self._control_path)
+        return self.status()
+
+    def status(self):
+        self._refresh()
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate, 'header': self.header}
+
+    def should_profile(self, triggered=False):
+        """triggered: the caller saw an authorised trigger header on the request."""
+        self._refresh()
+        if not self.enabled:
+            return False
+        return triggered or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        """Return an enabled cProfile.Profile, or None if another request holds the profiler."""
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is active in this process
+            self._active.release()
+            return None
+        return profile
+
+    def profile_id(self, route, request_id):
+        """Id (relative path) the profile of this request will be saved under."""
+        return f"{_slug(route)}/{time.strftime('%Y%m%d-%H%M%S')}_{_slug(request_id)}.prof.gz"
+
+    def stop(self, profile, profile_id):
+        """Disable the profile, release the profiler and write it to disk under profile_id."""
+        try:
+            profile.disable()
+        finally:
+            self._active.release()
+        profile.create_stats()
+
+        path = os.path.join(self.directory, profile_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, 'wb') as f:
+            f.write(marshal.dumps(profile.stats))
+        self._prune()
+        return profile_id
+
+    def list_profiles(self):
+        profiles = []
+        if not os.path.isdir(self.directory):
+            return profiles
+        for route in sorted(os.listdir(self.directory)):
+            route_dir = os.path.join(self.directory, route)
+            if not os.path.isdir(route_dir):
+                continue
+            for filename in os.listdir(route_dir):
+                if not filename.endswith('.prof.gz'):
+                    continue
+                path = os.path.join(route_dir, filename)
+                stat = os.stat(path)
+                profiles.append({
+                    'id': f'{route}/{filename}',
+                    'route': route,
+                    'request_id': filename[:-len('.prof.gz')].split('_', 1)[-1],
+                    'size': stat.st_size,
+                    'created': stat.st_mtime
+                })
+        profiles.sort(key=lambda p: p['created'], reverse=True)
+        return profiles
+
+    def path_for(self, profile_id):
+        """Absolute path for a profile id from list_profiles(), or None."""
+        route, _, filename = profile_id.partition('/')
+        if route.startswith('.') or route != _slug(route) or filename != _slug(filename) \
+                or not filename.endswith('.prof.gz'):
+            return None
+        path = os.path.join(self.directory, route, filename)
+        return os.path.abspath(path) if os.path.isfile(path) else None
+
+    def _prune(self):
+        profiles = self.list_profiles()
+        for stale in profiles[self.max_profiles:]:
+            try:
+                os.remove(self.path_for(stale['id']))
+            except (OSError, TypeError):
+                pass
@@ -0,0 +1,11 @@
+from .admission import AdmissionController, EndpointLimiter, Rejected, parse_limits, CloseConnection, CLOSE_CONNECTION
+from .scheduler import ModelScheduler, default_classes, INTERACTIVE, BULK
+from .reload import ModelReloader
+from .uploads import UploadRejected, spooled_request_class, inspect_image, decode_image
+from .http_cache import ConditionalGet, StaticFingerprints, compress, IMMUTABLE_MAX_AGE
+from . import json_stream
+
+__all__ = ['AdmissionController', 'EndpointLimiter', 'Rejected', 'parse_limits', 'CloseConnection', 'CLOSE_CONNECTION',
+           'ModelScheduler', 'default_classes', 'INTERACTIVE', 'BULK', 'ModelReloader',
+           'UploadRejected', 'spooled_request_class', 'inspect_image', 'decode_image', 'json_stream',
+           'ConditionalGet', 'StaticFingerprints', 'compress', 'IMMUTABLE_MAX_AGE']
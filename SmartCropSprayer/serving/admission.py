@@ -0,0 +1,201 @@
+"""Per-endpoint admission control.
+
+Each endpoint group gets a concurrency limit and a bounded wait queue:
+
+  * a free slot is taken immediately;
+  * otherwise the request waits in the queue for up to queue_timeout
+    seconds and is rejected with 503 if no slot frees up in time;
+  * if the queue is already full it is rejected at once with 429.
+
+Rejections carry a Retry-After estimate derived from the recent service
+time, so clients back off instead of piling on. A group can also enter
+degraded mode once its queue has stayed at degrade_queue or deeper for
+degrade_after seconds, and stays in it for degrade_hold seconds after the
+queue drains; the disease endpoint uses this to switch to rule-based
+detection until the backlog clears. A single shed does not degrade.
+"""
+import math
+import threading
+import time
+
+from monitoring import metrics
+
+shed_total = metrics.registry.counter(
+    'scs_admission_shed_total', 'Requests rejected by admission control', ['group', 'reason'])
+degraded_total = metrics.registry.counter(
+    'scs_admission_degraded_total', 'Requests served in degraded mode', ['group'])
+
+
+class Rejected(Exception):
+    """Request refused by admission control; maps to an HTTP error response."""
+
+    def __init__(self, group, status, reason, retry_after):
+        super().__init__(f"{group}: {reason}")
+        self.group = group
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    def __init__(self, name, max_concurrent, max_queue=0, queue_timeout=5.0, degrade_queue=None, degrade_after=1.0,
+                 degrade_hold=10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # Queue depth that switches the group to degraded mode (None = never)
+        self.degrade_queue = degrade_queue
+        # Seconds the queue must stay that deep before degrading
+        self.degrade_after = degrade_after
+        # Seconds degraded mode stays on after a sustained backlog drains
+        self.degrade_hold = degrade_hold
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'queue_timeout': 0}
+        self.degraded_requests = 0
+        self._service_time = None  # EWMA, seconds
+        self._deep_since = None     # queue at degrade_queue or deeper since (monotonic)
+        self._overloaded_at = None  # a sustained backlog last drained at (monotonic)
+        self._cond = threading.Condition()
+
+    def _retry_after(self):
+        # Time for the requests ahead to drain, rounded up to whole seconds
+        service = self._service_time or 1.0
+        return max(1, math.ceil((self.queued + 1) * service / max(1, self.max_concurrent)))
+
+    def _reject(self, status, reason):
+        self.shed[reason] += 1
+        shed_total.inc(group=self.name, reason=reason)
+        return Rejected(self.name, status, reason, self._retry_after())
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if needed; raises Rejected. Returns the start time."""
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.queued >= self.max_queue:
+                    raise self._reject(429, 'queue_full')
+                self.queued += 1
+                if self.degrade_queue is not None and self.queued >= self.degrade_queue and self._deep_since is None:
+                    self._deep_since = time.monotonic()
+                try:
+                    deadline = time.monotonic() + self.queue_timeout
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject(503, 'queue_timeout')
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+                    self._check_drained()
+            self.in_flight += 1
+            self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started):
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self.in_flight -= 1
+            self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+            self._cond.notify()
+
+    def _sustained(self, now):
+        return self._deep_since is not None and now - self._deep_since >= self.degrade_after
+
+    def _check_drained(self):
+        # Called with self._cond held, after the queue shrank
+        if self._deep_since is None or self.queued >= self.degrade_queue:
+            return
+        now = time.monotonic()
+        if self._sustained(now):
+            self._overloaded_at = now
+        self._deep_since = None
+
+    @property
+    def degraded(self):
+        if self.degrade_queue is None:
+            return False
+        now = time.monotonic()
+        if self._sustained(now):
+            return True
+        return self._overloaded_at is not None and now - self._overloaded_at < self.degrade_hold
+
+    def mark_degraded(self):
+        """Count a request that was served in degraded mode."""
+        self.degraded_requests += 1
+        degraded_total.inc(group=self.name)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+                'degraded': self.degraded,
+                'degraded_requests': self.degraded_requests,
+                'service_time': self._service_time
+            }
+
+
+class AdmissionController:
+    """Maps Flask endpoint names to EndpointLimiter groups."""
+
+    def __init__(self):
+        self.groups = {}
+        self._endpoints = {}
+
+    def add_group(self, name, endpoints, max_concurrent, max_queue=0, **options):
+        limiter = EndpointLimiter(name, max_concurrent, max_queue, **options)
+        self.groups[name] = limiter
+        for endpoint in endpoints:
+            self._endpoints[endpoint] = limiter
+        return limiter
+
+    def limiter_for(self, endpoint):
+        return self._endpoints.get(endpoint)
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.groups.items()}
+
+
+# Set to True in the WSGI environ to end the keep-alive connection after this response
+CLOSE_CONNECTION = 'scs.close_connection'
+
+
+class CloseConnection:
+    """WSGI middleware that closes the connection when the app sets environ[CLOSE_CONNECTION].
+
+    Used for shed uploads whose body is not read: the client must be told
+    (Connection: close) instead of the server dropping the socket under a
+    keep-alive response. gunicorn strips hop-by-hop headers set by the app,
+    so its response object is told directly through start_response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        def start(status, headers, exc_info=None):
+            if environ.get(CLOSE_CONNECTION):
+                headers = [(name, value) for name, value in headers if name.lower() != 'connection']
+                headers.append(('Connection', 'close'))
+                server_response = getattr(start_response, '__self__', None)
+                if hasattr(server_response, 'force_close'):
+                    server_response.force_close()
+            return start_response(status, headers, exc_info)
+
+        return self.app(environ, start)
+
+
+def parse_limits(spec):
+    """'disease=2:4,crop=8:16' -> {'disease': (2, 4), 'crop': (8, 16)} (concurrency:queue)."""
+    limits = {}
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, value = part.partition('=')
+        concurrency, _, queue = value.partition(':')
+        limits[name.strip()] = (int(concurrency), int(queue or 0))
+    return limits
@@ -0,0 +1,175 @@
+"""Conditional GET, response compression and fingerprinted static URLs.
+
+ConditionalGet maps endpoints to a function returning the parts their
+response depends on (table write versions, the query string, ...). The
+parts are hashed into a weak ETag before the view runs; when the client's
+If-None-Match matches, the request is answered 304 with no view call and
+no database access.
+
+compress() gzips (or, with the optional brotli package, br-encodes) JSON
+and CSV bodies of at least min_bytes, including streamed bodies: the first
+chunks are read ahead to decide, then the rest is compressed as it is sent.
+
+StaticFingerprints gives each static file a content hash, used as
+?v=<hash> in url_for('static', ...) so those URLs can be cached for a year.
+"""
+import hashlib
+import itertools
+import os
+import zlib
+
+from flask import Response
+
+from monitoring import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+conditional_total = metrics.registry.counter(
+    'scs_http_conditional_total', 'Conditional GETs by endpoint and result (not_modified or full)',
+    ['endpoint', 'result'])
+compressed_total = metrics.registry.counter(
+    'scs_http_compressed_total', 'Responses compressed, by content encoding', ['encoding'])
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def etag_of(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+class ConditionalGet:
+    def __init__(self):
+        self.endpoints = {}
+
+    def add(self, endpoint, parts):
+        """parts() returns what the endpoint's response depends on (must be cheap)."""
+        self.endpoints[endpoint] = parts
+
+    def check(self, request):
+        """(etag, 304 response or None) for a GET to a registered endpoint, else (None, None)."""
+        parts = self.endpoints.get(request.endpoint)
+        if parts is None or request.method not in ('GET', 'HEAD'):
+            return None, None
+        etag = etag_of(request.endpoint, request.query_string, parts())
+        if request.if_none_match.contains_weak(etag):
+            conditional_total.inc(endpoint=request.endpoint, result='not_modified')
+            response = Response(status=304)
+            self.tag(response, etag)
+            return etag, response
+        conditional_total.inc(endpoint=request.endpoint, result='full')
+        return etag, None
+
+    @staticmethod
+    def tag(response, etag):
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            # Cacheable, but revalidated with If-None-Match on every use
+            response.cache_control.no_cache = True
+        return response
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, level):
+    compressor = brotli.Compressor(quality=level)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+ENCODERS = {'gzip': _gzip_stream}
+LEVELS = {'gzip': 6, 'br': 5}
+if brotli is not None:
+    ENCODERS['br'] = _brotli_stream
+
+
+def _encoded(stream, encoding, level, close):
+    try:
+        yield from ENCODERS[encoding](stream, level)
+    finally:
+        close()
+
+
+def compress(response, accept_encodings, min_bytes=1024, levels=None):
+    """Compress a JSON/CSV response in place when the client accepts it and it is large enough."""
+    if (response.mimetype not in COMPRESSIBLE_TYPES or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    # Prefer br over gzip when both are accepted with the same quality
+    encoding = accept_encodings.best_match([name for name in ('br', 'gzip') if name in ENCODERS])
+    if encoding is None:
+        return response
+    level = (levels or LEVELS)[encoding]
+
+    if response.is_streamed:
+        original = response.response
+        chunks = response.iter_encoded()
+        head, size = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= min_bytes:
+                break
+        else:
+            # The whole body was read and is below the threshold: send it as is
+            response.set_data(b''.join(head))
+            return response
+        response.response = _encoded(itertools.chain(head, chunks), encoding, level,
+                                     getattr(original, 'close', lambda: None))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(b''.join(ENCODERS[encoding]([data], level)))
+    response.headers['Content-Encoding'] = encoding
+    compressed_total.inc(encoding=encoding)
+    return response
+
+
+class StaticFingerprints:
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._cache = {}
+
+    def fingerprint(self, filename):
+        """Short content hash of a static file (None if it does not exist)."""
+        path = os.path.join(self.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(filename)
+        if cached is None or cached[0] != key:
+            with open(path, 'rb') as f:
+                cached = (key, hashlib.sha256(f.read()).hexdigest()[:12])
+            self._cache[filename] = cached
+        return cached[1]
+
+    def site_fingerprint(self, *folders):
+        """One hash over every file in folders (templates, static), for pages rendered from them."""
+        digest = hashlib.sha256()
+        for folder in folders:
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, folder).encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+        return digest.hexdigest()[:12]
@@ -0,0 +1,42 @@
+"""JSON bodies for row dumps, written straight from a database cursor.
+
+records() streams {"data": [{...}, ...], "success": true} batch by batch,
+byte for byte what jsonify() produces for the same rows in compact mode
+(sorted keys, ASCII escapes, "," and ":" separators, trailing newline), so
+at most one batch of rows is in memory. Columns must already be in sorted
+order and values already JSON types.
+
+columns() is the columnar layout, {"columns": [...], "data": {name:
+[values]}, "success": true}: key names are sent once instead of per row.
+"""
+import json
+
+ENCODER = json.JSONEncoder(ensure_ascii=True, separators=(',', ':'))
+
+
+def records(columns, batches):
+    """Yield the records body (bytes) for batches of row tuples."""
+    yield b'{"data":['
+    first = True
+    for rows in batches:
+        if not rows:
+            continue
+        chunk = ENCODER.encode([dict(zip(columns, row)) for row in rows])[1:-1]
+        yield (chunk if first else ',' + chunk).encode('ascii')
+        first = False
+    yield b'],"success":true}\n'
+
+
+def columns(names, batches):
+    """Yield the columnar body (bytes) for batches of row tuples."""
+    values = [[] for _ in names]
+    for rows in batches:
+        for column, cells in zip(values, zip(*rows)):
+            column.extend(cells)
+    data = ENCODER.encode(dict(zip(names, values)))
+    yield f'{{"columns":{ENCODER.encode(names)},"data":{data},"success":true}}\n'.encode('ascii')
+
+
+def compact(app):
+    """True when jsonify() would emit compact JSON, i.e. records() matches it."""
+    return not (app.json.compact is False or (app.json.compact is None and app.debug))
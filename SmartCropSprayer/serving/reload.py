@@ -0,0 +1,109 @@
+"""Hot reload of model artifacts without restarting workers.
+
+ModelReloader owns a set of targets (DiseaseDetector, CropPredictor):
+objects with artifact_paths(), reload() and model_version. reload(name)
+runs target.reload() on a background thread; the target loads the new
+artifact next to the old one, validates it against its smoke set and
+swaps a single model reference. Requests already running keep the model
+object they read at the start, so they finish on the old version.
+
+With watch_interval > 0 a watcher thread polls the artifacts' mtime/size
+and reloads a target once its files changed and then stayed unchanged for
+one more poll (so half-written files are not picked up). Every worker
+process runs its own watcher; this is what reaches all gunicorn workers,
+an admin request only reaches the worker that served it.
+
+Replace artifacts atomically (write a temp file, then os.replace): the
+disease weights are memory-mapped, and rewriting that file in place
+changes the pages under the running model.
+"""
+import os
+import threading
+import time
+
+from monitoring import metrics
+
+reloads_total = metrics.registry.counter(
+    'scs_model_reloads_total', 'Model reload attempts by result', ['model', 'result'])
+
+
+class ModelReloader:
+    def __init__(self, targets, watch_interval=0):
+        self.targets = dict(targets)
+        self.watch_interval = watch_interval
+        self._locks = {name: threading.Lock() for name in self.targets}
+        self._status = {name: {'state': 'idle'} for name in self.targets}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _signature(self, name):
+        signature = []
+        for path in self.targets[name].artifact_paths():
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def reload(self, name, wait=False):
+        """Start reloading target name; returns False if a reload is already running."""
+        if name not in self.targets:
+            raise KeyError(name)
+        if not self._locks[name].acquire(blocking=False):
+            return False
+        self._status[name] = dict(self._status[name], state='reloading', started_at=time.time())
+        thread = threading.Thread(target=self._run, args=(name,), name=f'model-reload-{name}', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _run(self, name):
+        target = self.targets[name]
+        previous = target.model_version
+        start = time.perf_counter()
+        try:
+            result = target.reload()
+        except Exception as e:
+            print(f"Model reload for {name} failed, keeping version {previous}: {e}")
+            status = {'state': 'failed', 'error': str(e), 'version': previous}
+            reloads_total.inc(model=name, result='failed')
+        else:
+            print(f"Model reload for {name}: {previous} -> {result['version']}")
+            status = dict(result, state='ok', previous_version=previous)
+            reloads_total.inc(model=name, result='ok')
+        status.update(finished_at=time.time(), seconds=round(time.perf_counter() - start, 3))
+        self._status[name] = status
+        self._locks[name].release()
+
+    def ensure_started(self):
+        """Start the watcher once per process (call after fork)."""
+        if self.watch_interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+
+    def _watch(self):
+        seen = {name: self._signature(name) for name in self.targets}
+        pending = {}
+        while True:
+            time.sleep(self.watch_interval)
+            for name in self.targets:
+                signature = self._signature(name)
+                if signature == seen[name]:
+                    pending.pop(name, None)
+                elif pending.get(name) != signature:
+                    pending[name] = signature  # changed; wait one poll for it to settle
+                elif self.reload(name, wait=True):
+                    seen[name] = signature
+                    pending.pop(name)
+
+    def status(self):
+        return {
+            name: dict(self._status[name], version=target.model_version)
+            for name, target in self.targets.items()
+        }
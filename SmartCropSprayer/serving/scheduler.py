@@ -0,0 +1,158 @@
+"""Priority scheduler for shared model instances.
+
+Interactive API requests and in-process bulk jobs call the same
+DiseaseDetector / CropPredictor. Every call goes through
+ModelScheduler.slot(class_name), which limits how many calls run at once
+and decides who goes next when a slot frees up:
+
+  * classes share slots by weighted fair queueing: under contention each
+    class gets slots in proportion to its weight, and no class starves;
+  * a class with an SLO target jumps the queue once its oldest waiter has
+    used up slo_headroom of its latency budget (earliest deadline first);
+  * max_slots caps a class (bulk by default leaves one slot free whenever
+    there is more than one, so an interactive call never waits for a
+    whole batch).
+
+Queue time per class is exported as scs_scheduler_queue_seconds and SLO
+misses as scs_scheduler_slo_miss_total.
+"""
+import contextlib
+import threading
+import time
+from collections import deque
+
+from monitoring import metrics
+
+queue_seconds = metrics.registry.histogram(
+    'scs_scheduler_queue_seconds', 'Time spent waiting for a model slot', ['model', 'class'])
+slo_miss_total = metrics.registry.counter(
+    'scs_scheduler_slo_miss_total', 'Scheduled calls whose queue + run time exceeded the class SLO',
+    ['model', 'class'])
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+def default_classes(slots):
+    return {
+        INTERACTIVE: {'weight': 10, 'slo': 0.5},
+        BULK: {'weight': 1, 'slo': None, 'max_slots': max(1, slots - 1)}
+    }
+
+
+class _Ticket:
+    __slots__ = ('class_name', 'enqueued', 'granted')
+
+    def __init__(self, class_name):
+        self.class_name = class_name
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class ModelScheduler:
+    def __init__(self, name, slots=1, classes=None, slo_headroom=0.5):
+        self.name = name
+        self.slots = slots
+        # Fraction of an SLO a waiter may spend queued before it is served first
+        self.slo_headroom = slo_headroom
+        self.classes = classes or default_classes(slots)
+        # Earlier entries win ties, so list the most latency-sensitive class first
+        self._order = list(self.classes)
+        self._queues = {name: deque() for name in self.classes}
+        self._running = {name: 0 for name in self.classes}
+        self._vtime = {name: 0.0 for name in self.classes}
+        self._served = {name: 0 for name in self.classes}
+        self._slo_misses = {name: 0 for name in self.classes}
+        self._free = slots
+        self._cond = threading.Condition()
+
+    def _eligible(self, class_name):
+        limit = self.classes[class_name].get('max_slots')
+        return self._queues[class_name] and (limit is None or self._running[class_name] < limit)
+
+    def _pick(self):
+        candidates = [c for c in self._order if self._eligible(c)]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        urgent = []
+        for c in candidates:
+            slo = self.classes[c].get('slo')
+            if slo is not None:
+                deadline = self._queues[c][0].enqueued + slo
+                if now >= deadline - slo * (1 - self.slo_headroom):
+                    urgent.append((deadline, c))
+        if urgent:
+            return min(urgent)[1]
+        return min(candidates, key=lambda c: (self._vtime[c], self._order.index(c)))
+
+    def _dispatch(self):
+        granted = False
+        while self._free > 0:
+            class_name = self._pick()
+            if class_name is None:
+                break
+            ticket = self._queues[class_name].popleft()
+            ticket.granted = True
+            self._free -= 1
+            self._running[class_name] += 1
+            self._vtime[class_name] += 1.0 / self.classes[class_name].get('weight', 1)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, class_name):
+        """Block until class_name gets a slot; returns seconds spent queued."""
+        ticket = _Ticket(class_name)
+        with self._cond:
+            if not self._queues[class_name] and self._running[class_name] == 0:
+                # A class returning from idle must not cash in credit it built up
+                # while away; start it level with the busiest active class
+                active = [self._vtime[c] for c in self._order
+                          if c != class_name and (self._queues[c] or self._running[c])]
+                if active:
+                    self._vtime[class_name] = max(self._vtime[class_name], min(active))
+            self._queues[class_name].append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                # Re-check periodically so SLO urgency is noticed without a release
+                self._cond.wait(0.05)
+                if not ticket.granted:
+                    self._dispatch()
+        waited = time.monotonic() - ticket.enqueued
+        queue_seconds.observe(waited, model=self.name, **{'class': class_name})
+        return waited
+
+    def release(self, class_name, total_seconds=None):
+        with self._cond:
+            self._running[class_name] -= 1
+            self._served[class_name] += 1
+            self._free += 1
+            slo = self.classes[class_name].get('slo')
+            if slo is not None and total_seconds is not None and total_seconds > slo:
+                self._slo_misses[class_name] += 1
+                slo_miss_total.inc(model=self.name, **{'class': class_name})
+            self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, class_name=INTERACTIVE):
+        start = time.monotonic()
+        self.acquire(class_name)
+        try:
+            yield
+        finally:
+            self.release(class_name, time.monotonic() - start)
+
+    def stats(self):
+        with self._cond:
+            return {
+                c: {
+                    'queued': len(self._queues[c]),
+                    'running': self._running[c],
+                    'served': self._served[c],
+                    'slo_misses': self._slo_misses[c],
+                    'weight': self.classes[c].get('weight', 1),
+                    'slo': self.classes[c].get('slo')
+                }
+                for c in self._order
+            }
@@ -0,0 +1,75 @@
+"""Bounded-memory image upload ingestion.
+
+Uploads are never read into a bytes object. The multipart parser writes
+each file part to a SpooledTemporaryFile that moves to disk once it passes
+spool_bytes, and PIL reads from that file directly:
+
+  1. inspect_image() parses only the header: the format must be one of the
+     allowed ones and the declared width x height within max_pixels and
+     max_side, so a small file claiming huge dimensions is refused before
+     any pixel buffer is allocated;
+  2. decode_image() then decodes the pixels.
+
+Rejections raise UploadRejected (415 unsupported format, 413 too large,
+400 corrupt) and are counted in scs_upload_rejected_total{reason}.
+"""
+import tempfile
+
+from flask import Request
+from PIL import Image, UnidentifiedImageError
+
+from monitoring import metrics
+
+rejected_total = metrics.registry.counter(
+    'scs_upload_rejected_total', 'Image uploads refused during ingestion', ['reason'])
+
+IMAGE_FORMATS = ('PNG', 'JPEG', 'GIF')
+
+
+class UploadRejected(Exception):
+    """Upload refused by ingestion; maps to an HTTP error response."""
+
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        rejected_total.inc(reason=reason)
+
+
+def spooled_request_class(spool_bytes=256 * 1024, spool_dir=None):
+    """Flask Request class whose file uploads spill to spool_dir beyond spool_bytes."""
+
+    class SpooledRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode='rb+', dir=spool_dir)
+
+    return SpooledRequest
+
+
+def inspect_image(stream, max_pixels, max_side=None, formats=IMAGE_FORMATS):
+    """Open stream lazily (header only) and check format and dimensions."""
+    stream.seek(0)
+    try:
+        image = Image.open(stream, formats=formats)
+    except Image.DecompressionBombError as e:
+        raise UploadRejected(413, 'too_many_pixels', str(e))
+    except (UnidentifiedImageError, SyntaxError, ValueError):
+        raise UploadRejected(415, 'unsupported_format',
+                             f"Not a valid {'/'.join(formats)} image")
+    width, height = image.size
+    if width <= 0 or height <= 0:
+        raise UploadRejected(400, 'corrupt', 'Image has no pixels')
+    if width * height > max_pixels or (max_side and max(width, height) > max_side):
+        raise UploadRejected(413, 'too_many_pixels',
+                             f"Image is {width}x{height}; the limit is {max_pixels / 1e6:g} megapixels"
+                             + (f" and {max_side} px per side" if max_side else ''))
+    return image
+
+
+def decode_image(image):
+    """Decode the pixels of an image returned by inspect_image()."""
+    try:
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise UploadRejected(400, 'corrupt', f"Could not decode image: {e}")
+    return image
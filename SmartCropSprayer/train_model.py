@@ -1,42 +1,61 @@
 import pandas as pd
 import pickle
+import sys
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 import os
+from crop_prediction.forest_format import export_forest
 
 os.makedirs('models', exist_ok=True)
 
-print("Loading crop recommendation dataset...")
-df = pd.read_csv('data/crop_recommendation.csv')
-
-print(f"Dataset shape: {df.shape}")
-print(f"Crop classes: {sorted(df['label'].unique())}")
-
-# Extract features exactly as in Tkinter version
-features = df[['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']]
-target = df['label']
-
-# Split exactly as in Tkinter version
-X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=2)
-
-print("\nTraining RandomForest model...")
-# Use exact same parameters as Tkinter version
-RF = RandomForestClassifier(n_estimators=20, random_state=0)
-RF.fit(X_train, y_train)
-
-y_pred = RF.predict(X_test)
-accuracy = accuracy_score(y_test, y_pred)
-
-print(f"\nModel trained successfully!")
-print(f"Training samples: {len(X_train)}")
-print(f"Test samples: {len(X_test)}")
-print(f"RF's Accuracy is: {accuracy * 100:.2f}%")
-
-# Save model
 model_path = 'models/RandomForest.pkl'
-with open(model_path, 'wb') as f:
-    pickle.dump(RF, f)
-
-print(f"\nModel saved to {model_path}")
+forest_path = 'models/RandomForest.forest'
+scaler_path = 'models/crop_scaler.pkl'
+
+if '--export-only' in sys.argv:
+    # Convert the existing pickle to the flat format without retraining
+    with open(model_path, 'rb') as f:
+        RF = pickle.load(f)
+    print(f"Loaded existing model from {model_path}")
+else:
+    print("Loading crop recommendation dataset...")
+    df = pd.read_csv('data/crop_recommendation.csv')
+
+    print(f"Dataset shape: {df.shape}")
+    print(f"Crop classes: {sorted(df['label'].unique())}")
+
+    # Extract features exactly as in Tkinter version
+    features = df[['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']]
+    target = df['label']
+
+    # Split exactly as in Tkinter version
+    X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=2)
+
+    print("\nTraining RandomForest model...")
+    # Use exact same parameters as Tkinter version
+    RF = RandomForestClassifier(n_estimators=20, random_state=0)
+    RF.fit(X_train, y_train)
+
+    y_pred = RF.predict(X_test)
+    accuracy = accuracy_score(y_test, y_pred)
+
+    print(f"\nModel trained successfully!")
+    print(f"Training samples: {len(X_train)}")
+    print(f"Test samples: {len(X_test)}")
+    print(f"RF's Accuracy is: {accuracy * 100:.2f}%")
+
+    # Save model
+    with open(model_path, 'wb') as f:
+        pickle.dump(RF, f)
+
+    print(f"\nModel saved to {model_path}")
+
+# Export flat, memory-mappable copy (loaded by CropPredictor without unpickling)
+scaler = None
+if os.path.exists(scaler_path):
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+export_forest(RF, forest_path, scaler=scaler, source_path=model_path)
+print(f"Flat forest exported to {forest_path}")
 print("Model training complete!")
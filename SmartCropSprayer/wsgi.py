@@ -0,0 +1,29 @@
+"""Production entry point.
+
+Linux/macOS (forking, preloaded models - see gunicorn.conf.py):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Windows (single process, threaded):
+    python wsgi.py
+
+The Werkzeug server started by "python app.py" is for development only.
+"""
+import os
+
+# Importing app builds DiseaseDetector, CropPredictor and the chatbot once.
+# Under gunicorn with preload_app this happens in the master before forking,
+# so every worker shares the loaded models copy-on-write.
+from app import app
+
+application = app
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    host = os.environ.get('WEB_HOST', '127.0.0.1')
+    port = int(os.environ.get('WEB_PORT', 5000))
+    print(f"Serving SmartCropSprayer on http://{host}:{port} (waitress)")
+    serve(app, host=host, port=port,
+          threads=int(os.environ.get('WEB_THREADS', 8)),
+          channel_timeout=int(os.environ.get('WEB_KEEPALIVE', 5)) * 12,
+          connection_limit=int(os.environ.get('WEB_CONNECTION_LIMIT', 200)))